@@ -1,27 +1,75 @@
 from __future__ import annotations
-from typing import Any, List, Optional, Dict
+from typing import Any, AsyncIterator, List, Literal, Optional, Dict
 from pathlib import Path
-import shutil
-import shutil
+import hashlib
+import json
 import uuid
+from typing import BinaryIO
 
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
 from pydantic import BaseModel, Field
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
+from app.core.ingest_jobs import IngestJobQueue
 from app.core.rag_pipeline import RAGPipeline
+from app.utils.indexing import SearchFilter
+from app.utils.metrics import METRICS
 
 router = APIRouter()
 RAG_INSTANCE: RAGPipeline | None = None
+JOB_QUEUE: IngestJobQueue | None = None
 
+# uploads are streamed to disk (and hashed) in blocks of this size
+UPLOAD_BLOCK_SIZE = 1 << 20
+
+
+class SearchFilterIn(BaseModel):
+    """
+    Optional restriction of the retrieval to documents, a page range and block types.
+    """
+    document_ids: Optional[List[str]] = None
+    page_from: Optional[int] = Field(default=None, ge=0)
+    page_to: Optional[int] = Field(default=None, ge=0)
+    block_types: Optional[List[Literal["text", "figure_description"]]] = None
+
+    def to_filter(self) -> Optional[SearchFilter]:
+        return SearchFilter.create(
+            document_ids=self.document_ids,
+            page_from=self.page_from,
+            page_to=self.page_to,
+            block_types=self.block_types,
+        )
 
 class QueryRequest(BaseModel):
     """
     The request body for a RAG query.
     """
     question: str
+    filters: Optional[SearchFilterIn] = None
     # settings: Optional[Dict[str, Any]] = None
 
+class RetrieveRequest(BaseModel):
+    """
+    The request body for a retrieval-only query (no LLM generation).
+    """
+    question: str
+    top_k: Optional[int] = Field(default=None, ge=1, le=100)
+    # "hybrid" or "dense" (None = pipeline setting)
+    retrieval_mode: Optional[str] = Field(default=None, pattern="^(hybrid|dense)$")
+    filters: Optional[SearchFilterIn] = None
+
+class BatchSearchRequest(BaseModel):
+    """
+    The request body for a batched retrieval (no LLM generation).
+    """
+    queries: List[str] = Field(min_length=1, max_length=256)
+    top_k: Optional[int] = Field(default=None, ge=1, le=100)
+    # "hybrid" or "dense" (None = pipeline setting)
+    retrieval_mode: Optional[str] = Field(default=None, pattern="^(hybrid|dense)$")
+    # applied to all queries
+    filters: Optional[SearchFilterIn] = None
+
 class RagSettingsIn(BaseModel):
     """
     The request body for updating RAG settings.
@@ -32,6 +80,16 @@ class RagSettingsIn(BaseModel):
     chunk_overlap: int = Field(default=20, ge=0, le=1000)
     temperature: float = Field(default=0.2, ge=0.0, le=2.0)
     max_tokens: int = Field(default=2048, ge=16, le=10000)
+    # ANN search tuning (None = keep current value)
+    nprobe: Optional[int] = Field(default=None, ge=1, le=65536)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=4096)
+    # retrieval: "hybrid" (BM25 + dense) or "dense"; fusion "rrf" or "weighted" (None = keep current)
+    retrieval_mode: Optional[str] = Field(default=None, pattern="^(hybrid|dense)$")
+    fusion: Optional[str] = Field(default=None, pattern="^(rrf|weighted)$")
+    # token budget of the retrieved context in the prompt (None = keep current)
+    context_budget: Optional[int] = Field(default=None, ge=256, le=131072)
+    # cross-encoder reranking on/off (only if a reranker is configured, None = keep current)
+    rerank: Optional[bool] = None
 
 
 def _require_rag() -> RAGPipeline:
@@ -42,13 +100,90 @@ def _require_rag() -> RAGPipeline:
         raise HTTPException(status_code=503, detail="RAG pipeline not initialized yet.")
     return RAG_INSTANCE
 
+def _require_jobs() -> IngestJobQueue:
+    """
+    Helper to get the ingest job queue or raise an error if it's not ready.
+    """
+    if JOB_QUEUE is None:
+        raise HTTPException(status_code=503, detail="Ingest job queue not initialized yet.")
+    return JOB_QUEUE
+
+def _search_filter(filters: Optional[SearchFilterIn]) -> Optional[SearchFilter]:
+    """
+    Helper to convert the optional request filter.
+    """
+    return filters.to_filter() if filters is not None else None
+
+def _sse(event: str, data: Any) -> str:
+    """
+    Formats one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/query")
-def rag_query(req: QueryRequest):
+async def rag_query(req: QueryRequest):
     """
     Endpoint to handle RAG queries. Expects a JSON body with a "question" field.
     """
     rag = _require_rag()
-    return rag.answer(req.question)
+    return await rag.aanswer(req.question, _search_filter(req.filters))
+
+@router.post("/query/stream")
+async def rag_query_stream(req: QueryRequest):
+    """
+    Streaming variant of /query as Server-Sent Events:
+    a "sources" event right after retrieval, then "token" events as the LLM generates,
+    and a final "done" (or "error") event.
+    """
+    rag = _require_rag()
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event in rag.astream_answer(req.question, _search_filter(req.filters)):
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/retrieve")
+def rag_retrieve(req: RetrieveRequest):
+    """
+    Endpoint to retrieve the ranked chunks for a question without generating an answer
+    (search UI, evaluation). Same retrieval and small2big expansion as /query.
+    """
+    rag = _require_rag()
+    return {
+        "question": req.question,
+        "hits": rag.retrieve(
+            req.question,
+            top_k=req.top_k,
+            retrieval_mode=req.retrieval_mode,
+            search_filter=_search_filter(req.filters),
+        ),
+    }
+
+@router.post("/search/batch")
+def search_batch(req: BatchSearchRequest):
+    """
+    Endpoint to retrieve the top chunks for many queries in one call
+    (e.g. evaluation runs or query expansion). All queries are embedded in one batch
+    and searched with one matrix search; no answer is generated.
+    """
+    rag = _require_rag()
+    batch = rag.search_batch(
+        req.queries,
+        top_k=req.top_k,
+        retrieval_mode=req.retrieval_mode,
+        search_filter=_search_filter(req.filters),
+    )
+    return {
+        "results": [{"query": q, "hits": hits} for q, hits in zip(req.queries, batch)],
+    }
 
 @router.get("/documents/{document_id}")
 def get_document(document_id: str):
@@ -74,11 +209,63 @@ def get_document(document_id: str):
         filename=document_id,
     )
 
+@router.delete("/documents/{document_id}")
+def delete_document(document_id: str):
+    """
+    Endpoint to remove a document from the index (and its stored PDF).
+
+    :param document_id: The ID of the document to delete.
+    :type document_id: str
+    """
+    rag = _require_rag()
+
+    removed = rag.delete_document(document_id)
+    if removed == 0:
+        raise HTTPException(status_code=404, detail=f"Document not found: {document_id}")
+
+    project_root = Path(__file__).resolve().parents[3]
+    file_path = project_root / "data" / "raw" / Path(document_id).name
+    file_path.unlink(missing_ok=True)
+
+    return {
+        "ok": True,
+        "document_id": document_id,
+        "removed_chunks": removed,
+        "total_chunks_in_store": len(rag.store.chunks),
+    }
+
+
+def _write_block(out: BinaryIO, digest: "hashlib._Hash", block: bytes) -> None:
+    # hashlib and file writes release the GIL, so this runs well in the threadpool
+    digest.update(block)
+    out.write(block)
+
+async def _save_upload(upload: UploadFile, out_path: Path) -> str:
+    """
+    Streams an upload to `out_path` in UPLOAD_BLOCK_SIZE blocks, without blocking the event loop,
+    and returns the SHA-256 of its content (computed on the fly, no second read).
+    The file is written under a temporary name and renamed when complete.
+    """
+    digest = hashlib.sha256()
+    part_path = out_path.with_name(out_path.name + ".part")
+    out = await run_in_threadpool(part_path.open, "wb")
+    try:
+        while block := await upload.read(UPLOAD_BLOCK_SIZE):
+            await run_in_threadpool(_write_block, out, digest, block)
+    except BaseException:
+        out.close()
+        part_path.unlink(missing_ok=True)
+        raise
+    await run_in_threadpool(out.close)
+    part_path.replace(out_path)
+    return digest.hexdigest()
 
 @router.post("/upload")
-def upload_pdfs(files: List[UploadFile]= File(...),process_images: bool = Form(True)):
+async def upload_pdfs(files: List[UploadFile]= File(...),process_images: bool = Form(True)):
     """
     Endpoint to upload one or more PDF files. Expects multipart/form-data with file uploads.
+    The files are streamed to disk and queued for background ingestion; poll /rag/jobs/{job_id} for progress.
+    Files whose content is already indexed (or queued) are skipped and reported in "skipped_duplicates".
     
     :param files: A list of PDF files to upload.
     :type files: List[UploadFile]
@@ -86,55 +273,102 @@ def upload_pdfs(files: List[UploadFile]= File(...),process_images: bool = Form(T
     :type process_images: bool
     """
     rag = _require_rag()
+    jobs = _require_jobs()
 
     # project root: backend/app/api/routes_rag.py -> parents[3] = repo root
     project_root = Path(__file__).resolve().parents[3]
     raw_dir = project_root / "data" / "raw"
     raw_dir.mkdir(parents=True, exist_ok=True)
 
-    saved_names: List[str] = []
-
     for f in files:
         if not f.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail=f"Not a PDF: {f.filename}")
-        
-
-        # stable + unique file name (avoid collisions)
-        safe_name = f"{Path(f.filename).stem}_{uuid.uuid4().hex[:8]}.pdf"
-        saved_names.append(safe_name)
-        out_path = raw_dir / safe_name
-        with out_path.open("wb") as buffer:
-            shutil.copyfileobj(f.file, buffer)
-    
-    results = rag.upload_pdfs(saved_names, raw_dir, process_images=process_images)
+
+    saved_names: List[str] = []
+    duplicates: List[Dict[str, str]] = []
+
+    try:
+        for f in files:
+            # stable + unique file name (avoid collisions)
+            safe_name = f"{Path(f.filename).stem}_{uuid.uuid4().hex[:8]}.pdf"
+            out_path = raw_dir / safe_name
+            content_hash = await _save_upload(f, out_path)
+
+            # same content already indexed / queued (or twice in this request) -> skip before any processing
+            # (the first claim hashes all indexed PDFs, so keep it off the event loop)
+            existing = await run_in_threadpool(rag.claim_content_hash, content_hash, safe_name)
+            if existing is not None:
+                out_path.unlink(missing_ok=True)
+                duplicates.append({"filename": f.filename, "duplicate_of": existing})
+                continue
+            saved_names.append(safe_name)
+
+        job = jobs.submit(saved_names, raw_dir, process_images=process_images)
+    except BaseException:
+        # nothing of this request gets queued -> free the claimed hashes and the saved files
+        for name in saved_names:
+            rag.release_content_hash(name)
+            (raw_dir / name).unlink(missing_ok=True)
+        raise
 
     return {
+        "job_id": job.id,
+        "status": job.status,
         "uploaded_files": len(files),
         "saved_to": str(raw_dir),
-        "documents": [r.__dict__ for r in results],
-        "total_chunks_in_store": len(rag.chunks),
+        # chunk/page counts are filled in by the job, see /rag/jobs/{job_id}
+        "documents": [{"document_id": name, "filename": name} for name in saved_names],
+        "skipped_duplicates": duplicates,
+        "total_chunks_in_store": len(rag.store.chunks),
     }
 
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Endpoint to report the status and per-stage progress of a background upload.
+
+    :param job_id: The ID returned by /rag/upload.
+    :type job_id: str
+    """
+    job = _require_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
 @router.post("/settings")
 def set_settings(payload: RagSettingsIn):
     """
     Endpoint to update RAG settings. Expects a JSON body with the new settings.
+    Changing chunk_size or chunk_overlap starts a re-index job (poll /rag/jobs/{job_id}).
     
     :param payload: The new RAG settings to apply.
     :type payload: RagSettingsIn
     """
     rag = _require_rag()
     
-    rag.apply_settings(
+    rechunk = rag.apply_settings(
         llm_model=payload.llm_model,
         top_k=payload.top_k,
         chunk_size=payload.chunk_size,
         chunk_overlap=payload.chunk_overlap,
         temperature=payload.temperature,
         max_tokens=payload.max_tokens,
+        nprobe=payload.nprobe,
+        ef_search=payload.ef_search,
+        retrieval_mode=payload.retrieval_mode,
+        fusion=payload.fusion,
+        context_budget=payload.context_budget,
+        rerank=payload.rerank,
     )
 
-    return {"ok": True, "settings": rag.get_settings()}
+    # new chunk size/overlap: re-chunk and re-embed in the background, old index serves queries meanwhile
+    reindex_job = _require_jobs().submit_reindex() if rechunk else None
+
+    return {
+        "ok": True,
+        "settings": rag.get_settings(),
+        "reindex_job_id": reindex_job.id if reindex_job is not None else None,
+    }
 
 @router.get("/stats")
 def get_stats():
@@ -142,12 +376,24 @@ def get_stats():
     Endpoint to retrieve document and chunk counts.
     """
     rag = _require_rag()
-    # documents count: simplest MVP = number of unique document_ids in chunks
-    # If you already track documents somewhere else, use that instead.
-    doc_ids = {c.document_id for c in rag.chunks} if rag.chunks else set()
+    # counts come from the store's chunk store (live rows / documents with live rows)
+    chunks = rag.store.chunks
 
     return {
-        "documentCount": len(doc_ids),
-        "chunkCount": len(rag.chunks),
+        "documentCount": len(chunks.document_ids()),
+        "chunkCount": len(chunks),
         "settings": rag.get_settings() if hasattr(rag, "get_settings") else None,
-    }
\ No newline at end of file
+        "embeddingCache": rag.embedder.cache.stats() if rag.embedder.cache is not None else None,
+        "captionCache": rag.caption_cache.stats() if rag.caption_cache is not None else None,
+        "layoutCache": rag.layout_cache.stats() if rag.layout_cache is not None else None,
+        "answerCache": rag.answer_cache.stats() if rag.answer_cache is not None else None,
+        "rerankCache": rag.reranker.stats() if rag.reranker is not None else None,
+        "latency": METRICS.summary(),
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Endpoint exposing per-stage latencies (histograms and p50/p95/p99) in the Prometheus text format.
+    """
+    return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.rag_pipeline import RAGPipeline, UploadResult
+
+# Stages reported by RAGPipeline.upload_pdfs via its progress callback
+INGEST_STAGES = ("pages_parsed", "images_captioned", "chunks_embedded")
+
+
+@dataclass
+class IngestJob:
+    """
+    State of one background upload. Progress is tracked per document and stage
+    as (done, total) and summed up in `to_dict`.
+    """
+    id: str
+    pdf_names: List[str]
+    process_images: bool
+    kind: str = "upload"  # upload | reindex
+    status: str = "queued"  # queued | running | finished | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    results: List[UploadResult] = field(default_factory=list)
+    # document_id -> error of documents that failed (the others are still ingested)
+    errors: Dict[str, str] = field(default_factory=dict)
+    progress: Dict[str, Dict[str, Tuple[int, int]]] = field(
+        default_factory=lambda: {stage: {} for stage in INGEST_STAGES}
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def report(self, document_id: str, stage: str, done: int, total: int) -> None:
+        """
+        Progress callback handed to RAGPipeline.upload_pdfs.
+        """
+        with self._lock:
+            self.progress.setdefault(stage, {})[document_id] = (done, total)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                stage: {
+                    "done": sum(d for d, _ in per_doc.values()),
+                    "total": sum(t for _, t in per_doc.values()),
+                }
+                for stage, per_doc in self.progress.items()
+            }
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "documents_total": len(self.pdf_names),
+                "documents_done": len(self.results),
+                "documents_failed": len(self.errors),
+                "progress": stages,
+                "documents": [r.__dict__ for r in self.results],
+                "errors": [{"document_id": d, "error": e} for d, e in self.errors.items()],
+            }
+
+
+class IngestJobQueue:
+    """
+    Runs RAGPipeline.upload_pdfs (and RAGPipeline.reindex) in a bounded pool of
+    background workers, so /rag/upload and /rag/settings can return a job id immediately.
+    Finished jobs are kept (up to `max_finished_jobs`) so clients can poll their result.
+    """
+
+    def __init__(self, rag: RAGPipeline, max_workers: int = 2, max_finished_jobs: int = 200) -> None:
+        self.rag = rag
+        self.max_finished_jobs = max_finished_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, pdf_names: List[str], data_folder: Path, process_images: bool = True) -> IngestJob:
+        """
+        Queues the upload of already saved PDFs and returns the job.
+        """
+        job = IngestJob(id=uuid.uuid4().hex, pdf_names=list(pdf_names), process_images=process_images)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self._pool.submit(self._run, job, data_folder)
+        except RuntimeError:
+            # pool already shut down -> the job would never run
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def submit_reindex(self) -> IngestJob:
+        """
+        Queues a re-chunk / re-embed of all documents with the current chunk settings.
+        If the queue is already shut down, the returned job is failed.
+        """
+        job = IngestJob(
+            id=uuid.uuid4().hex,
+            pdf_names=self.rag.store.document_ids(),
+            process_images=False,
+            kind="reindex",
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self._pool.submit(self._run, job, None)
+        except RuntimeError as e:
+            # pool already shut down: the settings are applied, report the re-index as failed
+            job.error = f"Re-index could not be queued: {e}"
+            job.status = "failed"
+            job.finished_at = time.time()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: IngestJob, data_folder: Optional[Path]) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            # results are appended per document, so documents_done grows while the job runs
+            if job.kind == "reindex":
+                self.rag.reindex(progress=job.report, results=job.results)
+            else:
+                self.rag.upload_pdfs(
+                    job.pdf_names,
+                    data_folder,
+                    process_images=job.process_images,
+                    progress=job.report,
+                    results=job.results,
+                    errors=job.errors,
+                )
+            # only failed if nothing could be ingested
+            if job.errors and not job.results:
+                job.status = "failed"
+                job.error = next(iter(job.errors.values()))
+            else:
+                job.status = "finished"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        """
+        Drops the oldest finished jobs beyond `max_finished_jobs`.
+        """
+        finished = [j for j in self._jobs.values() if j.status in ("finished", "failed")]
+        overflow = len(finished) - self.max_finished_jobs
+        if overflow > 0:
+            for j in sorted(finished, key=lambda j: j.created_at)[:overflow]:
+                del self._jobs[j.id]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
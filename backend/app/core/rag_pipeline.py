@@ -1,14 +1,49 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Dict, Any
-from zipfile import Path
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
 
 from app.models.embedder_loader import LMStudioEmbedder
 from app.models.llm_client import LLMConfig, LMStudioChatLLM
-from app.preprocessing.pdf_preprocessor import preprocess_pdf
-from app.utils.chunker import TextChunk, chunk_layout_small2big_mod,expand_chunk_small2big_mod
-from app.utils.indexing import FaissVectorStore
+from app.models.reranker import CrossEncoderReranker
+from app.preprocessing.layout_cache import LayoutCache, file_hash
+from app.preprocessing.pdf_preprocessor import (
+    PageLayout,
+    StageProgress,
+    iter_preprocessed_pages,
+    layout_cache_key,
+    preprocess_pdf,
+)
+from app.utils.answer_cache import AnswerCache
+from app.utils.caption_cache import CaptionCache
+from app.utils.chunk_store import ChunkStore
+from app.utils.context_packer import TokenCounter, pack_context
+from app.utils.chunker import TextChunk, chunk_layout_small2big_mod, iter_chunks_small2big_mod
+from app.utils.indexing import FaissVectorStore, SearchFilter, create_index
+from app.utils.metrics import METRICS
+from app.utils.streaming import batched, prefetch
+
+logger = logging.getLogger(__name__)
+
+# progress(document_id, stage, done, total)
+ProgressCallback = Callable[[str, str, int, int], None]
+
+# Streaming ingest: preprocessed pages buffered ahead of chunking / embedding,
+# and chunks embedded + indexed per step
+INGEST_QUEUE_PAGES = 16
+INGEST_EMBED_BATCH = 128
+# documents of one upload streamed at the same time (each with its own page window)
+INGEST_PARALLEL_DOCS = int(os.environ.get("RAG_INGEST_PARALLEL_DOCS", 2))
 
 @dataclass
 class RAGConfig:
@@ -26,18 +61,62 @@ class RAGPipeline:
     """
     A simple RAG pipeline that handles PDF uploads, indexing, and question-answering.
     """
-    def __init__(self, store: FaissVectorStore, chunks: List[TextChunk], top_k: int = 5) -> None:
-        self.embedder = LMStudioEmbedder()
+    def __init__(
+        self,
+        store: FaissVectorStore,
+        top_k: int = 5,
+        snapshot_dir: Optional[Path] = None,
+        caption_cache: Optional[CaptionCache] = None,
+        raw_dir: Optional[Path] = None,
+        layout_cache: Optional[LayoutCache] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
+    ) -> None:
+        # share the store's embedder (and its cache) for query embeddings
+        self.embedder = store.embedder or LMStudioEmbedder()
         self.llm = LMStudioChatLLM()
         self.store = store
         self.top_k = top_k
-        self.chunks = chunks
+        # if set, the store is persisted here after every upload
+        self.snapshot_dir = snapshot_dir
+        # optional persistent cache, so re-ingest never captions the same figure twice
+        self.caption_cache = caption_cache
+        # optional persistent cache of preprocessed layouts, so re-ingest / re-index skip parsing
+        self.layout_cache = layout_cache
+        # optional cross-encoder: over-fetches candidates and keeps the best top_k
+        self.reranker = reranker
+        self.rerank = reranker is not None
+        # optional semantic cache of generated answers, scoped to index version + settings
+        self.answer_cache = answer_cache
+        # incremented whenever documents are added or removed (invalidates cached answers)
+        self.index_version = 0
+        # where the uploaded PDFs live (re-parsed by `reindex` if their layouts are not in memory)
+        self.raw_dir = raw_dir
+        # document_id -> preprocessed page layouts (text + image captions), for re-chunking;
+        # only kept in memory without a layout cache (otherwise `_layouts_for` reads the cache)
+        self.layouts: Dict[str, List[PageLayout]] = {}
+        # SHA-256 of the PDF content <-> document_id of indexed and queued uploads (duplicate detection),
+        # built lazily from raw_dir on first use
+        self._content_hashes: Optional[Dict[str, str]] = None
+        self._document_hashes: Dict[str, str] = {}
+        self._hash_lock = threading.Lock()
+        # serializes changes of the store (uploads, deletions, the re-index swap)
+        self._index_lock = threading.Lock()
+        # only one re-index at a time
+        self._reindex_lock = threading.Lock()
 
         self.chunk_size = 100
         self.chunk_overlap = 20
 
         self.temperature = 0.2
         self.max_tokens = 2048
+        # token budget of the retrieved context in the prompt (counted with RAG_TOKENIZER if set)
+        self.context_budget = 6000
+        self.token_counter = TokenCounter.from_env()
+
+        # "hybrid" = BM25 + dense merged with `fusion` ("rrf" or "weighted"), "dense" = FAISS only
+        self.retrieval_mode = "hybrid"
+        self.fusion = "rrf"
     
     def apply_settings(
         self,
@@ -47,14 +126,23 @@ class RAGPipeline:
         chunk_overlap: int,
         temperature: float,
         max_tokens: int,
-    ):
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        retrieval_mode: Optional[str] = None,
+        fusion: Optional[str] = None,
+        context_budget: Optional[int] = None,
+        rerank: Optional[bool] = None,
+    ) -> bool:
         """
-        Apply new settings to the RAG pipeline. This can be extended to trigger re-indexing if needed.
+        Apply new settings to the RAG pipeline.
+        Returns True if the chunking parameters changed; the caller should then run
+        `reindex` (in the background), until then queries use the existing chunks.
         """
-        # Store settings (MVP: only store, no re-indexing here)
+        rechunk = (chunk_size, chunk_overlap) != (self.chunk_size, self.chunk_overlap)
         llmCnfig = LLMConfig(model=llm_model, temperature=temperature, max_tokens=max_tokens)
 
-        self.llm = LMStudioChatLLM(config=llmCnfig)
+        # same client (and connection pools), only the request parameters change
+        self.llm.config = llmCnfig
         self.top_k = top_k
 
         self.chunk_size = chunk_size
@@ -63,6 +151,20 @@ class RAGPipeline:
         self.temperature = temperature
         self.max_tokens = max_tokens
 
+        # recall/latency trade-off of the ANN index (ignored by a flat index)
+        self.store.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+        if retrieval_mode is not None:
+            self.retrieval_mode = retrieval_mode
+        if fusion is not None:
+            self.fusion = fusion
+        if context_budget is not None:
+            self.context_budget = context_budget
+        if rerank is not None:
+            self.rerank = rerank and self.reranker is not None
+
+        return rechunk
+
     def get_settings(self) -> dict:
         """
         Retrieve current settings of the RAG pipeline.
@@ -74,72 +176,151 @@ class RAGPipeline:
             "chunk_overlap": self.chunk_overlap,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
+            "index_kind": self.store.index_config.kind,
+            "nprobe": self.store.index_config.nprobe,
+            "ef_search": self.store.index_config.ef_search,
+            "retrieval_mode": self.retrieval_mode,
+            "fusion": self.fusion,
+            "context_budget": self.context_budget,
+            "rerank": self.rerank,
         }
 
-    def answer(self, question: str) -> Dict[str, Any]:
+    def _search(
+        self,
+        question: str,
+        query_embedding: Optional[np.ndarray] = None,
+        top_k: Optional[int] = None,
+        retrieval_mode: Optional[str] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> Tuple[ChunkStore, List[Tuple[Dict[str, Any], np.ndarray]]]:
         """
-        Answer a question using the RAG pipeline.
+        Steps 1-2 of answering: retrieve the top hits (reranked if enabled) and expand each
+        one to its parent block (small2big). Returns the chunk store the hits refer to and
+        (hit, expanded chunk rows) pairs, best first.
+        A `search_filter` is applied inside the index search, so it still yields top_k hits.
+        """
+        top_k = top_k or self.top_k
+        # one store for the whole request, even if a re-index swaps it meanwhile
+        store = self.store
+        chunks = store.chunks
+        reranker = self.reranker if self.rerank else None
+        # the reranker needs more candidates than it keeps
+        n_fetch = max(top_k, reranker.config.candidates) if reranker is not None else top_k
+
+        # 1) embed + retrieve
+        if query_embedding is None:
+            with METRICS.time("query_embed"):
+                query_embedding = self.embedder.embed_text(question)
+        with METRICS.time("search"):
+            if (retrieval_mode or self.retrieval_mode) == "hybrid":
+                hits = store.search_hybrid(
+                    question,
+                    embedder=self.embedder,
+                    top_k=n_fetch,
+                    fusion=self.fusion,
+                    query_embedding=query_embedding,
+                    search_filter=search_filter,
+                )
+            else:
+                hits = store.search_by_embedding(query_embedding, top_k=n_fetch, search_filter=search_filter)
+
+        # 1b) rerank
+        if reranker is not None and hits:
+            with METRICS.time("rerank"):
+                hits = reranker.rerank(question, hits, [chunks.content(h["vid"]) for h in hits], top_k=top_k)
+
+        # 2) expand: a split chunk is replaced by its full parent block (small2big, METHOD A),
+        # a small block stays as it is (METHOD B)
+        with METRICS.time("expand"):
+            expanded: List[Tuple[Dict[str, Any], np.ndarray]] = []
+            for h in hits:
+                vid = h["vid"]
+                rows = chunks.block_rows(vid) if chunks.splited(vid) else np.array([vid], dtype="int64")
+                expanded.append((h, rows))
+        return chunks, expanded
+
+    def retrieve(
+        self,
+        question: str,
+        top_k: Optional[int] = None,
+        retrieval_mode: Optional[str] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieval only (no LLM call): the ranked hits as source entries, each with the
+        text of its expanded parent block and the chunks it was built from.
+
+        :param question: The query.
+        :param top_k: Number of hits (default: the pipeline's top_k).
+        :param retrieval_mode: "hybrid" or "dense" (default: the pipeline's mode).
+        :param search_filter: Optional restriction to documents / pages / block types.
+        """
+        chunks, expanded = self._search(
+            question, top_k=top_k, retrieval_mode=retrieval_mode, search_filter=search_filter
+        )
+        results: List[Dict[str, Any]] = []
+        for rank, (h, rows) in enumerate(expanded, start=1):
+            entry = _source_entry(rank, h["score"], chunks, h["vid"])
+            for key in ("dense_score", "sparse_score", "retrieval_score"):
+                if key in h:
+                    entry[key] = h[key]
+            rows = rows.tolist()
+            entry["parent_context"] = "\n\n".join(chunks.content(r) for r in rows)
+            entry["parent_chunks"] = [
+                {"chunk_id": chunks.chunk_id(r), "chunk_index": chunks.chunk_index(r), "page_id": chunks.page_id(r)}
+                for r in rows
+            ]
+            results.append(entry)
+        return results
+
+    def prepare(
+        self,
+        question: str,
+        query_embedding: Optional[np.ndarray] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        Retrieval and prompt construction (everything before the LLM call).
 
-        
-        :param self: The RAGPipeline instance.
         :param question: The question to answer.
         :type question: str
-        :return: Description
-        :rtype: Dict[str, Any]
+        :param query_embedding: Embedding of the question, if already computed.
+        :type query_embedding: Optional[np.ndarray]
+        :param search_filter: Optional restriction to documents / pages / block types.
+        :type search_filter: Optional[SearchFilter]
+        :return: The chat messages for the LLM and the sources for the frontend.
+        :rtype: Tuple[List[Dict[str, str]], List[Dict[str, Any]]]
         """
-        # 1) retrieve
-        hits = self.store.search_by_text(question, embedder=self.embedder, top_k=self.top_k)
+        chunks, expanded = self._search(question, query_embedding, search_filter=search_filter)
+        with METRICS.time("prompt_build"):
+            return self._build_prompt(question, chunks, expanded)
 
-        # 2) build context
-        context_blocks: List[str] = []
-        contextDict: Dict[int, str] = {}
+    def _build_prompt(
+        self,
+        question: str,
+        chunks: ChunkStore,
+        expanded: List[Tuple[Dict[str, Any], np.ndarray]],
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        Steps 3-4 of answering: pack the retrieved context and build the chat messages.
+        """
+        # build context: merge hits of the same parent block, drop overlapping window text,
+        # best spans first within the token budget
+        packed = pack_context(
+            [(h["score"], rows.tolist()) for h, rows in expanded],
+            chunks,
+            self.token_counter,
+            max_tokens=self.context_budget,
+            max_overlap=self.chunk_overlap,
+        )
         sources: List[Dict[str, Any]] = []
-        print("HITS:", len(hits))
-        for h in hits:
-            meta = h["metadata"]
-            score = h["score"]
-            hited_text_chunk = TextChunk(
-                    id=meta.get("id"),
-                    document_id=meta.get("document_id"),
-                    page_id=meta.get("page_id"),
-                    parent_block_id=meta.get("parent_block_id"),
-                    chunk_index=meta.get("chunk_index"),
-                    content=meta.get("content"),
-                    splited=meta.get("splited"), 
-                    wordcount=meta.get("wordcount")
-                )
-            # expand chunk to include siblings if it's a small chunk (MVP: simple heuristic based on word count)
-            expanded_content_chunks = expand_chunk_small2big_mod(hit=hited_text_chunk,chunks=self.chunks)
-
-            for content_chunk in expanded_content_chunks:
-                context_blocks.append(
-                    f"[Source score={score:.3f} doc={content_chunk.document_id} chunk_id={content_chunk.chunk_index}]\n"
-                    f"{content_chunk.content}"
-                )
-            contextDict[content_chunk.parent_block_id] = "\n\n---\n\n".join(context_blocks)
-            context_blocks = []  # reset for next hit
+        logger.debug("hits: %d, context tokens: %d, dropped spans: %d", len(expanded), packed.tokens, packed.dropped)
+        for h, _ in expanded:
             # build sources info for frontend (MVP: just return chunk metadata, frontend can fetch full content if needed)
-            sources.append(
-                {
-                    "rank": len(sources) + 1,
-                    "score": score,
-                    "document_id": meta.get("document_id"),
-                    "chunk_id": meta.get("id"),
-                    "chunk_index": meta.get("chunk_index"),
-                    "page_id": meta.get("page_id"),
-                    "content": meta.get("content"),
-
-                    # highlight info
-                    "is_child_chunk": bool(meta.get("splited")),  # your field name
-                    "parent_block_id": meta.get("parent_block_id"),
-
-                    # link (frontend will use it directly)
-                    "document_url": f"/rag/documents/{meta.get('document_id')}",
-                }
-            )
+            sources.append(_source_entry(len(sources) + 1, h["score"], chunks, h["vid"]))
 
         # build context text for LLM
-        context_text = "\n\n---\n\n".join(contextDict.values())
+        context_text = packed.text()
 
 
         # 3) prompt
@@ -161,55 +342,598 @@ class RAGPipeline:
                 {context_text}
                 """
 
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ]
+        return messages, sources
+
+    def search_batch(
+        self,
+        questions: List[str],
+        top_k: Optional[int] = None,
+        retrieval_mode: Optional[str] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieval only, for many questions at once (one embedding batch, one FAISS matrix search).
+        No small2big expansion and no LLM call.
+
+        :param questions: The queries.
+        :param top_k: Hits per query (default: the pipeline's top_k).
+        :param retrieval_mode: "hybrid" or "dense" (default: the pipeline's mode).
+        :param search_filter: Optional restriction to documents / pages / block types (all queries).
+        :return: One list of source entries (same fields as in `prepare`) per question.
+        """
+        store = self.store
+        with METRICS.time("search_batch"):
+            batch = store.search_batch(
+                questions,
+                embedder=self.embedder,
+                top_k=top_k or self.top_k,
+                mode=retrieval_mode or self.retrieval_mode,
+                fusion=self.fusion,
+                search_filter=search_filter,
+            )
+        return [
+            [_source_entry(rank, h["score"], store.chunks, h["vid"]) for rank, h in enumerate(hits, start=1)]
+            for hits in batch
+        ]
+
+    def _cache_scope(self, search_filter: Optional[SearchFilter] = None) -> str:
+        """
+        Scope of cached answers: an answer is only reused with the same index, settings and filter.
+        """
+        scope: Dict[str, Any] = {"index_version": self.index_version, **self.get_settings()}
+        if search_filter is not None:
+            scope["filter"] = {
+                "document_ids": sorted(search_filter.document_ids) if search_filter.document_ids is not None else None,
+                "page_from": search_filter.page_from,
+                "page_to": search_filter.page_to,
+                "block_types": sorted(search_filter.block_types) if search_filter.block_types is not None else None,
+            }
+        return json.dumps(scope, sort_keys=True)
+
+    def _lookup_answer(
+        self,
+        question: str,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> Tuple[Optional[np.ndarray], str, Optional[Dict[str, Any]]]:
+        """
+        Embeds the question and looks it up in the answer cache.
+        Returns (query embedding, cache scope, cached answer or None).
+        """
+        if self.answer_cache is None:
+            return None, "", None
+        scope = self._cache_scope(search_filter)
+        with METRICS.time("query_embed"):
+            query_embedding = self.embedder.embed_text(question)
+        return query_embedding, scope, self.answer_cache.get(scope, query_embedding)
+
+    def _remember_answer(
+        self,
+        scope: str,
+        query_embedding: Optional[np.ndarray],
+        result: Dict[str, Any],
+    ) -> None:
+        if self.answer_cache is not None and query_embedding is not None:
+            self.answer_cache.put(scope, query_embedding, result)
+
+    def _bump_index_version(self) -> None:
+        """
+        Called (under the index lock) whenever the indexed documents change.
+        """
+        self.index_version += 1
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+
+    def answer(self, question: str, search_filter: Optional[SearchFilter] = None) -> Dict[str, Any]:
+        """
+        Answer a question using the RAG pipeline.
+        Repeated or near-identical questions are answered from the answer cache (if configured).
+
+        :param question: The question to answer.
+        :type question: str
+        :param search_filter: Optional restriction to documents / pages / block types.
+        :type search_filter: Optional[SearchFilter]
+        :return: The answer text, the sources used and whether it came from the cache.
+        :rtype: Dict[str, Any]
+        """
+        with METRICS.time("answer_total"):
+            return self._answer(question, search_filter)
+
+    def _answer(self, question: str, search_filter: Optional[SearchFilter]) -> Dict[str, Any]:
+        query_embedding, scope, cached = self._lookup_answer(question, search_filter)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        messages, sources = self.prepare(question, query_embedding, search_filter)
+
         # 5) call LLM
-        answer_text = self.llm.chat(
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ]
-        )
+        with METRICS.time("llm_total"):
+            answer_text = self.llm.chat(messages=messages)
+
+        result = {"answer": answer_text, "sources": sources}
+        self._remember_answer(scope, query_embedding, result)
+        return {**result, "cached": False}
+
+    async def aanswer(self, question: str, search_filter: Optional[SearchFilter] = None) -> Dict[str, Any]:
+        """
+        Async variant of `answer`: retrieval runs in a worker thread,
+        the LLM call uses the async client, so no worker is blocked while generating.
+        """
+        started = time.perf_counter()
+        query_embedding, scope, cached = await asyncio.to_thread(self._lookup_answer, question, search_filter)
+        if cached is not None:
+            METRICS.observe("answer_total", time.perf_counter() - started)
+            return {**cached, "cached": True}
 
-        return {"answer": answer_text, "sources": sources}
+        messages, sources = await asyncio.to_thread(self.prepare, question, query_embedding, search_filter)
+        with METRICS.time("llm_total"):
+            answer_text = await self.llm.achat(messages=messages)
+
+        result = {"answer": answer_text, "sources": sources}
+        self._remember_answer(scope, query_embedding, result)
+        METRICS.observe("answer_total", time.perf_counter() - started)
+        return {**result, "cached": False}
+
+    async def astream_answer(
+        self,
+        question: str,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams the answer as events: first {"event": "sources"}, then one
+        {"event": "token"} per generated text delta, finally {"event": "done"}.
+        A cached answer is sent as a single token event.
+        Records the LLM time to first token ("llm_ttft") besides the total generation time.
+        """
+        started = time.perf_counter()
+        query_embedding, scope, cached = await asyncio.to_thread(self._lookup_answer, question, search_filter)
+        if cached is not None:
+            yield {"event": "sources", "data": cached["sources"]}
+            yield {"event": "token", "data": cached["answer"]}
+            yield {"event": "done", "data": {"cached": True}}
+            METRICS.observe("answer_total", time.perf_counter() - started)
+            return
+
+        messages, sources = await asyncio.to_thread(self.prepare, question, query_embedding, search_filter)
+        yield {"event": "sources", "data": sources}
+
+        parts: List[str] = []
+        llm_started = time.perf_counter()
+        async for delta in self.llm.astream_chat(messages=messages):
+            if not parts:
+                METRICS.observe("llm_ttft", time.perf_counter() - llm_started)
+            parts.append(delta)
+            yield {"event": "token", "data": delta}
+        METRICS.observe("llm_total", time.perf_counter() - llm_started)
+
+        self._remember_answer(scope, query_embedding, {"answer": "".join(parts), "sources": sources})
+        yield {"event": "done", "data": {"cached": False}}
+        METRICS.observe("answer_total", time.perf_counter() - started)
+
+    def claim_content_hash(self, content_hash: str, document_id: str) -> Optional[str]:
+        """
+        Registers the content hash of a new upload before it is queued.
+        Returns the id of the document (indexed or queued) with the same content instead,
+        if there is one; the upload is then a duplicate and should be skipped.
+        """
+        with self._hash_lock:
+            hashes = self._known_hashes()
+            existing = hashes.get(content_hash)
+            if existing is not None:
+                return existing
+            hashes[content_hash] = document_id
+            self._document_hashes[document_id] = content_hash
+            return None
+
+    def release_content_hash(self, document_id: str) -> None:
+        """
+        Drops the content hash claimed for (or indexed under) `document_id`, so the same
+        content can be uploaded again.
+        """
+        with self._hash_lock:
+            content_hash = self._document_hashes.pop(document_id, None)
+            if content_hash is not None and self._content_hashes is not None:
+                self._content_hashes.pop(content_hash, None)
+
+    def _known_hashes(self) -> Dict[str, str]:
+        """
+        content hash -> document_id; on first use hashes the PDFs of the indexed documents
+        (called under `_hash_lock`).
+        """
+        if self._content_hashes is None:
+            self._content_hashes = {}
+            for document_id in self.store.document_ids():
+                if self.raw_dir is None or not (self.raw_dir / document_id).exists():
+                    continue
+                content_hash = file_hash(self.raw_dir / document_id)
+                self._content_hashes.setdefault(content_hash, document_id)
+                self._document_hashes[document_id] = content_hash
+        return self._content_hashes
 
     def upload_pdfs(
         self,
         pdf_names: List[str],
         data_folder: Path,
         process_images: bool = True,
+        progress: Optional[ProgressCallback] = None,
+        results: Optional[List[UploadResult]] = None,
+        errors: Optional[Dict[str, str]] = None,
     ) -> List[UploadResult]:
         """
         Process and upload PDFs to the RAG pipeline. This includes preprocessing, chunking, and indexing.
+        Every document is streamed page by page (see `_ingest_document`), so memory stays bounded
+        by a window of pages and a document becomes searchable while it is still being processed.
+        Up to INGEST_PARALLEL_DOCS documents are processed concurrently (their page ranges share
+        the parser process pool). A failing document does not stop the others.
+
+        :param progress: Optional callback(document_id, stage, done, total) for
+            "pages_parsed", "images_captioned" and "chunks_embedded".
+        :param results: Optional list the per-document results are appended to (as they finish).
+        :param errors: Optional dict that receives document_id -> error message of failed documents.
+            Without it, the first error is raised once all documents were tried.
         """
-        results: List[UploadResult] = []
-        all_new_chunks: List[TextChunk] = []
+        if results is None:
+            results = []
+        failures: List[BaseException] = []
+        started: Set[str] = set()
 
-        # For each PDF, preprocess and chunk, then add to store and keep track of results for response
-        for pdf_name in pdf_names:
-            document_id = pdf_name
-            pdf_path = data_folder / pdf_name
-            page_layouts = preprocess_pdf(pdf_path, language="en", process_images=process_images)
-            doc_chunks = chunk_layout_small2big_mod(
+        def ingest(pdf_name: str) -> None:
+            started.add(pdf_name)
+            doc_progress = None
+            if progress is not None:
+                doc_progress = lambda stage, done, total: progress(pdf_name, stage, done, total)
+            try:
+                results.append(self._ingest_document(pdf_name, data_folder / pdf_name, process_images, doc_progress))
+            except Exception as e:
+                logger.exception("Ingest of %s failed", pdf_name)
+                failures.append(e)
+                if errors is not None:
+                    errors[pdf_name] = str(e)
+
+        workers = max(1, min(INGEST_PARALLEL_DOCS, len(pdf_names)))
+        try:
+            if workers == 1:
+                for pdf_name in pdf_names:
+                    ingest(pdf_name)
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-doc") as pool:
+                    list(pool.map(ingest, pdf_names))
+        finally:
+            # aborted before these were started -> they will never be indexed, free their hashes
+            for pdf_name in pdf_names:
+                if pdf_name not in started:
+                    self.release_content_hash(pdf_name)
+
+        # persist so a restart does not lose the corpus
+        if self.snapshot_dir is not None and results:
+            self.store.save(self.snapshot_dir)
+
+        if failures and errors is None:
+            raise failures[0]
+        return results
+
+    def _ingest_document(
+        self,
+        document_id: str,
+        pdf_path: Path,
+        process_images: bool,
+        progress: Optional[StageProgress],
+    ) -> UploadResult:
+        """
+        Streaming ingest of one PDF: parse page -> filter -> caption -> chunk -> embed -> index.
+        Parsing, filtering and captioning run in a background thread, at most INGEST_QUEUE_PAGES
+        finished pages ahead of chunking (and the parser at most PAGE_WINDOW pages ahead of that),
+        so embedding overlaps with parsing and neither side can run away with memory.
+        Chunks are embedded and indexed in batches of INGEST_EMBED_BATCH.
+
+        If the chunk settings change (or a re-index swaps the store) while the document is
+        streamed, the already indexed part is dropped and the document is re-chunked with the
+        current settings at the end. On errors the partially indexed document is removed
+        (and its content hash released, so the file can be uploaded again).
+        """
+        with self._index_lock:
+            chunk_size, chunk_overlap = self.chunk_size, self.chunk_overlap
+
+        # text-only pages (captions are text blocks, image bytes are gone), kept for re-chunking
+        # unless the layout cache has them
+        keep_layouts = self.layout_cache is None
+        text_layouts: List[PageLayout] = []
+        num_pages = 0
+        # chunking runs lazily while the batches are pulled; its time is the pulling time minus
+        # the time spent waiting for preprocessed pages
+        chunk_seconds = 0.0
+        page_wait_seconds = 0.0
+
+        def collect(pages):
+            nonlocal num_pages, page_wait_seconds
+            it = iter(pages)
+            while True:
+                started = time.perf_counter()
+                page = next(it, None)
+                page_wait_seconds += time.perf_counter() - started
+                if page is None:
+                    return
+                num_pages += 1
+                if keep_layouts:
+                    text_layouts.append(page)
+                yield page
+
+        def timed(chunks):
+            nonlocal chunk_seconds
+            it = iter(chunks)
+            while True:
+                started = time.perf_counter()
+                chunk = next(it, None)
+                chunk_seconds += time.perf_counter() - started
+                if chunk is None:
+                    return
+                yield chunk
+
+        pages = prefetch(
+            iter_preprocessed_pages(
+                pdf_path,
+                language="en",
+                process_images=process_images,
+                progress=progress,
+                caption_cache=self.caption_cache,
+                layout_cache=self.layout_cache,
+                # known from the upload, saves reading the file again for the cache key
+                content_hash=self._document_hashes.get(document_id),
+            ),
+            maxsize=INGEST_QUEUE_PAGES,
+            name=f"ingest-{document_id}",
+        )
+        target: Optional[FaissVectorStore] = None
+        num_chunks = 0
+        stale = False
+        try:
+            chunks = iter_chunks_small2big_mod(
                 document_id=document_id,
-                layout_pages=page_layouts,
-                chunk_size=self.chunk_size,
-                overlap=self.chunk_overlap,
+                layout_pages=collect(pages),
+                chunk_size=chunk_size,
+                overlap=chunk_overlap,
             )
-            all_new_chunks.extend(doc_chunks)
-
-            # prepare result info for this document
-            results.append(
-                UploadResult(
-                    document_id=document_id,
-                    filename=pdf_name,
-                    num_pages=len(page_layouts),
-                    num_chunks=len(doc_chunks),
-                )
+            for batch in batched(timed(chunks), INGEST_EMBED_BATCH):
+                with self._index_lock:
+                    if (self.chunk_size, self.chunk_overlap) != (chunk_size, chunk_overlap) or (
+                        target is not None and self.store is not target
+                    ):
+                        stale = True
+                        break
+                    if target is None:
+                        # re-parsing (re-index, layout cache miss) needs the upload's setting
+                        self.store.set_document_meta(document_id, process_images=process_images)
+                    target = self.store
+                    self.store.add_chunks(batch)
+                    self._bump_index_version()
+                num_chunks += len(batch)
+                if progress is not None:
+                    progress("chunks_embedded", num_chunks, num_chunks)
+            METRICS.observe("chunk", max(0.0, chunk_seconds - page_wait_seconds))
+
+            if stale:
+                # finish preprocessing, then index the whole document again with the current settings
+                for page in collect(pages):
+                    pass
+                if not keep_layouts:
+                    # written to the layout cache now (re-parsed if it could not be cached)
+                    text_layouts = self._layouts_for(document_id, None, process_images) or []
+                with self._index_lock:
+                    self.store.delete_document(document_id)
+                    with METRICS.time("chunk"):
+                        doc_chunks: List[TextChunk] = chunk_layout_small2big_mod(
+                            document_id=document_id,
+                            layout_pages=text_layouts,
+                            chunk_size=self.chunk_size,
+                            overlap=self.chunk_overlap,
+                        )
+                    if doc_chunks:
+                        self.store.set_document_meta(document_id, process_images=process_images)
+                        self.store.add_chunks(doc_chunks)
+                    self._bump_index_version()
+                num_chunks = len(doc_chunks)
+                if progress is not None:
+                    progress("chunks_embedded", num_chunks, num_chunks)
+        except BaseException:
+            if target is not None:
+                with self._index_lock:
+                    if self.store.delete_document(document_id):
+                        self._bump_index_version()
+            self.release_content_hash(document_id)
+            raise
+        finally:
+            pages.close()
+
+        if keep_layouts:
+            self.layouts[document_id] = text_layouts
+        return UploadResult(
+            document_id=document_id,
+            filename=pdf_path.name,
+            num_pages=num_pages,
+            num_chunks=num_chunks,
+        )
+
+    def delete_document(self, document_id: str) -> int:
+        """
+        Removes a document from the store (its chunk rows are marked deleted).
+        The FAISS vectors and chunk texts are compacted in the background by the store.
+
+        :return: Number of removed chunks (0 if the document is unknown).
+        """
+        with self._index_lock:
+            removed = self.store.delete_document(document_id)
+            if removed == 0:
+                return 0
+            self.layouts.pop(document_id, None)
+            self._bump_index_version()
+        self.release_content_hash(document_id)
+        if self.snapshot_dir is not None:
+            self.store.save(self.snapshot_dir)
+        return removed
+
+    def reindex(
+        self,
+        progress: Optional[ProgressCallback] = None,
+        results: Optional[List[UploadResult]] = None,
+    ) -> List[UploadResult]:
+        """
+        Re-chunks every document with the current chunk_size / chunk_overlap into a shadow
+        store and swaps it in at the end; queries are served from the old store until then.
+        Unchanged chunk texts are not re-embedded (the embedder's text-hash cache hits).
+        Documents uploaded or deleted while the re-index runs are reconciled before the swap.
+
+        :param progress: Optional callback(document_id, stage, done, total) for
+            "pages_parsed" (documents that have to be re-parsed) and "chunks_embedded".
+        :param results: Optional list the per-document results are appended to.
+        """
+        if results is None:
+            results = []
+
+        with self._reindex_lock:
+            chunk_size, chunk_overlap = self.chunk_size, self.chunk_overlap
+            old_store = self.store
+            shadow = FaissVectorStore(
+                index=create_index(old_store.index.d, old_store.index_config),
+                chunks=None,
+                embedder=old_store.embedder,
+                index_config=replace(old_store.index_config),
             )
-        # If we have new chunks, add them to the store and the pipeline's chunk list
-        if all_new_chunks:
-            # update store
-            self.store.add_chunks(all_new_chunks)
-            # keep for sources/debug
-            self.chunks.extend(all_new_chunks)
-
-        return results
\ No newline at end of file
+
+            def rechunk(document_id: str) -> None:
+                doc_progress = None
+                if progress is not None:
+                    doc_progress = lambda stage, done, total: progress(document_id, stage, done, total)
+                layouts = self._layouts_for(document_id, doc_progress)
+                if layouts is None:
+                    # PDF is gone: keep the existing chunks instead of losing the document
+                    doc_chunks = old_store.to_chunks(document_id)
+                    num_pages = len({c.page_id for c in doc_chunks})
+                else:
+                    with METRICS.time("chunk"):
+                        doc_chunks = chunk_layout_small2big_mod(
+                            document_id=document_id,
+                            layout_pages=layouts,
+                            chunk_size=chunk_size,
+                            overlap=chunk_overlap,
+                        )
+                    num_pages = len(layouts)
+                shadow.set_document_meta(document_id, **old_store.document_meta(document_id))
+                shadow.add_chunks(doc_chunks)
+                if doc_progress is not None:
+                    doc_progress("chunks_embedded", len(doc_chunks), len(doc_chunks))
+                results.append(
+                    UploadResult(
+                        document_id=document_id,
+                        filename=document_id,
+                        num_pages=num_pages,
+                        num_chunks=len(doc_chunks),
+                    )
+                )
+
+            done = set()
+            for document_id in old_store.document_ids():
+                rechunk(document_id)
+                done.add(document_id)
+
+            with self._index_lock:
+                # catch up with uploads and deletions that finished in the meantime
+                current = self.store.document_ids()
+                for document_id in current:
+                    if document_id not in done:
+                        rechunk(document_id)
+                for document_id in done.difference(current):
+                    shadow.delete_document(document_id)
+
+                shadow.set_search_params(
+                    nprobe=self.store.index_config.nprobe,
+                    ef_search=self.store.index_config.ef_search,
+                )
+                self.store = shadow
+                self._bump_index_version()
+
+        if self.snapshot_dir is not None:
+            self.store.save(self.snapshot_dir)
+
+        return results
+
+    def _layouts_for(
+        self,
+        document_id: str,
+        progress: Optional[StageProgress],
+        process_images: Optional[bool] = None,
+    ) -> Optional[List[PageLayout]]:
+        """
+        Preprocessed layouts of a document: from memory, from the layout cache, otherwise
+        re-parsed from its PDF (image captions come from the caption cache).
+        Only kept in memory if there is no layout cache. None if the PDF is not available.
+
+        :param process_images: The upload's image setting; defaults to the one recorded in
+            the store's document metadata.
+        """
+        layouts = self.layouts.get(document_id)
+        if layouts is not None:
+            return layouts
+        if self.raw_dir is None or not (self.raw_dir / document_id).exists():
+            return None
+        pdf_path = self.raw_dir / document_id
+
+        if process_images is None:
+            process_images = self.store.document_meta(document_id).get("process_images")
+        # unknown setting (no metadata recorded): reuse whichever variant is cached,
+        # otherwise parse like the upload default (with images)
+        candidates = (True, False) if process_images is None else (process_images,)
+        cache_key = None
+        if self.layout_cache is not None:
+            content_hash = self._document_hashes.get(document_id) or file_hash(pdf_path)
+            for candidate in candidates:
+                key = layout_cache_key(
+                    self.layout_cache,
+                    pdf_path,
+                    process_images=candidate,
+                    language="en",
+                    content_hash=content_hash,
+                )
+                if self.layout_cache.contains(key):
+                    cache_key = key
+                    process_images = candidate
+                    break
+        page_layouts = preprocess_pdf(
+            pdf_path,
+            language="en",
+            process_images=True if process_images is None else process_images,
+            progress=progress,
+            caption_cache=self.caption_cache,
+            layout_cache=self.layout_cache,
+            cache_key=cache_key,
+        )
+        # preprocessed pages carry no image bytes (the captions are text blocks)
+        if self.layout_cache is None:
+            self.layouts[document_id] = page_layouts
+        return page_layouts
+
+
+def _source_entry(rank: int, score: float, chunks: ChunkStore, vid: int) -> Dict[str, Any]:
+    """
+    One retrieved chunk (row `vid` of the chunk store) as returned to the frontend.
+    """
+    document_id = chunks.document_id(vid)
+    return {
+        "rank": rank,
+        "score": score,
+        "document_id": document_id,
+        "chunk_id": chunks.chunk_id(vid),
+        "chunk_index": chunks.chunk_index(vid),
+        "page_id": chunks.page_id(vid),
+        "content": chunks.content(vid),
+
+        # highlight info
+        "is_child_chunk": chunks.splited(vid),  # your field name
+        "parent_block_id": chunks.parent_block_id(vid),
+
+        # link (frontend will use it directly)
+        "document_url": f"/rag/documents/{document_id}",
+    }
+
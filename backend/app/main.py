@@ -1,15 +1,40 @@
-import faiss
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import numpy as np
 
 from app.api.routes_rag import router as rag_router
 from pathlib import Path
+from app.core.ingest_jobs import IngestJobQueue
 from app.core.rag_pipeline import RAGPipeline
 from app.models.embedder_loader import LMStudioEmbedder
-from app.utils.indexing import FaissVectorStore
+from app.models.reranker import CrossEncoderReranker
+from app.preprocessing.layout_cache import LayoutCache
+from app.preprocessing.pdf_preprocessor import shutdown_parse_pool
+from app.utils.answer_cache import AnswerCache
+from app.utils.caption_cache import CaptionCache
+from app.utils.embedding_cache import EmbeddingCache
+from app.utils.indexing import FaissVectorStore, IndexConfig, create_index
 from app.api import routes_rag
 
+# Snapshot-Verzeichnis des Vektorspeichers: backend/app/main.py -> parents[2] = repo root
+INDEX_DIR = Path(__file__).resolve().parents[2] / "data" / "index"
+# Persistenter Embedding-Cache (Modell + Text-Hash -> Vektor)
+EMBEDDING_CACHE_PATH = Path(__file__).resolve().parents[2] / "data" / "cache" / "embeddings.sqlite"
+# Persistenter Bildbeschreibungs-Cache (Bild-Hash + Modell + Sprache + Prompt-Version -> Caption)
+CAPTION_CACHE_PATH = Path(__file__).resolve().parents[2] / "data" / "cache" / "captions.sqlite"
+# Persistenter Layout-Cache (PDF-Hash + Vorverarbeitungsparameter -> vorverarbeitete Seiten)
+LAYOUT_CACHE_DIR = Path(__file__).resolve().parents[2] / "data" / "cache" / "layouts"
+# Semantischer Antwort-Cache: Ähnlichkeitsschwelle (Cosinus), Lebensdauer und Größe
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 1000
+# Hochgeladene PDFs (wie in routes_rag), werden beim Re-Index nach Einstellungsänderungen neu geparst
+RAW_DIR = Path(__file__).resolve().parents[2] / "data" / "raw"
+# FAISS-Indextyp pro Deployment (RAG_INDEX_KIND=flat|ivf_flat|ivf_pq|hnsw, RAG_INDEX_NPROBE, ...)
+INDEX_CONFIG = IndexConfig.from_env()
+# Anzahl paralleler Hintergrund-Uploads
+INGEST_WORKERS = 2
+
 # FastAPI-Instanz erstellen
 app = FastAPI(
     title="RAG Pipeline Backend",
@@ -38,22 +63,66 @@ app.include_router(rag_router, prefix="/rag", tags=["rag"])
 def read_root():
     return {"message": "RAG Pipeline Backend is running"}
 
-# Beim Start der API: RAG-Pipeline mit leerem FAISS-Index initialisieren
+# Beim Start der API: RAG-Pipeline aus dem Snapshot laden oder mit leerem FAISS-Index initialisieren
 @app.on_event("startup")
 def init_rag():
-    embedder = LMStudioEmbedder()
+    embedder = LMStudioEmbedder(cache=EmbeddingCache(EMBEDDING_CACHE_PATH))
+    caption_cache = CaptionCache(CAPTION_CACHE_PATH)
+    layout_cache = LayoutCache(LAYOUT_CACHE_DIR)
+    # optional cross-encoder (RAG_RERANK_MODEL=..., RAG_RERANK_BACKEND=torch|onnx)
+    reranker = CrossEncoderReranker.from_env()
+    answer_cache = AnswerCache(
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        threshold=ANSWER_CACHE_THRESHOLD,
+    )
+
+    # warm restart: open the persisted index memory-mapped instead of re-ingesting everything
+    if FaissVectorStore.snapshot_exists(INDEX_DIR):
+        vector_store = FaissVectorStore.load(
+            INDEX_DIR, embedder=embedder, mmap=True, index_config=INDEX_CONFIG
+        )
+        routes_rag.RAG_INSTANCE = RAGPipeline(
+            store=vector_store,
+            top_k=5,
+            snapshot_dir=INDEX_DIR,
+            caption_cache=caption_cache,
+            raw_dir=RAW_DIR,
+            layout_cache=layout_cache,
+            answer_cache=answer_cache,
+            reranker=reranker,
+        )
+        routes_rag.JOB_QUEUE = IngestJobQueue(routes_rag.RAG_INSTANCE, max_workers=INGEST_WORKERS)
+        print(
+            f"✅ RAG initialized from snapshot {INDEX_DIR}. "
+            f"FAISS dim={vector_store.index.d}, vectors={vector_store.index.ntotal}."
+        )
+        return
+
     # 1) probe embedding dim
     probe = embedder.embed_text("dim_probe")
     probe = np.asarray(probe, dtype="float32").reshape(1, -1)
     dim = probe.shape[1]
 
-    # 2) create EMPTY FAISS index
-    index = faiss.IndexFlatIP(dim)
+    # 2) create EMPTY FAISS index of the configured kind
+    index = create_index(dim, INDEX_CONFIG)
 
     # 3) create EMPTY store
-    vector_store = FaissVectorStore(index=index, metadata=[], embedder=embedder)
+    vector_store = FaissVectorStore(index=index, chunks=None, embedder=embedder, index_config=INDEX_CONFIG)
 
     # 4) register pipeline
-    routes_rag.RAG_INSTANCE = RAGPipeline(store=vector_store, top_k=5, chunks=[])
+    routes_rag.RAG_INSTANCE = RAGPipeline(
+        store=vector_store, top_k=5, snapshot_dir=INDEX_DIR, caption_cache=caption_cache,
+        raw_dir=RAW_DIR, layout_cache=layout_cache, answer_cache=answer_cache,
+        reranker=reranker,
+    )
+    routes_rag.JOB_QUEUE = IngestJobQueue(routes_rag.RAG_INSTANCE, max_workers=INGEST_WORKERS)
+
+    print(f"✅ RAG initialized (empty). FAISS dim={dim}, index={INDEX_CONFIG.kind}. Use /rag/upload to add PDFs.")
 
-    print(f"✅ RAG initialized (empty). FAISS dim={dim}. Use /rag/upload to add PDFs.")
+# Beim Beenden: laufende Hintergrund-Jobs nicht mehr annehmen, Parser-Prozesse beenden
+@app.on_event("shutdown")
+def shutdown_jobs():
+    if routes_rag.JOB_QUEUE is not None:
+        routes_rag.JOB_QUEUE.shutdown()
+    shutdown_parse_pool()
@@ -1,22 +1,37 @@
 from __future__ import annotations
 
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional, Tuple
 
+import httpx
 import numpy as np
 from openai import OpenAI
 
+from app.models.llm_client import LMSTUDIO_BASE_URL
+from app.utils.embedding_cache import EmbeddingCache
+
 
 EMBED_MODEL_ID = "text-embedding-nomic-embed-text-v1.5" # LM Studio embedding model
 
 
-def get_lmstudio_client() -> OpenAI:
+def get_lmstudio_client(max_connections: int = 10) -> OpenAI:
     """
     Creates and returns an OpenAI client configured to connect to the LM Studio API.
+    The underlying httpx client keeps a pool of up to `max_connections` connections,
+    so concurrent requests reuse connections instead of opening new ones.
     """
     client = OpenAI(
-        base_url="http://localhost:1234/v1",
+        base_url=LMSTUDIO_BASE_URL,
         api_key="lm-studio",  # LM 
+        max_retries=0,  # retries are handled per batch by LMStudioEmbedder
+        http_client=httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        ),
     )
     return client
 
@@ -24,6 +39,34 @@ def get_lmstudio_client() -> OpenAI:
 @dataclass
 class EmbeddingConfig:
     model: str = EMBED_MODEL_ID
+    # batching: a request holds at most this many texts / characters (~4 chars per token)
+    max_batch_size: int = 64
+    max_batch_chars: int = 32_000
+    # number of batches in flight at the same time
+    max_concurrency: int = 4
+    # retries per batch with exponential backoff (retry_backoff * 2**attempt seconds)
+    max_retries: int = 3
+    retry_backoff: float = 0.5
+
+
+def make_batches(texts: List[str], max_batch_size: int, max_batch_chars: int) -> List[Tuple[int, int]]:
+    """
+    Splits `texts` into consecutive (start, end) ranges so that every batch holds at most
+    `max_batch_size` texts and at most `max_batch_chars` characters.
+    A single text longer than the budget gets a batch of its own.
+    """
+    batches: List[Tuple[int, int]] = []
+    start = 0
+    chars = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_batch_size or chars + len(text) > max_batch_chars):
+            batches.append((start, i))
+            start = i
+            chars = 0
+        chars += len(text)
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
 
 
 class LMStudioEmbedder:
@@ -32,25 +75,78 @@ class LMStudioEmbedder:
     Uses the model 'text-embedding-nomic-embed-text-v1.5'.
     """
 
-    def __init__(self, config: EmbeddingConfig | None = None) -> None:
+    def __init__(
+        self,
+        config: EmbeddingConfig | None = None,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
         self.config = config or EmbeddingConfig()
-        self.client = get_lmstudio_client()
+        self.client = get_lmstudio_client(max_connections=self.config.max_concurrency)
+        # optional persistent cache; only misses are sent to the server
+        self.cache = cache
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Sends one embeddings request, retrying with exponential backoff on failure.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.client.embeddings.create(
+                    model=self.config.model,
+                    input=texts,
+                )
+                break
+            except Exception:
+                if attempt >= self.config.max_retries:
+                    raise
+                time.sleep(self.config.retry_backoff * (2 ** attempt))
+                attempt += 1
+
+        # the server may return the items out of order -> sort by their input index
+        items = sorted(response.data, key=lambda item: item.index)
+        return np.array([item.embedding for item in items], dtype="float32")
 
     def embed_texts(self, texts: List[str]) -> np.ndarray:
         """
         Embeds a list of texts and returns a NumPy array of shape (n_texts, dim).
+        If a cache is configured, cached vectors are reused and only misses are embedded.
         """
         if not texts:
             return np.zeros((0, 0), dtype="float32")
 
-        response = self.client.embeddings.create(
-            model=self.config.model,
-            input=texts,
-        )
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        cached = self.cache.get_many(self.config.model, texts)
+        miss_idx = [i for i, v in enumerate(cached) if v is None]
+        if not miss_idx:
+            return np.stack(cached).astype("float32", copy=False)
+
+        miss_texts = [texts[i] for i in miss_idx]
+        miss_vectors = self._embed_uncached(miss_texts)
+        self.cache.put_many(self.config.model, miss_texts, miss_vectors)
+
+        out = np.empty((len(texts), miss_vectors.shape[1]), dtype="float32")
+        for i, v in enumerate(cached):
+            if v is not None:
+                out[i] = v
+        out[miss_idx] = miss_vectors
+        return out
+
+    def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        """
+        Large inputs are split into size-bounded batches which are sent concurrently;
+        the result rows are in input order.
+        """
+        batches = make_batches(texts, self.config.max_batch_size, self.config.max_batch_chars)
+        if len(batches) == 1:
+            return self._embed_batch(texts)
+
+        with ThreadPoolExecutor(max_workers=self.config.max_concurrency) as pool:
+            results = list(pool.map(lambda b: self._embed_batch(texts[b[0]:b[1]]), batches))
 
-        # 
-        vectors = [item.embedding for item in response.data]
-        return np.array(vectors, dtype="float32")
+        return np.concatenate(results, axis=0)
 
     def embed_text(self, text: str) -> np.ndarray:
         """
@@ -1,16 +1,38 @@
 import base64
+import threading
+from typing import Optional
+
+import httpx
 from openai import OpenAI
 
-def get_lmstudio_client() -> OpenAI:
+from app.models.llm_client import LMSTUDIO_BASE_URL
+
+# Bump whenever the caption instructions change, so cached captions are regenerated
+PROMPT_VERSION = "v1"
+
+_CLIENT: Optional[OpenAI] = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_lmstudio_client(max_connections: int = 16) -> OpenAI:
     """
     Returns an OpenAI-compatible client that talks to LM Studio.
-    LM Studio must be running as a server on localhost:1234.
+    LM Studio must be running as a server on localhost:1234 (or at RAG_LMSTUDIO_URL).
+    The client (and its connection pool) is created once and shared by all caption calls.
     """
-    client = OpenAI(
-        base_url="http://localhost:1234/v1",
-        api_key="lm-studio",  # LM Studio doesn't use real API keys, but the client requires some value here.
-    )
-    return client
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = OpenAI(
+                base_url=LMSTUDIO_BASE_URL,
+                api_key="lm-studio",  # LM Studio doesn't use real API keys, but the client requires some value here.
+                http_client=httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_connections,
+                    ),
+                ),
+            )
+        return _CLIENT
 
 
 def _build_image_data_url(image_bytes: bytes, mime_type: str = "image/jpeg") -> str:
@@ -24,6 +46,7 @@ def _build_image_data_url(image_bytes: bytes, mime_type: str = "image/jpeg") ->
 def caption_image_with_qwen_vl(
     image_bytes: bytes,
     *,
+    mime_type: str = "image/jpeg",
     model: str = "qwen/qwen3-vl-4b",
     language: str = "en",
     max_tokens: int = 220,
@@ -33,6 +56,7 @@ def caption_image_with_qwen_vl(
 
     Args:
         image_bytes: Raw bytes of the image.
+        mime_type: MIME type of `image_bytes` (e.g. image/png).
         model: Model id in LM Studio.
         language: 'en' or 'de' language of the caption.
         max_tokens: Maximum tokens for the response.
@@ -41,7 +65,7 @@ def caption_image_with_qwen_vl(
         A text description of the image.
     """
     client = get_lmstudio_client()
-    image_data_url = _build_image_data_url(image_bytes)
+    image_data_url = _build_image_data_url(image_bytes, mime_type=mime_type)
 
     if language == "de":
         user_instruction = (
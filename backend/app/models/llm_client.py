@@ -1,15 +1,33 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+# OpenAI-compatible endpoint of LM Studio (or a stand-in, e.g. scripts/fake_lmstudio.py for benchmarks)
+LMSTUDIO_BASE_URL = os.environ.get("RAG_LMSTUDIO_URL", "http://localhost:1234/v1")
 
 def get_lmstudion_client() -> OpenAI:
     """
     Creates and returns an OpenAI client configured to connect to the LM Studio API.
     """
-    return OpenAI(base_url="http://localhost:1234/v1", api_key="") 
+    return OpenAI(base_url=LMSTUDIO_BASE_URL, api_key="") 
+
+def get_lmstudio_async_client(max_connections: int = 100) -> AsyncOpenAI:
+    """
+    Creates an async OpenAI client for LM Studio. Many concurrent requests share
+    one connection pool on the event loop instead of one worker thread each.
+    """
+    return AsyncOpenAI(
+        base_url=LMSTUDIO_BASE_URL,
+        api_key="",
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        ),
+    )
 
 @dataclass
 class LLMConfig:
@@ -20,19 +38,54 @@ class LLMConfig:
 class LMStudioChatLLM:
     def __init__(self, config: Optional[LLMConfig] = None) -> None:
         self.client = get_lmstudion_client()
+        self.async_client = get_lmstudio_async_client()
         self.config = config or LLMConfig()
 
     def chat(self, messages: List[Dict[str, str]]) -> str:
         """
         Sends a chat completion request to LM Studio and returns the response text.
         """
+        # read once: `config` may be replaced by RAGPipeline.apply_settings at any time
+        config = self.config
         response = self.client.chat.completions.create(
-            model=self.config.model,
+            model=config.model,
+            messages=messages,
+            temperature=config.temperature,
+            max_tokens=config.max_tokens,
+        )
+        return response.choices[0].message.content.strip()
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Async variant of `chat`.
+        """
+        config = self.config
+        response = await self.async_client.chat.completions.create(
+            model=config.model,
             messages=messages,
-            temperature=self.config.temperature,
-            max_tokens=self.config.max_tokens,
+            temperature=config.temperature,
+            max_tokens=config.max_tokens,
         )
         return response.choices[0].message.content.strip()
-    
+
+    async def astream_chat(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Streams the response text delta by delta as the model generates it.
+        """
+        config = self.config
+        stream = await self.async_client.chat.completions.create(
+            model=config.model,
+            messages=messages,
+            temperature=config.temperature,
+            max_tokens=config.max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
     def getName(self) -> str:
         return self.config.model
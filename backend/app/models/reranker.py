@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.embedding_cache import text_hash
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # optional: without it there is no reranking stage
+    CrossEncoder = None
+
+
+@dataclass
+class RerankerConfig:
+    """
+    Cross-encoder reranking on CPU.
+    - model: Hugging Face cross-encoder, empty = reranking disabled
+    - backend: "torch" or "onnx" (ONNX-exported model via sentence-transformers / onnxruntime)
+    - candidates: hits fetched from retrieval and rescored, the best top_k are kept
+    - time_budget_ms: scoring stops after the batch that exceeds the budget;
+      the unscored candidates keep their retrieval order behind the scored ones
+    """
+    model: str = ""
+    backend: str = "torch"
+    batch_size: int = 16
+    max_length: int = 512
+    candidates: int = 30
+    time_budget_ms: float = 300.0
+    cache_entries: int = 50_000
+
+    @classmethod
+    def from_env(cls) -> RerankerConfig:
+        """
+        Reads the configuration from RAG_RERANK_* environment variables,
+        e.g. RAG_RERANK_MODEL=cross-encoder/ms-marco-MiniLM-L-6-v2, RAG_RERANK_BACKEND=onnx.
+        """
+        defaults = cls()
+        values: Dict[str, Any] = {}
+        for name, default in asdict(defaults).items():
+            raw = os.environ.get(f"RAG_RERANK_{name.upper()}")
+            if raw is not None:
+                values[name] = type(default)(raw)
+        return cls(**values)
+
+
+class CrossEncoderReranker:
+    """
+    Rescores (query, chunk) pairs with a cross-encoder in batches.
+    Scores are cached per (query, chunk text), so repeated questions skip the model.
+    """
+
+    def __init__(self, config: RerankerConfig) -> None:
+        if CrossEncoder is None:
+            raise RuntimeError("sentence-transformers is required for reranking")
+        self.config = config
+        self.model = CrossEncoder(
+            config.model,
+            device="cpu",
+            max_length=config.max_length,
+            backend=config.backend,
+        )
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> Optional[CrossEncoderReranker]:
+        """
+        The reranker configured via RAG_RERANK_*, None if disabled or not loadable.
+        """
+        config = RerankerConfig.from_env()
+        if not config.model:
+            return None
+        try:
+            return cls(config)
+        except Exception as e:
+            print(f"⚠️ Reranker '{config.model}' not available ({e}); continuing without reranking.")
+            return None
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def _remember(self, scores: Dict[Tuple[str, str], float]) -> None:
+        with self._lock:
+            self._cache.update(scores)
+            while len(self._cache) > self.config.cache_entries:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, hits: List[Dict[str, Any]], texts: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Reorders retrieval hits (dicts with "score") by the cross-encoder score of their
+        chunk `texts` (same order as `hits`) and returns the best `top_k`.
+        Reranked hits get the new "score" and keep the original one as "retrieval_score".
+        """
+        started = time.perf_counter()
+        query_key = text_hash(query)
+        keys = [(query_key, text_hash(t)) for t in texts]
+        scores: List[Optional[float]] = [self._cached(k) for k in keys]
+
+        todo = [i for i, s in enumerate(scores) if s is None]
+        computed: Dict[Tuple[str, str], float] = {}
+        for start in range(0, len(todo), self.config.batch_size):
+            batch = todo[start:start + self.config.batch_size]
+            pairs = [(query, texts[i]) for i in batch]
+            for i, score in zip(batch, self.model.predict(pairs, batch_size=len(pairs))):
+                scores[i] = float(score)
+                computed[keys[i]] = float(score)
+            if (time.perf_counter() - started) * 1000 > self.config.time_budget_ms:
+                break
+        self._remember(computed)
+
+        scored = [i for i, s in enumerate(scores) if s is not None]
+        scored.sort(key=lambda i: scores[i], reverse=True)
+        unscored = [i for i, s in enumerate(scores) if s is None]
+        return [
+            {**hits[i], "score": scores[i], "retrieval_score": hits[i]["score"]} if scores[i] is not None else hits[i]
+            for i in (scored + unscored)[:top_k]
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Score cache hit/miss counters since process start and the number of cached scores.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from PIL import Image, UnidentifiedImageError
+
+
+@dataclass
+class ImagePrepConfig:
+    """
+    Limits for the image preparation before captioning.
+    - Bilder unterhalb der Mindestgrößen oder mit sehr niedriger Entropie
+      (Icons, Linien, einfarbige Flächen) werden verworfen
+    - alle anderen werden auf max_side Pixel verkleinert und neu kodiert
+    """
+    min_side_px: int = 48           # smaller width/height in pixels
+    min_area_px: int = 128 * 128    # width * height in pixels
+    min_bbox_area_pt: float = 40 * 40  # displayed area on the page in PDF points
+    max_aspect_ratio: float = 12.0  # rules and separators are extremely wide or tall
+    min_entropy: float = 2.5        # grayscale histogram entropy in bits
+    max_side: int = 1024            # longest side after downscaling
+    jpeg_quality: int = 85
+
+
+@dataclass
+class PreparedImage:
+    image_bytes: bytes
+    mime_type: str
+    width: int
+    height: int
+
+
+def _bbox_area(bbox: Any) -> Optional[float]:
+    """
+    Area of an (x0, y0, x1, y1) bbox, None if unknown.
+    """
+    try:
+        x0, y0, x1, y1 = bbox
+    except (TypeError, ValueError):
+        return None
+    return abs(x1 - x0) * abs(y1 - y0)
+
+
+def is_decorative(img: Image.Image, bbox: Any, config: ImagePrepConfig) -> bool:
+    """
+    Heuristic for images that are not worth a caption: tiny, thin or nearly uniform.
+    """
+    width, height = img.size
+    if min(width, height) < config.min_side_px or width * height < config.min_area_px:
+        return True
+    if max(width, height) / max(1, min(width, height)) > config.max_aspect_ratio:
+        return True
+    area = _bbox_area(bbox)
+    if area is not None and area < config.min_bbox_area_pt:
+        return True
+    # entropy on a small grayscale thumbnail is enough and cheap
+    thumb = img.convert("L")
+    thumb.thumbnail((256, 256))
+    return thumb.entropy() < config.min_entropy
+
+
+def prepare_image(
+    image_bytes: bytes,
+    bbox: Any = None,
+    config: Optional[ImagePrepConfig] = None,
+) -> Optional[PreparedImage]:
+    """
+    Drops decorative images (returns None) and downscales / re-encodes the rest:
+    images with transparency become PNG, everything else JPEG.
+    Undecodable images are dropped as well.
+    """
+    config = config or ImagePrepConfig()
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.load()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    if is_decorative(img, bbox, config):
+        return None
+
+    original_format = img.format
+    if max(img.size) > config.max_side:
+        img.thumbnail((config.max_side, config.max_side), Image.LANCZOS)
+    elif original_format in ("JPEG", "PNG"):
+        # already small and in a format the vision model accepts
+        return PreparedImage(
+            image_bytes=image_bytes,
+            mime_type=f"image/{original_format.lower()}",
+            width=img.width,
+            height=img.height,
+        )
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if has_alpha:
+        # an alpha channel that is fully opaque does not need PNG
+        has_alpha = img.convert("RGBA").getchannel("A").getextrema()[0] < 255
+    out = io.BytesIO()
+    if has_alpha:
+        img.convert("RGBA").save(out, format="PNG", optimize=True)
+        mime_type = "image/png"
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=config.jpeg_quality, optimize=True)
+        mime_type = "image/jpeg"
+
+    return PreparedImage(
+        image_bytes=out.getvalue(),
+        mime_type=mime_type,
+        width=img.width,
+        height=img.height,
+    )
+
+
+def mime_type_for_extension(ext: str) -> str:
+    """
+    MIME type for an image extension as reported by PyMuPDF's extract_image ("png", "jpeg", ...).
+    """
+    ext = ext.lower()
+    return {
+        "jpg": "image/jpeg",
+        "jpeg": "image/jpeg",
+        "jpx": "image/jp2",
+        "tif": "image/tiff",
+    }.get(ext, f"image/{ext}")
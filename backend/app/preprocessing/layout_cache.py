@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.preprocessing.pdf_preprocessor import PageLayout, TextBlock
+from app.utils.columnar import atomic_write, decode_str_column, encode_str_column
+
+# bumped when the on-disk format or the preprocessing output changes
+LAYOUT_CACHE_VERSION = 2
+
+_HASH_BLOCK = 1 << 20
+
+
+def file_hash(path: Path) -> str:
+    """
+    SHA-256 hex digest of a file's content.
+    """
+    h = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _bbox_rows(bboxes: List[Any]) -> np.ndarray:
+    """
+    (n, 4) float64 array of bboxes, NaN rows for unknown ones.
+    """
+    rows = np.full((len(bboxes), 4), np.nan, dtype="float64")
+    for i, bbox in enumerate(bboxes):
+        if bbox is not None:
+            rows[i] = bbox
+    return rows
+
+
+def _bbox_values(rows: np.ndarray) -> List[Any]:
+    """
+    Inverse of `_bbox_rows`.
+    """
+    return [None if np.isnan(r[0]) else tuple(r) for r in rows.tolist()]
+
+
+class LayoutCache:
+    """
+    Persistent cache of `preprocess_pdf` output, one entry per (PDF content, preprocessing parameters).
+    - <key>.npz: pages and text blocks column-wise (strings as UTF-8 buffer + offsets)
+    Only text is stored: preprocessed pages carry no images (their captions are text blocks).
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, pdf_path: Path, params: Dict[str, Any], content_hash: Optional[str] = None) -> str:
+        """
+        Cache key from the PDF content hash (computed from the file unless given) and the
+        preprocessing parameters.
+        """
+        payload = json.dumps(
+            {"version": LAYOUT_CACHE_VERSION, "pdf": content_hash or file_hash(pdf_path), "params": params},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.npz"
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[List[PageLayout]]:
+        """
+        Loads the cached layouts (None on a miss).
+        """
+        npz_path = self._path(key)
+        try:
+            data = np.load(npz_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with data:
+            page_numbers = data["page_numbers"].tolist()
+            pages = [PageLayout(page_number=n, text_blocks=[], images=[]) for n in page_numbers]
+
+            block_texts = decode_str_column(data["block_text__buffer"], data["block_text__offsets"])
+            block_types = decode_str_column(data["block_type__buffer"], data["block_type__offsets"])
+            for page_idx, page, bbox, text, block_type, wordcount in zip(
+                data["block_page_idx"].tolist(),
+                data["block_page"].tolist(),
+                _bbox_values(data["block_bbox"]),
+                block_texts,
+                block_types,
+                data["block_wordcount"].tolist(),
+            ):
+                pages[page_idx].text_blocks.append(
+                    TextBlock(
+                        page=page,
+                        bbox=bbox,
+                        text=text,
+                        # PyMuPDF block types are ints, caption blocks use names
+                        block_type=int(block_type) if block_type.isdigit() else block_type,
+                        wordcount=wordcount,
+                    )
+                )
+
+        with self._lock:
+            self.hits += 1
+        return pages
+
+    def put(self, key: str, layouts: List[PageLayout]) -> None:
+        """
+        Stores the layouts (text blocks only). Written atomically, so an entry only becomes
+        visible once it is complete.
+        """
+        blocks = [(i, b) for i, p in enumerate(layouts) for b in p.text_blocks]
+
+        columns: Dict[str, np.ndarray] = {
+            "page_numbers": np.fromiter((p.page_number for p in layouts), dtype="int32", count=len(layouts)),
+            "block_page_idx": np.fromiter((i for i, _ in blocks), dtype="int32", count=len(blocks)),
+            "block_page": np.fromiter((b.page for _, b in blocks), dtype="int32", count=len(blocks)),
+            "block_bbox": _bbox_rows([b.bbox for _, b in blocks]),
+            "block_wordcount": np.fromiter((b.wordcount for _, b in blocks), dtype="int32", count=len(blocks)),
+        }
+        for name, values in (
+            ("block_text", [b.text for _, b in blocks]),
+            ("block_type", [str(b.block_type) for _, b in blocks]),
+        ):
+            buffer, offsets = encode_str_column(values)
+            columns[f"{name}__buffer"] = buffer
+            columns[f"{name}__offsets"] = offsets
+
+        def write_columns(path: Path) -> None:
+            with path.open("wb") as f:
+                np.savez(f, **columns)
+
+        atomic_write(self._path(key), write_columns)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Hit/miss counters since process start.
+        """
+        return {"hits": self.hits, "misses": self.misses}
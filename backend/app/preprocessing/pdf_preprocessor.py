@@ -1,9 +1,46 @@
-from dataclasses import dataclass
+import mmap
+import multiprocessing
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import List, Dict, Any
-from app.models.image_captioner import caption_image_with_qwen_vl
+from typing import TYPE_CHECKING, Callable, Deque, Iterable, Iterator, List, Dict, Any, Optional, Set, Tuple
+from app.models.image_captioner import PROMPT_VERSION, caption_image_with_qwen_vl
+from app.preprocessing.image_preparation import ImagePrepConfig, mime_type_for_extension, prepare_image
+from app.utils.caption_cache import CaptionCache, image_hash
+from app.utils.metrics import METRICS, StageTotals
+from app.utils.streaming import batched
 import fitz  # PyMuPDF
 
+if TYPE_CHECKING:
+    from app.preprocessing.layout_cache import LayoutCache
+
+# progress(stage, done, total), e.g. ("pages_parsed", 3, 12)
+StageProgress = Callable[[str, int, int], None]
+
+# Parallel parsing: number of worker processes and minimum pages per shard
+PARSE_WORKERS = int(os.environ.get("RAG_PARSE_WORKERS", max(1, (os.cpu_count() or 1) - 1)))
+MIN_PAGES_PER_SHARD = 8
+
+# Streaming ingest: pages parsed ahead of the consumer (bounds memory per document),
+# and pages filtered / captioned together (images of a batch are captioned concurrently)
+PAGE_WINDOW = int(os.environ.get("RAG_PAGE_WINDOW", 32))
+PAGE_BATCH = 8
+
+# Image captioning: vision model and number of concurrent requests
+CAPTION_MODEL = "qwen/qwen3-vl-4b"
+CAPTION_CONCURRENCY = 4
+
+# Text blocks with fewer words are dropped as boilerplate (headers, page numbers, ...)
+MIN_BLOCK_WORDS = 20
+
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+_PARSE_POOL_WORKERS = 0
+_PARSE_POOL_LOCK = threading.Lock()
+
 @dataclass
 class TextBlock:
     page: int
@@ -18,6 +55,7 @@ class ImageRegion:
     page: int
     bbox: Any
     image_bytes: bytes
+    mime_type: str = "image/jpeg"
 
 @dataclass
 class PageLayout:
@@ -25,67 +63,226 @@ class PageLayout:
     text_blocks: List[TextBlock]
     images: List[ImageRegion]
 
-def analyze_pdf_layout(pdf_path: Path) -> List[PageLayout]:
+def _parse_page(doc: "fitz.Document", page_index: int) -> PageLayout:
     """
-    Uses PyMuPDF to read text blocks and images with bounding boxes.
+    Reads text blocks and images with bounding boxes from one page.
     """
-    doc = fitz.open(pdf_path)
-    layouts: List[PageLayout] = []
-
-    for page_index in range(len(doc)):
-        page = doc[page_index]
-        page_number = page_index + 1
-
-        # Text blocks
-        text_blocks: List[TextBlock] = []
-        for block in page.get_text("blocks"):
-            x0, y0, x1, y1, text, _ , block_type = block
-            cleaned = " ".join(text.split())
-            if cleaned.strip():
-                text_blocks.append(
-                    TextBlock(
-                        page=page_number,
-                        bbox=(x0, y0, x1, y1),
-                        text=cleaned,
-                        block_type=block_type,
-                        wordcount=len(cleaned.split()),
-                    )
-                )
-
-        # Images
-        image_regions: List[ImageRegion] = []
-        image_list = page.get_images(full=True)
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            # Image data
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            # Bounding box approximieren (nicht perfekt, aber ok für MVP)
-            # Optional: layout-Analyse verbessern
-            image_rects = page.get_image_rects(xref)
-            if not image_rects:
-                continue
-            rect = image_rects[0]
-            bbox = (rect.x0, rect.y0, rect.x1, rect.y1)
-
-            image_regions.append(
-                ImageRegion(
-                    id=f"page{page_number}_img{img_index}",
+    page = doc[page_index]
+    page_number = page_index + 1
+
+    # Text blocks
+    text_blocks: List[TextBlock] = []
+    for block in page.get_text("blocks"):
+        x0, y0, x1, y1, text, _ , block_type = block
+        cleaned = " ".join(text.split())
+        if cleaned.strip():
+            text_blocks.append(
+                TextBlock(
                     page=page_number,
-                    bbox=bbox,
-                    image_bytes=image_bytes,
+                    bbox=(x0, y0, x1, y1),
+                    text=cleaned,
+                    block_type=block_type,
+                    wordcount=len(cleaned.split()),
                 )
             )
 
-        layouts.append(
-            PageLayout(
-                page_number=page_number,
-                text_blocks=text_blocks,
-                images=image_regions,
+    # Images
+    image_regions: List[ImageRegion] = []
+    image_list = page.get_images(full=True)
+    for img_index, img in enumerate(image_list):
+        xref = img[0]
+        # Image data
+        base_image = doc.extract_image(xref)
+        image_bytes = base_image["image"]
+        mime_type = mime_type_for_extension(base_image.get("ext", "jpeg"))
+        # Bounding box approximieren (nicht perfekt, aber ok für MVP)
+        # Optional: layout-Analyse verbessern
+        image_rects = page.get_image_rects(xref)
+        if not image_rects:
+            continue
+        rect = image_rects[0]
+        bbox = (rect.x0, rect.y0, rect.x1, rect.y1)
+
+        image_regions.append(
+            ImageRegion(
+                id=f"page{page_number}_img{img_index}",
+                page=page_number,
+                bbox=bbox,
+                image_bytes=image_bytes,
+                mime_type=mime_type,
             )
         )
 
-    return layouts
+    return PageLayout(
+        page_number=page_number,
+        text_blocks=text_blocks,
+        images=image_regions,
+    )
+
+@contextmanager
+def open_pdf(pdf_path: Path) -> Iterator["fitz.Document"]:
+    """
+    Opens a PDF over a read-only memory map of the file: MuPDF reads the pages straight
+    from the OS page cache (which the upload just filled), without copying the file into
+    a Python buffer or reading it again. Empty files fall back to a normal open (which raises).
+    """
+    with open(pdf_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            mm = None
+        else:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm is None:
+        with fitz.open(pdf_path) as doc:
+            yield doc
+        return
+
+    view = memoryview(mm)
+    try:
+        doc = fitz.open(stream=view, filetype="pdf")
+        try:
+            yield doc
+        finally:
+            doc.close()
+            # the document keeps a reference to the buffer, drop it before unmapping
+            doc.stream = None
+    finally:
+        view.release()
+        mm.close()
+
+def _parse_page_range(pdf_path: str, start: int, end: int) -> List[PageLayout]:
+    """
+    Parses pages [start, end) of a PDF. Runs inside a worker process,
+    every worker opens (maps) the document itself.
+    """
+    with open_pdf(pdf_path) as doc:
+        return [_parse_page(doc, i) for i in range(start, end)]
+
+def _get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Lazily creates the process pool shared by all parse calls (and documents).
+    Uses "spawn", forking a multi-threaded server process is not safe.
+    """
+    global _PARSE_POOL, _PARSE_POOL_WORKERS
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None or _PARSE_POOL_WORKERS != workers:
+            if _PARSE_POOL is not None:
+                _PARSE_POOL.shutdown(wait=False)
+            _PARSE_POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _PARSE_POOL_WORKERS = workers
+        return _PARSE_POOL
+
+def shutdown_parse_pool() -> None:
+    """
+    Stops the parser worker processes (e.g. on server shutdown).
+    """
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is not None:
+            _PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+            _PARSE_POOL = None
+
+def analyze_pdf_layout(
+    pdf_path: Path,
+    progress: Optional[StageProgress] = None,
+    workers: Optional[int] = None,
+) -> List[PageLayout]:
+    """
+    Uses PyMuPDF to read text blocks and images with bounding boxes.
+    Large documents are split into page ranges that are parsed in parallel
+    by a pool of worker processes; the result is in page order.
+    Reports "pages_parsed" to `progress` after every page (or page range).
+
+    :param workers: Number of parser processes (default: PARSE_WORKERS). 1 = parse in this process.
+    """
+    with METRICS.time("parse"):
+        workers = PARSE_WORKERS if workers is None else max(1, workers)
+
+        with open_pdf(pdf_path) as doc:
+            n_pages = len(doc)
+            if workers == 1 or n_pages < 2 * MIN_PAGES_PER_SHARD:
+                layouts: List[PageLayout] = []
+                for page_index in range(n_pages):
+                    layouts.append(_parse_page(doc, page_index))
+                    if progress is not None:
+                        progress("pages_parsed", page_index + 1, n_pages)
+                return layouts
+
+        # several shards per worker, so uneven pages (scans vs. text) are balanced
+        n_shards = min(workers * 4, n_pages // MIN_PAGES_PER_SHARD)
+        bounds = [round(i * n_pages / n_shards) for i in range(n_shards + 1)]
+        pool = _get_parse_pool(workers)
+        futures = {
+            pool.submit(_parse_page_range, str(pdf_path), start, end): start
+            for start, end in zip(bounds[:-1], bounds[1:])
+        }
+
+        shards: Dict[int, List[PageLayout]] = {}
+        pages_done = 0
+        for future in as_completed(futures):
+            shard = future.result()
+            shards[futures[future]] = shard
+            pages_done += len(shard)
+            if progress is not None:
+                progress("pages_parsed", pages_done, n_pages)
+
+        return [page for start in sorted(shards) for page in shards[start]]
+
+def iter_pdf_layout(
+    pdf_path: Path,
+    progress: Optional[StageProgress] = None,
+    workers: Optional[int] = None,
+    window: int = PAGE_WINDOW,
+) -> Iterator[PageLayout]:
+    """
+    Streaming variant of `analyze_pdf_layout`: yields the pages in page order as they are parsed.
+    Page ranges go to the parser pool, but never more than `window` pages are parsed ahead of
+    the consumer, so memory (e.g. the raw image bytes) is bounded independent of the document size.
+    The "parse" metric is the time spent parsing / waiting for parsed pages, once per document.
+
+    :param workers: Number of parser processes (default: PARSE_WORKERS). 1 = parse in this process.
+    :param window: Maximum number of pages in flight.
+    """
+    workers = PARSE_WORKERS if workers is None else max(1, workers)
+    window = max(1, window)
+    totals = StageTotals(METRICS)
+    try:
+        with open_pdf(pdf_path) as doc:
+            n_pages = len(doc)
+            if workers == 1 or n_pages < 2 * MIN_PAGES_PER_SHARD:
+                for page_index in range(n_pages):
+                    with totals.time("parse"):
+                        page = _parse_page(doc, page_index)
+                    if progress is not None:
+                        progress("pages_parsed", page_index + 1, n_pages)
+                    yield page
+                return
+
+        # small enough ranges that the window keeps every worker busy
+        shard_pages = max(1, min(MIN_PAGES_PER_SHARD, window // workers))
+        max_in_flight = max(1, window // shard_pages)
+        ranges = deque((start, min(start + shard_pages, n_pages)) for start in range(0, n_pages, shard_pages))
+        pool = _get_parse_pool(workers)
+        pending: Deque[Future] = deque()
+        pages_done = 0
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < max_in_flight:
+                    start, end = ranges.popleft()
+                    pending.append(pool.submit(_parse_page_range, str(pdf_path), start, end))
+                with totals.time("parse"):
+                    shard = pending.popleft().result()
+                pages_done += len(shard)
+                if progress is not None:
+                    progress("pages_parsed", pages_done, n_pages)
+                yield from shard
+        finally:
+            for future in pending:
+                future.cancel()
+    finally:
+        totals.flush()
 
 def remove_unnecessary_elements( 
     layout_pages: List[PageLayout],
@@ -113,36 +310,96 @@ def remove_unnecessary_elements(
 
     return cleaned_pages
 
+def prepare_layout_images(
+    layout_pages: List[PageLayout],
+    config: Optional[ImagePrepConfig] = None,
+) -> List[PageLayout]:
+    """
+    Drops decorative images (icons, rules, logos, tiny images) from the layout and
+    downscales / re-encodes the remaining ones with the correct MIME type,
+    so only useful, bounded-size images are sent to the vision model.
+    """
+    for layout in layout_pages:
+        kept: List[ImageRegion] = []
+        for img in layout.images:
+            prepared = prepare_image(img.image_bytes, bbox=img.bbox, config=config)
+            if prepared is None:
+                continue
+            img.image_bytes = prepared.image_bytes
+            img.mime_type = prepared.mime_type
+            kept.append(img)
+        layout.images = kept
+    return layout_pages
+
 def generate_image_descriptions(
     images: List[ImageRegion],
     *,
     language: str = "en",
+    progress: Optional[StageProgress] = None,
+    cache: Optional[CaptionCache] = None,
+    max_concurrency: int = CAPTION_CONCURRENCY,
+    failed: Optional[Set[str]] = None,
 ) -> Dict[str, str]:
     """
     Generates a textual description for each image using LM Studio (e.g. qwen/qwen3-vl-4b).
+    Identical images (same content hash, e.g. logos) are captioned only once, cached captions
+    are reused, and the remaining images are captioned concurrently.
 
     Args:
         images: List of ImageRegion objects extracted from the PDF layout.
         language: 'en' or 'de' language of the generated captions.
+        progress: Optional callback, receives "images_captioned" after every image.
+        cache: Optional persistent caption cache.
+        max_concurrency: Number of caption requests in flight at the same time.
+        failed: Optional set, receives the ids of images whose caption failed
+            (they get a placeholder that must not be persisted).
 
     Returns:
         Mapping from image_id (ImageRegion.id) to description text.
     """
+    # group images by content hash -> every distinct image is captioned once
+    by_hash: Dict[str, List[ImageRegion]] = {}
+    for img in images:
+        by_hash.setdefault(image_hash(img.image_bytes), []).append(img)
+
     id_to_caption: Dict[str, str] = {}
 
-    for img in images:
+    def assign(h: str, caption: str) -> None:
+        for img in by_hash[h]:
+            id_to_caption[img.id] = caption
+        if progress is not None:
+            progress("images_captioned", len(id_to_caption), len(images))
+
+    todo: List[str] = []
+    for h in by_hash:
+        cached = cache.get(h, CAPTION_MODEL, language, PROMPT_VERSION) if cache is not None else None
+        if cached is not None:
+            assign(h, cached)
+        else:
+            todo.append(h)
+
+    def caption_one(h: str) -> Tuple[str, str, bool]:
         try:
             caption = caption_image_with_qwen_vl(
-                image_bytes=img.image_bytes,
-                model="qwen/qwen3-vl-4b",
+                image_bytes=by_hash[h][0].image_bytes,
+                mime_type=by_hash[h][0].mime_type,
+                model=CAPTION_MODEL,
                 language=language,
                 max_tokens=300,
             )
+            return h, caption, True
         except Exception as e:
-            # Fallback wenn etwas schiefgeht
-            caption = f"[Image description unavailable: {e}]"
-
-        id_to_caption[img.id] = caption
+            # Fallback wenn etwas schiefgeht (wird nicht gecacht)
+            return h, f"[Image description unavailable: {e}]", False
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            for h, caption, ok in pool.map(caption_one, todo):
+                if ok and cache is not None:
+                    cache.put(h, CAPTION_MODEL, language, PROMPT_VERSION, caption)
+                if not ok and failed is not None:
+                    failed.update(img.id for img in by_hash[h])
+                assign(h, caption)
 
     return id_to_caption
 
@@ -182,40 +439,162 @@ def merge_text_and_image_descriptions(
 
 
 
-def preprocess_pdf(
+def iter_preprocessed_pages(
     pdf_path: Path,
     process_images: bool = True,
     *,
     language: str = "en",
-) -> List[PageLayout]:
+    progress: Optional[StageProgress] = None,
+    layouts: Optional[Iterable[PageLayout]] = None,
+    caption_cache: Optional[CaptionCache] = None,
+    min_words: int = MIN_BLOCK_WORDS,
+    layout_cache: Optional["LayoutCache"] = None,
+    cache_key: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    batch_pages: int = PAGE_BATCH,
+) -> Iterator[PageLayout]:
     """
-    Full preprocessing pipeline for a PDF:
-    1) Layout detection (text blocks + images)
+    Streaming preprocessing pipeline for a PDF, batch of `batch_pages` pages by batch:
+    1) Layout detection (text blocks + images), pages parsed ahead within a bounded window
     2) Remove unnecessary/boilerplate text elements
-    3) Generate image descriptions via LM Studio
-    4) Merge text and image descriptions into a single text string
+    3) Drop decorative images, downscale the rest
+    4) Generate image descriptions via LM Studio
+    5) Merge text and image descriptions
+    Finished pages are yielded in page order without their image bytes (the captions are
+    text blocks by then), so only a window of pages is held in memory at a time.
+
+    With a `layout_cache` the pages are stored per PDF content + parameters once the document
+    is complete, and a repeated call for the same file loads them instead of parsing and
+    captioning again. Documents with a failed caption are not cached, so a vision-server
+    outage is retried next time. `cache_key` may be passed if the caller already computed it
+    via `layout_cache_key`, `content_hash` if the SHA-256 of the file is already known
+    (e.g. from the upload).
+    Stage metrics (clean, image_prep, caption) are recorded once per document.
     """
+    if layout_cache is not None:
+        if cache_key is None:
+            cache_key = layout_cache_key(
+                layout_cache,
+                pdf_path,
+                process_images=process_images,
+                language=language,
+                min_words=min_words,
+                content_hash=content_hash,
+            )
+        with METRICS.time("layout_cache_load"):
+            cached = layout_cache.get(cache_key)
+        if cached is not None:
+            if progress is not None:
+                progress("pages_parsed", len(cached), len(cached))
+            yield from cached
+            return
+
     # 1) Layout-Analyse
-    layouts = analyze_pdf_layout(pdf_path)
+    # (skipped if the caller already parsed the layout)
+    if layouts is None:
+        layouts = iter_pdf_layout(pdf_path, progress=progress)
+
+    totals = StageTotals(METRICS)
+    captioned = 0
+    # images whose caption failed: the pages carry placeholders, so the document is not cached
+    failed_captions: Set[str] = set()
+    # text-only copies of the finished pages, for the layout cache
+    finished: Optional[List[PageLayout]] = [] if layout_cache is not None else None
+    try:
+        for batch in batched(layouts, batch_pages):
+            # 2) Boilerplate entfernen
+            with totals.time("clean"):
+                batch = remove_unnecessary_elements(batch, min_words=min_words)
+
+            # 3) Dekorative Bilder verwerfen, den Rest verkleinern (nur wenn sie beschrieben werden)
+            if process_images:
+                with totals.time("image_prep"):
+                    batch = prepare_layout_images(batch)
+
+            # 4) Bildbeschreibungen erzeugen (progress counts over all batches so far)
+            batch_images = [img for layout in batch for img in layout.images]
+            image_captions: Dict[str, str] = {}
+            if process_images and batch_images:
+                batch_progress = None
+                if progress is not None:
+                    offset = captioned
+                    batch_progress = lambda stage, done, total: progress(stage, offset + done, offset + total)
+                with totals.time("caption"):
+                    image_captions = generate_image_descriptions(
+                        images=batch_images,
+                        language=language,
+                        progress=batch_progress,
+                        cache=caption_cache,
+                        failed=failed_captions,
+                    )
+                captioned += len(batch_images)
 
-    # 2) Boilerplate entfernen
-    cleaned_layouts = remove_unnecessary_elements(layouts, min_words=20)
+            # 5) Text und Bildbeschreibungen zusammenführen, Bilddaten freigeben
+            for layout in merge_text_and_image_descriptions(layout_pages=batch, image_captions=image_captions):
+                page = PageLayout(page_number=layout.page_number, text_blocks=layout.text_blocks, images=[])
+                if finished is not None:
+                    finished.append(page)
+                yield page
+    finally:
+        totals.flush()
 
-    # 3) Alle Bilder einsammeln
-    all_images: List[ImageRegion] = []
-    for layout in cleaned_layouts:
-        all_images.extend(layout.images)
+    if layout_cache is not None and not failed_captions:
+        layout_cache.put(cache_key, finished)
 
-    # 4) Bildbeschreibungen erzeugen
-    if process_images:
-        image_captions = generate_image_descriptions(
-            images=all_images,
+
+def preprocess_pdf(
+    pdf_path: Path,
+    process_images: bool = True,
+    *,
+    language: str = "en",
+    progress: Optional[StageProgress] = None,
+    layouts: Optional[List[PageLayout]] = None,
+    caption_cache: Optional[CaptionCache] = None,
+    min_words: int = MIN_BLOCK_WORDS,
+    layout_cache: Optional["LayoutCache"] = None,
+    cache_key: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> List[PageLayout]:
+    """
+    Full preprocessing pipeline for a PDF (see `iter_preprocessed_pages`), all pages as a list.
+    """
+    return list(
+        iter_preprocessed_pages(
+            pdf_path,
+            process_images,
             language=language,
+            progress=progress,
+            layouts=layouts,
+            caption_cache=caption_cache,
+            min_words=min_words,
+            layout_cache=layout_cache,
+            cache_key=cache_key,
+            content_hash=content_hash,
         )
-    else:
-        image_captions = {}
-    # 5) Text und Bildbeschreibungen zusammenführen
-    return merge_text_and_image_descriptions(
-        layout_pages=cleaned_layouts,
-        image_captions=image_captions,
     )
+
+
+def layout_cache_key(
+    layout_cache: "LayoutCache",
+    pdf_path: Path,
+    *,
+    process_images: bool,
+    language: str = "en",
+    min_words: int = MIN_BLOCK_WORDS,
+    content_hash: Optional[str] = None,
+) -> str:
+    """
+    Layout cache key for `preprocess_pdf` with these parameters. Captioning settings
+    (model, prompt version, image filter) only count when images are processed.
+    A known `content_hash` (SHA-256 of the PDF) saves hashing the file again.
+    """
+    params: Dict[str, Any] = {
+        "min_words": min_words,
+        "process_images": process_images,
+        "language": language,
+    }
+    if process_images:
+        params["caption_model"] = CAPTION_MODEL
+        params["prompt_version"] = PROMPT_VERSION
+        params["image_prep"] = asdict(ImagePrepConfig())
+    return layout_cache.key(pdf_path, params, content_hash=content_hash)
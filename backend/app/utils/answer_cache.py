@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+@dataclass
+class _Entry:
+    scope: str
+    embedding: np.ndarray  # L2-normalized query embedding
+    value: Dict[str, Any]
+    created_at: float
+
+
+class AnswerCache:
+    """
+    In-memory semantic cache for generated answers.
+    - Lookup: highest cosine similarity between the query embedding and cached queries
+      of the same scope (index version + pipeline settings), hit if >= `threshold`
+    - Entries expire after `ttl_seconds`; beyond `max_entries` the least recently used are evicted
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, threshold: float = 0.95) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        # scope -> (entry ids, stacked embeddings), rebuilt lazily after changes
+        self._matrices: Dict[str, tuple[list[int], np.ndarray]] = {}
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        v = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else v
+
+    def _matrix(self, scope: str) -> tuple[list[int], np.ndarray]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [i for i, e in self._entries.items() if e.scope == scope]
+            matrix = np.stack([self._entries[i].embedding for i in ids]) if ids else np.zeros((0, 0), "float32")
+            cached = self._matrices[scope] = (ids, matrix)
+        return cached
+
+    def get(self, scope: str, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        The cached answer of the most similar earlier query in `scope`, or None.
+        """
+        q = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            ids, matrix = self._matrix(scope)
+            best: Optional[int] = None
+            if ids and matrix.shape[1] == q.shape[0]:
+                sims = matrix @ q
+                for pos in np.argsort(-sims):
+                    if sims[pos] < self.threshold:
+                        break
+                    entry = self._entries[ids[pos]]
+                    if now - entry.created_at <= self.ttl_seconds:
+                        best = ids[pos]
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best].value
+
+    def put(self, scope: str, embedding: np.ndarray, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._entries[self._next_id] = _Entry(scope, self._normalize(embedding), value, now)
+            self._next_id += 1
+            self._matrices.pop(scope, None)
+            # expired entries first, then the least recently used
+            expired = [i for i, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+            for i in expired:
+                self._drop(i)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._matrices.pop(entry.scope, None)
+
+    def clear(self) -> None:
+        """
+        Drops all entries (e.g. after documents were added or removed).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Hit/miss counters since process start and the number of cached answers.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def image_hash(image_bytes: bytes) -> str:
+    """
+    SHA-256 hex digest of the raw image bytes.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class CaptionCache:
+    """
+    Persistent image caption cache backed by SQLite.
+    - Key: (image hash, vision model, language, prompt version)
+    - Value: caption text
+    A new prompt version or model invalidates old captions automatically.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS captions (
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                language TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                caption TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (image_hash, model, language, prompt_version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, image_hash: str, model: str, language: str, prompt_version: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT caption FROM captions "
+                "WHERE image_hash = ? AND model = ? AND language = ? AND prompt_version = ?",
+                (image_hash, model, language, prompt_version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, image_hash: str, model: str, language: str, prompt_version: str, caption: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captions "
+                "(image_hash, model, language, prompt_version, caption, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (image_hash, model, language, prompt_version, caption, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Hit/miss counters since process start.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
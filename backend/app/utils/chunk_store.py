@@ -0,0 +1,515 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.chunker import TextChunk
+from app.utils.columnar import decode_str_column, encode_str_column
+
+# Zahlen-Spalten des Chunk-Speichers (eine Zeile pro Chunk, Zeilen-ID = Vektor-ID)
+_NUM_COLUMNS = {
+    "doc_code": "int32",        # index into the document name table
+    "type_code": "int8",        # index into the block type table
+    "page_id": "int32",
+    "parent_block_id": "int64",
+    "chunk_index": "int64",
+    "wordcount": "int32",
+    "splited": "bool",
+    "alive": "bool",
+    "block_start": "int64",     # first row of the chunk's parent block
+    "block_next": "int64",      # next row of the parent block in chunk order (-1 = last)
+}
+
+_INITIAL_CAPACITY = 1024
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """
+    Restricts a search to chunks matching all given conditions (None = no restriction).
+    Page bounds are inclusive; block types are "text" and "figure_description".
+    """
+    document_ids: Optional[frozenset[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    block_types: Optional[frozenset[str]] = None
+
+    @classmethod
+    def create(
+        cls,
+        document_ids: Optional[Iterable[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+        block_types: Optional[Iterable[str]] = None,
+    ) -> Optional[SearchFilter]:
+        """
+        Builds a filter from plain values; None if nothing is restricted.
+        """
+        f = cls(
+            document_ids=frozenset(document_ids) if document_ids is not None else None,
+            page_from=page_from,
+            page_to=page_to,
+            block_types=frozenset(block_types) if block_types is not None else None,
+        )
+        return None if f == cls() else f
+
+
+@dataclass
+class _TextCapture:
+    buffer: bytes
+    offsets: np.ndarray
+    keep: np.ndarray
+
+
+def _compact_text(capture: _TextCapture) -> Tuple[bytearray, np.ndarray, int]:
+    """
+    (buffer, offsets, rows) of a captured text column without the text of the rows
+    where `keep` is False, gathered in one vectorized copy.
+    """
+    offsets = capture.offsets
+    n = len(offsets) - 1
+    starts, ends = offsets[:n], offsets[1:]
+    lengths = np.where(capture.keep, ends - starts, 0)
+    new_offsets = np.zeros(n + 1, dtype="int64")
+    np.cumsum(lengths, out=new_offsets[1:])
+    src = np.frombuffer(capture.buffer, dtype=np.uint8)
+    # byte i of the new buffer comes from src[i + shift of its row]
+    shift = np.repeat(starts - new_offsets[:n], lengths)
+    new_buffer = bytearray(src[np.arange(int(new_offsets[n]), dtype="int64") + shift].tobytes())
+    return new_buffer, new_offsets, n
+
+
+class _TextColumn:
+    """
+    Append-only string column: one UTF-8 buffer plus int64 offsets
+    (offsets[i]:offsets[i+1] is row i). Readers take (buffer, offsets) in one
+    attribute read, so a concurrent append or compaction never mixes two versions.
+    """
+
+    def __init__(self) -> None:
+        self.data: Tuple[bytearray, np.ndarray] = (bytearray(), np.zeros(1, dtype="int64"))
+        self._size = 0  # rows in use; offsets has spare capacity behind them
+
+    def get(self, row: int) -> str:
+        buffer, offsets = self.data
+        return buffer[offsets[row]:offsets[row + 1]].decode("utf-8")
+
+    def append(self, values: Sequence[str], rows: Sequence[int]) -> None:
+        """
+        Appends values for the (increasing, new) `rows`; skipped rows become empty strings.
+        """
+        buffer, offsets = self.data
+        last = int(rows[-1]) + 1 if len(rows) else self._size
+        if last + 1 > len(offsets):
+            grown = np.zeros(max(last + 1, 2 * len(offsets)), dtype="int64")
+            grown[: self._size + 1] = offsets[: self._size + 1]
+            offsets = grown
+        end = int(offsets[self._size])
+        prev = self._size
+        for row, value in zip(rows, values):
+            offsets[prev + 1: row + 1] = end  # empty skipped rows
+            encoded = value.encode("utf-8")
+            buffer.extend(encoded)
+            end += len(encoded)
+            offsets[row + 1] = end
+            prev = row + 1
+        offsets[prev + 1: last + 1] = end
+        self._size = last
+        self.data = (buffer, offsets)
+
+    def compact(self, keep: np.ndarray) -> None:
+        """
+        Drops the text of all rows where `keep` is False (the rows stay, as empty strings).
+        """
+        self.apply_compaction(_compact_text(self.capture(keep)))
+
+    def capture(self, keep: np.ndarray) -> _TextCapture:
+        """
+        Copies what a compaction needs (one buffer copy, no per-row work); `_compact_text`
+        then builds the compacted column without any lock.
+        """
+        buffer, offsets = self.data
+        n = min(self._size, len(keep))
+        return _TextCapture(bytes(buffer[: offsets[n]]), offsets[: n + 1].copy(), keep[:n])
+
+    def apply_compaction(self, compacted: Tuple[bytearray, np.ndarray, int]) -> None:
+        """
+        Swaps in a compacted column (`_compact_text`), plus the rows appended since (O(appended)).
+        """
+        new_buffer, new_offsets, n = compacted
+        buffer, offsets = self.data
+        size = self._size
+        if size > n:
+            grown = np.zeros(max(len(offsets), size + 1), dtype="int64")
+            grown[: n + 1] = new_offsets[: n + 1]
+            new_offsets = grown
+            new_buffer.extend(buffer[offsets[n]:offsets[size]])
+            new_offsets[n + 1: size + 1] = offsets[n + 1: size + 1] - offsets[n] + new_offsets[n]
+        elif len(new_offsets) < len(offsets):
+            grown = np.zeros(len(offsets), dtype="int64")
+            grown[: n + 1] = new_offsets[: n + 1]
+            new_offsets = grown
+        self.data = (new_buffer, new_offsets)
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        buffer, offsets = self.data
+        return np.frombuffer(bytes(buffer), dtype="uint8"), offsets[: self._size + 1].copy()
+
+    @classmethod
+    def from_arrays(cls, buffer: np.ndarray, offsets: np.ndarray) -> _TextColumn:
+        column = cls()
+        column.data = (bytearray(buffer.tobytes()), offsets.astype("int64"))
+        column._size = len(offsets) - 1
+        return column
+
+
+@dataclass
+class ChunkCompaction:
+    """
+    A compaction of a ChunkStore's text columns (see `ChunkStore.compacted`).
+    """
+    content: _TextCapture
+    chunk_ids: _TextCapture
+    num_dead: int
+    content_built: Optional[Tuple[bytearray, np.ndarray, int]] = None
+    chunk_ids_built: Optional[Tuple[bytearray, np.ndarray, int]] = None
+
+    def build(self) -> None:
+        self.content_built = _compact_text(self.content)
+        self.chunk_ids_built = _compact_text(self.chunk_ids)
+
+
+class ChunkStore:
+    """
+    Columnar store of all chunks, shared by the vector store and the pipeline.
+    - Zeilen-ID = Vektor-ID (FAISS und BM25); Zeilen werden nur angehängt, nie verschoben
+    - Zahlenfelder als NumPy-Spalten, Dokument-IDs und Block-Typen als Codes in kleine Tabellen
+    - Chunk-Texte und Chunk-IDs je als ein UTF-8-Puffer + Offsets
+    - Löschen markiert Zeilen als tot; `compact` gibt den Text toter Zeilen frei
+    Writers must be serialized by the caller (the vector store's lock); reads need no lock.
+    """
+
+    def __init__(self) -> None:
+        self._size = 0
+        self._num_live = 0
+        self._cols: Dict[str, np.ndarray] = {
+            name: np.zeros(_INITIAL_CAPACITY, dtype=dtype) for name, dtype in _NUM_COLUMNS.items()
+        }
+        self._content = _TextColumn()
+        self._chunk_ids = _TextColumn()
+        self._doc_names: List[str] = []
+        self._doc_codes: Dict[str, int] = {}
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        # document_id -> (start, end) row ranges; documents ingested in parallel interleave,
+        # so a document usually has several ranges
+        self._doc_rows: Dict[str, List[Tuple[int, int]]] = {}
+        # doc_code -> last row appended for the document (its parent block may continue in the next add)
+        self._doc_tail: Dict[int, int] = {}
+        self._dead_text = 0  # rows deleted since the last compaction
+
+    @property
+    def num_rows(self) -> int:
+        """
+        Rows ever appended (live and deleted); the next row id.
+        """
+        return self._size
+
+    def __len__(self) -> int:
+        """
+        Number of live chunks.
+        """
+        return self._num_live
+
+    @staticmethod
+    def _code(value: str, names: List[str], codes: Dict[str, int]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self._cols["alive"])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        grown: Dict[str, np.ndarray] = {}
+        for name, values in self._cols.items():
+            column = np.zeros(capacity, dtype=values.dtype)
+            column[: self._size] = values[: self._size]
+            grown[name] = column
+        self._cols = grown
+
+    def add(self, chunks: Sequence[TextChunk]) -> np.ndarray:
+        """
+        Appends chunks as new rows and returns their row ids (increasing, never reused).
+        The chunks of one parent block must be consecutive within the document (as the chunker
+        emits them); a block may be split over several calls (streamed batches), also with chunks of
+        other documents added in between: it continues the document's last block.
+        """
+        rows = np.arange(self._size, self._size + len(chunks), dtype="int64")
+        self._append(chunks, rows)
+        return rows
+
+    def _append(self, chunks: Sequence[TextChunk], rows: np.ndarray) -> None:
+        """
+        Writes `chunks` at the given increasing `rows` (>= num_rows); skipped rows stay dead.
+        """
+        if len(chunks) == 0:
+            return
+        end = int(rows[-1]) + 1
+        self._reserve(end)
+        cols = self._cols
+        n = len(chunks)
+        doc_code = np.fromiter(
+            (self._code(c.document_id, self._doc_names, self._doc_codes) for c in chunks), "int32", n
+        )
+        parent = np.fromiter((c.parent_block_id for c in chunks), "int64", n)
+        cols["doc_code"][rows] = doc_code
+        cols["type_code"][rows] = np.fromiter(
+            (self._code(c.block_type, self._type_names, self._type_codes) for c in chunks), "int8", n
+        )
+        cols["page_id"][rows] = np.fromiter((c.page_id for c in chunks), "int32", n)
+        cols["parent_block_id"][rows] = parent
+        cols["chunk_index"][rows] = np.fromiter((c.chunk_index for c in chunks), "int64", n)
+        cols["wordcount"][rows] = np.fromiter((c.wordcount for c in chunks), "int32", n)
+        cols["splited"][rows] = np.fromiter((bool(c.splited) for c in chunks), "bool", n)
+
+        # parent blocks = consecutive chunks of a document with the same parent block; chunks of
+        # different documents may alternate (one batch per document, or a mixed batch)
+        block_start = rows.copy()
+        block_next = np.full(n, -1, dtype="int64")
+        # (previous row, first row of the block) a block continues from, taken from an earlier add
+        continued: List[Tuple[int, int]] = []
+        tails: Dict[int, int] = {}  # doc_code -> index into `chunks` of the document's last chunk
+        for i in range(n):
+            code = int(doc_code[i])
+            j = tails.get(code)
+            if j is not None:
+                if parent[j] == parent[i]:
+                    block_start[i] = block_start[j]
+                    block_next[j] = rows[i]
+            else:
+                prev = self._doc_tail.get(code)
+                if (
+                    prev is not None
+                    and bool(cols["alive"][prev])
+                    and int(cols["parent_block_id"][prev]) == int(parent[i])
+                ):
+                    block_start[i] = cols["block_start"][prev]
+                    continued.append((prev, int(rows[i])))
+            tails[code] = i
+        cols["block_start"][rows] = block_start
+        cols["block_next"][rows] = block_next
+
+        self._content.append([c.content for c in chunks], rows)
+        self._chunk_ids.append([c.id for c in chunks], rows)
+
+        # link continued blocks once the new rows have text, so readers see the whole block or the old part
+        for prev, first in continued:
+            cols["block_next"][prev] = first
+        for code, i in tails.items():
+            self._doc_tail[code] = int(rows[i])
+
+        # document ranges, one per run of consecutive rows of the same document
+        doc_run = np.ones(n, dtype=bool)
+        doc_run[1:] = (doc_code[1:] != doc_code[:-1]) | (np.diff(rows) != 1)
+        starts = np.flatnonzero(doc_run)
+        for start, stop in zip(starts.tolist(), np.append(starts[1:], n).tolist()):
+            ranges = self._doc_rows.setdefault(self._doc_names[doc_code[start]], [])
+            first, last = int(rows[start]), int(rows[stop - 1]) + 1
+            if ranges and ranges[-1][1] == first:
+                ranges[-1] = (ranges[-1][0], last)
+            else:
+                ranges.append((first, last))
+
+        # publish last: readers only look at rows marked alive
+        cols["alive"][rows] = True
+        self._num_live += n
+        self._size = end
+
+    def remove_document(self, document_id: str) -> np.ndarray:
+        """
+        Marks all rows of a document as deleted and returns their row ids.
+        """
+        ranges = self._doc_rows.pop(document_id, [])
+        code = self._doc_codes.get(document_id)
+        if code is not None:
+            self._doc_tail.pop(code, None)
+        if not ranges:
+            return np.zeros(0, dtype="int64")
+        rows = np.concatenate([np.arange(start, stop, dtype="int64") for start, stop in ranges])
+        rows = rows[self._cols["alive"][rows]]
+        self._cols["alive"][rows] = False
+        self._num_live -= len(rows)
+        self._dead_text += len(rows)
+        return rows
+
+    def compact(self) -> None:
+        """
+        Frees the text of deleted rows (the row ids stay reserved).
+        """
+        if self._dead_text == 0:
+            return
+        compaction = self.compacted()
+        compaction.build()
+        self.apply_compaction(compaction)
+
+    def compacted(self) -> ChunkCompaction:
+        """
+        Captures the text columns for a compaction (the caller holds a read lock);
+        `ChunkCompaction.build` drops the text of the rows deleted so far without any lock,
+        writers may append and delete meanwhile until `apply_compaction`.
+        """
+        keep = self._cols["alive"][: self._size].copy()
+        return ChunkCompaction(
+            content=self._content.capture(keep),
+            chunk_ids=self._chunk_ids.capture(keep),
+            num_dead=self._dead_text,
+        )
+
+    def apply_compaction(self, compaction: ChunkCompaction) -> None:
+        """
+        Swaps in the built text columns; rows deleted since keep their text until the next compaction.
+        """
+        self._content.apply_compaction(compaction.content_built)
+        self._chunk_ids.apply_compaction(compaction.chunk_ids_built)
+        self._dead_text -= compaction.num_dead
+
+    def is_alive(self, row: int) -> bool:
+        return 0 <= row < self._size and bool(self._cols["alive"][row])
+
+    def content(self, row: int) -> str:
+        return self._content.get(row)
+
+    def chunk_id(self, row: int) -> str:
+        return self._chunk_ids.get(row)
+
+    def document_id(self, row: int) -> str:
+        return self._doc_names[self._cols["doc_code"][row]]
+
+    def block_type(self, row: int) -> str:
+        return self._type_names[self._cols["type_code"][row]]
+
+    def page_id(self, row: int) -> int:
+        return int(self._cols["page_id"][row])
+
+    def parent_block_id(self, row: int) -> int:
+        return int(self._cols["parent_block_id"][row])
+
+    def chunk_index(self, row: int) -> int:
+        return int(self._cols["chunk_index"][row])
+
+    def splited(self, row: int) -> bool:
+        return bool(self._cols["splited"][row])
+
+    def block_rows(self, row: int) -> np.ndarray:
+        """
+        Rows of the row's parent block in chunk order (small2big expansion).
+        """
+        block_next = self._cols["block_next"]
+        rows = [int(self._cols["block_start"][row])]
+        while (nxt := int(block_next[rows[-1]])) >= 0:
+            rows.append(nxt)
+        return np.array(rows, dtype="int64")
+
+    def chunk(self, row: int) -> TextChunk:
+        """
+        The row as a TextChunk (e.g. to re-insert it into another store).
+        """
+        return TextChunk(
+            id=self.chunk_id(row),
+            document_id=self.document_id(row),
+            page_id=self.page_id(row),
+            parent_block_id=self.parent_block_id(row),
+            chunk_index=self.chunk_index(row),
+            content=self.content(row),
+            splited=self.splited(row),
+            wordcount=int(self._cols["wordcount"][row]),
+            block_type=self.block_type(row),
+        )
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._cols["alive"][: self._size]).astype("int64")
+
+    def document_ids(self) -> List[str]:
+        """
+        All documents that currently have chunks.
+        """
+        return list(self._doc_rows)
+
+    def document_rows(self, document_id: str) -> np.ndarray:
+        ranges = self._doc_rows.get(document_id, [])
+        if not ranges:
+            return np.zeros(0, dtype="int64")
+        return np.concatenate([np.arange(start, stop, dtype="int64") for start, stop in ranges])
+
+    def filter_rows(self, search_filter: SearchFilter) -> np.ndarray:
+        """
+        Sorted ids of the live rows matching `search_filter`, evaluated on the columns.
+        A document filter only looks at the rows of those documents.
+        """
+        size = self._size
+        cols = self._cols
+        if search_filter.document_ids is not None:
+            parts = [self.document_rows(doc) for doc in search_filter.document_ids]
+            rows = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype="int64")
+        else:
+            rows = np.arange(size, dtype="int64")
+        mask = cols["alive"][rows]
+        if search_filter.page_from is not None:
+            mask &= cols["page_id"][rows] >= search_filter.page_from
+        if search_filter.page_to is not None:
+            mask &= cols["page_id"][rows] <= search_filter.page_to
+        if search_filter.block_types is not None:
+            codes = [self._type_codes[t] for t in search_filter.block_types if t in self._type_codes]
+            mask &= np.isin(cols["type_code"][rows], codes)
+        return rows[mask]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        All columns as arrays (for the store snapshot); name tables as UTF-8 buffer + offsets.
+        """
+        arrays = {name: values[: self._size].copy() for name, values in self._cols.items()}
+        for name, column in (("content", self._content), ("chunk_id", self._chunk_ids)):
+            arrays[f"{name}__buffer"], arrays[f"{name}__offsets"] = column.to_arrays()
+        for name, table in (("doc_names", self._doc_names), ("type_names", self._type_names)):
+            arrays[f"{name}__buffer"], arrays[f"{name}__offsets"] = encode_str_column(table)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data: Dict[str, np.ndarray]) -> ChunkStore:
+        """
+        Inverse of `to_arrays`.
+        """
+        store = cls()
+        size = len(data["alive"])
+        store._reserve(size)
+        for name, dtype in _NUM_COLUMNS.items():
+            store._cols[name][:size] = data[name].astype(dtype, copy=False)
+        store._size = size
+        store._content = _TextColumn.from_arrays(data["content__buffer"], data["content__offsets"])
+        store._chunk_ids = _TextColumn.from_arrays(data["chunk_id__buffer"], data["chunk_id__offsets"])
+        store._doc_names = decode_str_column(data["doc_names__buffer"], data["doc_names__offsets"])
+        store._doc_codes = {name: code for code, name in enumerate(store._doc_names)}
+        store._type_names = decode_str_column(data["type_names__buffer"], data["type_names__offsets"])
+        store._type_codes = {name: code for code, name in enumerate(store._type_names)}
+
+        alive = store._cols["alive"][:size]
+        store._num_live = int(alive.sum())
+        rows = np.flatnonzero(alive)
+        if len(rows):
+            doc_code = store._cols["doc_code"][rows]
+            new_range = np.ones(len(rows), dtype=bool)
+            new_range[1:] = (doc_code[1:] != doc_code[:-1]) | (np.diff(rows) != 1)
+            starts = np.flatnonzero(new_range)
+            for start, stop in zip(starts.tolist(), np.append(starts[1:], len(rows)).tolist()):
+                name = store._doc_names[doc_code[start]]
+                store._doc_rows.setdefault(name, []).append((int(rows[start]), int(rows[stop - 1]) + 1))
+                store._doc_tail[int(doc_code[start])] = int(rows[stop - 1])
+        # text of deleted rows is still in the buffers until the next compaction
+        store._dead_text = size - store._num_live
+        return store
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import Iterable, Iterator, List
 
 from app.preprocessing.pdf_preprocessor import PageLayout
 
@@ -13,6 +13,14 @@ class TextChunk:
     content: str
     splited: bool
     wordcount: int
+    block_type: str = "text"  # "text" or "figure_description" (image caption)
+
+
+def _chunk_block_type(block_type) -> str:
+    """
+    Chunk-level block type: image captions stay "figure_description", everything else is "text".
+    """
+    return "figure_description" if block_type == "figure_description" else "text"
 
 
 def chunk_layout_small2big_mod(
@@ -21,6 +29,18 @@ def chunk_layout_small2big_mod(
     chunk_size: int = 50,  # Target words per chunk
     overlap: int = 10       # Words of overlap
 ) -> List[TextChunk]:
+    """
+    All chunks of a document as a list (see `iter_chunks_small2big_mod`).
+    """
+    return list(iter_chunks_small2big_mod(document_id, layout_pages, chunk_size=chunk_size, overlap=overlap))
+
+
+def iter_chunks_small2big_mod(
+    document_id: str,
+    layout_pages: Iterable[PageLayout],
+    chunk_size: int = 50,  # Target words per chunk
+    overlap: int = 10       # Words of overlap
+) -> Iterator[TextChunk]:
     """
     Chunks text blocks from layout pages using a hybrid strategy:
     - If a block is significantly larger than the target chunk size, it will be split into multiple chunks parents and children (METHOD A).
@@ -28,16 +48,15 @@ def chunk_layout_small2big_mod(
     
     :param document_id: Unique identifier for the document
     :type document_id: str
-    :param layout_pages: List of PageLayout objects representing the document's layout
-    :type layout_pages: List[PageLayout]
+    :param layout_pages: PageLayout objects in page order (consumed lazily, e.g. while later pages are still parsed)
+    :type layout_pages: Iterable[PageLayout]
     :param chunk_size: Target number of words per chunk
     :type chunk_size: int
     :param overlap: Number of words to overlap between chunks
     :type overlap: int
-    :return: List of TextChunk objects representing the chunked text blocks
-    :rtype: List[TextChunk]
+    :return: TextChunk objects representing the chunked text blocks, page by page
+    :rtype: Iterator[TextChunk]
     """
-    chunks: List[TextChunk] = []
     global_chunk_index = 0
     for page in layout_pages:
         for blk_idx, block in enumerate(page.text_blocks):
@@ -60,7 +79,7 @@ def chunk_layout_small2big_mod(
                     
                     # Create Chunk
                     unique_id = f"{document_id}-p{page.page_number}-b{blk_idx}-s{sub_chunk_id}"
-                    chunks.append(TextChunk(
+                    yield TextChunk(
                         id=unique_id,
                         document_id=document_id,
                         page_id=page.page_number,
@@ -68,8 +87,9 @@ def chunk_layout_small2big_mod(
                         chunk_index=global_chunk_index,
                         content=chunk_text,
                         splited=True, # Mark as child of a parent block
-                        wordcount=len(chunk_words)
-                    ))
+                        wordcount=len(chunk_words),
+                        block_type=_chunk_block_type(block.block_type),
+                    )
                     global_chunk_index += 1
                     # Move pointer, but backstep for overlap
                     current_idx += (chunk_size - overlap)
@@ -82,7 +102,7 @@ def chunk_layout_small2big_mod(
             # METHOD B: WINDOW RETRIEVAL (Small Blocks)
             else:
                 unique_id = f"{document_id}-p{page.page_number}-b{blk_idx}"
-                chunks.append(TextChunk(
+                yield TextChunk(
                     id=unique_id,
                     document_id=document_id,
                     page_id=page.page_number,
@@ -90,41 +110,9 @@ def chunk_layout_small2big_mod(
                     chunk_index=global_chunk_index,
                     content=block.text,
                     splited=False, # Mark as standalone/contextual
-                    wordcount=wordcount
-                ))
+                    wordcount=wordcount,
+                    block_type=_chunk_block_type(block.block_type),
+                )
                 global_chunk_index += 1
-    return chunks
-
-def expand_chunk_small2big_mod(
-    hit: TextChunk,
-    chunks: List[TextChunk],
-) -> List[TextChunk]:
-    """
-    Expands a hit chunk to include more context based on its type:
-    - If the hit chunk is a child of a split block (METHOD A), 
-        it retrieves all sibling chunks that belong to the same parent block,
-        effectively reconstructing the full original block.
-    - If the hit chunk is a small block (METHOD B),
-        it currently returns just the hit chunk itself,
-        but the logic is in place to potentially include adjacent chunks for additional context if needed
-        (this part is currently disabled to avoid returning too much context).
-    """
-
-    # STRATEGY A: It was a split chunk -> Return the FULL Parent Block
-    if hit.splited:
-        # We reconstruct a new chunk representing the full parent
-        hited_text_chunks = [t for t in chunks if t.parent_block_id == hit.parent_block_id]
-        return hited_text_chunks
 
-    # STRATEGY B: It was a small block -> Return Window (Prev + Curr + Next)
-    else:
-        return[hit]
-    # THIS PART IS DISABLED FOR NOW, BECAUSE IT OFTEN RETURNS TOO MUCH CONTEXT
-        # prev = chunks[hit.chunk_index - 1] if hit.chunk_index > 0 else None
-        # next = chunks[hit.chunk_index + 1] if hit.chunk_index < len(chunks) - 1 else None
-        # if prev is None:
-        #     return [hit, next] if next else [hit]
-        # if next is None:
-        #     return [prev, hit] if prev else [hit]
-        # return [prev,hit,next]
 
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import os
+import uuid
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+
+
+def encode_str_column(values: List[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes a list of strings as one concatenated UTF-8 buffer plus an offsets array
+    (offsets[i]:offsets[i+1] is the i-th string).
+    """
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    buffer = np.frombuffer(b"".join(encoded), dtype="uint8")
+    return buffer, offsets
+
+
+def decode_str_column(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """
+    Inverse of `encode_str_column`.
+    """
+    raw = buffer.tobytes()
+    bounds = offsets.tolist()
+    return [raw[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+
+
+def atomic_write(path: Path, write: Callable[[Path], None]) -> None:
+    """
+    Writes a file via a temporary sibling and renames it into place,
+    so readers never see a half-written file.
+    """
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.utils.chunk_store import ChunkStore
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # optional: without it tokens are estimated
+    Tokenizer = None
+
+_WORD_RE = re.compile(r"\w+")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+class TokenCounter:
+    """
+    Counts tokens with a local Hugging Face `tokenizers` tokenizer
+    (a tokenizer.json path or a hub id, e.g. from RAG_TOKENIZER).
+    Without a tokenizer the count is estimated (~1.3 tokens per word plus punctuation).
+    """
+
+    def __init__(self, tokenizer: Optional[str] = None) -> None:
+        self.name = tokenizer
+        self._tokenizer = None
+        if tokenizer and Tokenizer is not None:
+            try:
+                if Path(tokenizer).exists():
+                    self._tokenizer = Tokenizer.from_file(tokenizer)
+                else:
+                    self._tokenizer = Tokenizer.from_pretrained(tokenizer)
+            except Exception as e:
+                print(f"⚠️ Could not load tokenizer '{tokenizer}' ({e}); estimating token counts instead.")
+
+    @classmethod
+    def from_env(cls) -> TokenCounter:
+        return cls(os.environ.get("RAG_TOKENIZER"))
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        return math.ceil(len(_WORD_RE.findall(text)) * 1.3) + len(_PUNCT_RE.findall(text))
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        if self._tokenizer is not None:
+            encodings = self._tokenizer.encode_batch(list(texts), add_special_tokens=False)
+            return [len(e.ids) for e in encodings]
+        return [self.count(t) for t in texts]
+
+
+@dataclass
+class ContextSpan:
+    """
+    Contiguous text of one parent block, built from one or more (overlapping) chunks.
+    """
+    document_id: str
+    parent_block_id: int
+    score: float
+    chunk_indices: List[int]
+    text: str
+    tokens: int = 0
+    truncated: bool = False
+
+    def header(self) -> str:
+        ids = ",".join(str(i) for i in self.chunk_indices)
+        return f"[Source score={self.score:.3f} doc={self.document_id} chunk_id={ids}]"
+
+
+@dataclass
+class PackedContext:
+    spans: List[ContextSpan] = field(default_factory=list)
+    tokens: int = 0
+    dropped: int = 0  # spans that did not fit into the budget
+
+    def text(self, separator: str = "\n\n---\n\n") -> str:
+        return separator.join(f"{s.header()}\n{s.text}" for s in self.spans)
+
+
+def _merge_overlapping(chunks: List[Tuple[int, str]], max_overlap: int) -> List[Tuple[List[int], str]]:
+    """
+    Merges (chunk_index, content) of one parent block (sorted by chunk_index) into contiguous spans:
+    consecutive sliding windows share up to `max_overlap` words, which are kept only once.
+    Returns (chunk indices, text) per span; non-consecutive chunks start a new span.
+    """
+    spans: List[Tuple[List[int], List[str]]] = []
+    for chunk_index, content in chunks:
+        words = content.split()
+        if spans and spans[-1][0][-1] + 1 == chunk_index:
+            indices, merged = spans[-1]
+            # longest suffix of the span that is a prefix of this chunk
+            overlap = 0
+            for k in range(min(max_overlap, len(words), len(merged)), 0, -1):
+                if merged[-k:] == words[:k]:
+                    overlap = k
+                    break
+            merged.extend(words[overlap:])
+            indices.append(chunk_index)
+        else:
+            spans.append(([chunk_index], words))
+    return [(indices, " ".join(words)) for indices, words in spans]
+
+
+def _truncate(text: str, budget: int, counter: TokenCounter) -> Tuple[str, int]:
+    """
+    Longest word prefix of `text` that fits into `budget` tokens (binary search).
+    """
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if counter.count(" ".join(words[:mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    truncated = " ".join(words[:lo])
+    return truncated, counter.count(truncated)
+
+
+def pack_context(
+    hits: Sequence[Tuple[float, Sequence[int]]],
+    chunks: ChunkStore,
+    counter: TokenCounter,
+    max_tokens: int,
+    max_overlap: int = 0,
+    min_truncated_tokens: int = 64,
+) -> PackedContext:
+    """
+    Builds the LLM context from retrieved hits within a token budget.
+    - Hits of the same parent block are combined (score = best hit), duplicate chunks dropped
+    - Overlapping / adjacent sliding-window chunks are merged into one span
+    - Spans are added in rank order (of their first hit) while they fit; a span that does not
+      fit is truncated if at least `min_truncated_tokens` remain, smaller later spans may still fit
+
+    :param hits: (score, expanded chunk rows) per hit, best first (e.g. from small2big expansion).
+    :param chunks: The chunk store the rows refer to.
+    :param counter: Token counter of the generation model.
+    :param max_tokens: Budget for the whole context (span headers included).
+    :param max_overlap: Maximum words shared by consecutive chunks (the chunker's overlap).
+    """
+    groups: Dict[Tuple[str, int], Tuple[float, Dict[int, int]]] = {}
+    for score, rows in hits:
+        for row in rows:
+            key = (chunks.document_id(row), chunks.parent_block_id(row))
+            best, by_index = groups.get(key, (score, {}))
+            by_index.setdefault(chunks.chunk_index(row), row)
+            groups[key] = (max(best, score), by_index)
+
+    spans: List[ContextSpan] = []
+    for (document_id, parent_block_id), (score, by_index) in groups.items():
+        ordered = [(i, chunks.content(by_index[i])) for i in sorted(by_index)]
+        for indices, text in _merge_overlapping(ordered, max_overlap):
+            spans.append(ContextSpan(document_id, parent_block_id, score, indices, text))
+
+    for span, tokens in zip(spans, counter.count_many([f"{s.header()}\n{s.text}" for s in spans])):
+        span.tokens = tokens
+
+    packed = PackedContext()
+    for span in spans:
+        remaining = max_tokens - packed.tokens
+        if span.tokens <= remaining:
+            packed.spans.append(span)
+            packed.tokens += span.tokens
+            continue
+        header_tokens = counter.count(span.header()) + 1
+        if remaining - header_tokens >= min_truncated_tokens:
+            text, tokens = _truncate(span.text, remaining - header_tokens, counter)
+            span.text, span.tokens, span.truncated = text, tokens + header_tokens, True
+            packed.spans.append(span)
+            packed.tokens += span.tokens
+        else:
+            packed.dropped += 1
+    return packed
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a text before hashing, so whitespace-only differences share a cache entry.
+    """
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """
+    SHA-256 hex digest of the normalized text.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache backed by SQLite.
+    - Key: (embedding model id, hash of the normalized text)
+    - Value: float32 vector
+    - LRU eviction once more than `max_entries` vectors are stored
+    """
+
+    def __init__(self, path: Path, max_entries: int = 500_000) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up the vectors for `texts`. Returns one entry per text (None on a miss)
+        and updates the hit/miss counters and the LRU timestamps of the hits.
+        """
+        hashes = [text_hash(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), _LOOKUP_CHUNK):
+                part = unique[i:i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype="float32")
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            n_hits = sum(r is not None for r in results)
+            self.hits += n_hits
+            self.misses += len(results) - n_hits
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Stores the vectors for `texts` (row i belongs to texts[i]) and evicts
+        the least recently used entries if the cache grows beyond `max_entries`.
+        """
+        if not texts:
+            return
+        now = time.time()
+        rows = [
+            (model, text_hash(t), np.ascontiguousarray(v, dtype="float32").tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += self._conn.total_changes - before
+
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Hit/miss counters since process start and the number of stored vectors.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": self._count}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,13 +1,22 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
 
 import numpy as np
 import faiss
 
 from app.models.embedder_loader import LMStudioEmbedder
+from app.utils.chunk_store import ChunkStore, SearchFilter
 from app.utils.chunker import TextChunk
+from app.utils.columnar import atomic_write
+from app.utils.metrics import METRICS
+from app.utils.sparse_index import BM25Index
 
 
 def _l2_normalize(x: np.ndarray) -> np.ndarray:
@@ -21,18 +30,296 @@ def _l2_normalize(x: np.ndarray) -> np.ndarray:
     return x / norms
 
 
+# Snapshot-Layout auf der Platte (ein Verzeichnis pro Store)
+INDEX_FILENAME = "index.faiss"
+METADATA_FILENAME = "metadata.npz"
+SPARSE_FILENAME = "sparse.npz"
+MANIFEST_FILENAME = "manifest.json"
+SNAPSHOT_VERSION = 4
+
+INDEX_KINDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+@dataclass
+class IndexConfig:
+    """
+    Wahl des FAISS-Index pro Deployment:
+    - flat: exakte Suche (IndexFlatIP)
+    - ivf_flat / ivf_pq: invertierte Listen (ohne / mit Product Quantization), werden automatisch
+      trainiert, sobald genug Vektoren vorhanden sind; bis dahin wird exakt gesucht
+    - hnsw: Graph-Index, kein Training nötig
+    nprobe (IVF) und ef_search (HNSW) tauschen Recall gegen Latenz.
+    """
+    kind: str = "flat"
+    nlist: int = 1024
+    nprobe: int = 16
+    pq_m: int = 64       # sub-quantizers, must divide the embedding dim
+    pq_nbits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    train_size: int = 0  # vectors needed before IVF training; 0 = automatic
+
+    def __post_init__(self) -> None:
+        if self.kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind: {self.kind} (expected one of {INDEX_KINDS})")
+
+    @classmethod
+    def from_env(cls) -> IndexConfig:
+        """
+        Reads the index configuration from RAG_INDEX_* environment variables,
+        e.g. RAG_INDEX_KIND=hnsw, RAG_INDEX_EF_SEARCH=128.
+        """
+        defaults = cls()
+        values: Dict[str, Any] = {}
+        for name, default in asdict(defaults).items():
+            raw = os.environ.get(f"RAG_INDEX_{name.upper()}")
+            if raw is not None:
+                values[name] = type(default)(raw)
+        return cls(**values)
+
+    @property
+    def needs_training(self) -> bool:
+        return self.kind in ("ivf_flat", "ivf_pq")
+
+    def min_train_vectors(self) -> int:
+        """
+        FAISS recommends ~39 training points per centroid (IVF lists and PQ codebooks).
+        """
+        if self.train_size > 0:
+            return self.train_size
+        n = 39 * self.nlist
+        if self.kind == "ivf_pq":
+            n = max(n, 39 * (2 ** self.pq_nbits))
+        return n
+
+
+def create_index(dim: int, config: IndexConfig) -> faiss.Index:
+    """
+    Creates an empty index for `config`. Every vector is stored under a stable int64 id:
+    flat and HNSW are wrapped in an IndexIDMap2, IVF kinds start as a flat (ID-mapped)
+    staging index and are converted by `train_ivf_index` once enough vectors exist.
+    """
+    if config.kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = config.ef_construction
+        index = faiss.IndexIDMap2(hnsw)
+        apply_search_params(index, config)
+        return index
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+def train_ivf_index(vectors: np.ndarray, ids: np.ndarray, config: IndexConfig) -> faiss.Index:
+    """
+    Trains an IVF index on `vectors` and adds them under `ids` (IVF stores ids natively).
+    A hashtable direct map makes single vectors reconstructable by id (exact filtered search).
+    """
+    dim = vectors.shape[1]
+    quantizer = faiss.IndexFlatIP(dim)
+    if config.kind == "ivf_pq":
+        index = faiss.IndexIVFPQ(
+            quantizer, dim, config.nlist, config.pq_m, config.pq_nbits, faiss.METRIC_INNER_PRODUCT
+        )
+    else:
+        index = faiss.IndexIVFFlat(quantizer, dim, config.nlist, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    index.add_with_ids(vectors, ids)
+    apply_search_params(index, config)
+    return index
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """
+    The index inside an IndexIDMap2 (or the index itself).
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _id_mapped_vectors(index: faiss.Index) -> tuple[np.ndarray, np.ndarray]:
+    """
+    All (vectors, ids) of an ID-mapped flat or HNSW index.
+    """
+    inner = _unwrap(index)
+    ids = faiss.vector_to_array(index.id_map).astype("int64")
+    vectors = inner.reconstruct_n(0, inner.ntotal) if inner.ntotal else np.zeros((0, index.d), "float32")
+    return vectors, ids
+
+
+def _can_reconstruct(index: faiss.Index) -> bool:
+    """
+    True if `index.reconstruct_batch` accepts vector ids: ID-mapped flat / HNSW,
+    IVF only with a direct map.
+    """
+    inner = _unwrap(index)
+    return not isinstance(inner, faiss.IndexIVF) or inner.direct_map.type != faiss.DirectMap.NoMap
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> None:
+    """
+    Removes `ids` from `index`. An IVF direct map only accepts an IDSelectorArray (looked up
+    per id); every other index scans its ids against the selector, for which the hash-based
+    IDSelectorBatch is the fast one.
+    """
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF) and inner.direct_map.type != faiss.DirectMap.NoMap:
+        # the selector only points into `ids`, which stays referenced until the call returns
+        index.remove_ids(faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids)))
+    else:
+        index.remove_ids(faiss.IDSelectorBatch(ids))
+
+
+def apply_search_params(index: faiss.Index, config: IndexConfig) -> None:
+    """
+    Sets the query-time parameters (nprobe / efSearch) on an index.
+    """
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = config.nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = config.ef_search
+
+
+def make_search_params(
+    index: faiss.Index,
+    config: IndexConfig,
+    selector: faiss.IDSelector,
+) -> faiss.SearchParameters:
+    """
+    Search parameters restricting a search to the ids accepted by `selector`.
+    Explicit parameters replace the index defaults, so nprobe / efSearch are set here too.
+    """
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = config.nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = config.ef_search
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return params
+
+
+# Filter mit höchstens so vielen Treffern werden exakt über die rekonstruierten Vektoren gesucht
+FILTER_EXACT_MAX = 4096
+
+
+class _ReadWriteLock:
+    """
+    Any number of readers (searches) or one writer (changes of index / chunks / BM25).
+    Waiting writers block new readers, so a stream of queries cannot starve an upload.
+    Both sides are re-entrant per thread; a reader must not ask for the write lock.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        me = threading.get_ident()
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0 and self._writer != me:
+            with self._cond:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+            counted = True
+        else:
+            counted = False
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if counted:
+                with self._cond:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if self._writer_depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
 @dataclass
 class FaissVectorStore:
     """
     FAISS-basierter Vektorspeicher:
-    - index: FAISS IndexFlatIP (inner product)
-    - metadata: Liste mit Metadaten (1:1 zu Index-Zeilen)
+    - index: FAISS-Index mit inner product (Flat, IVF oder HNSW, siehe IndexConfig),
+      jeder Vektor unter einer stabilen int64-ID
+    - chunks: spaltenweiser ChunkStore, Zeilen-ID = Vektor-ID (Treffer verweisen nur auf die ID)
+    - Löschen markiert die Zeilen sofort als tot und die Vektoren als gelöscht
+      (werden bei der Suche ausgefiltert); `compact` entfernt sie im Hintergrund physisch
     """  
     
-    def __init__(self, index: faiss.IndexFlatIP, metadata: List[Dict[str, Any]], embedder):
+    def __init__(
+        self,
+        index: faiss.Index,
+        chunks: Optional[ChunkStore],
+        embedder,
+        index_config: Optional[IndexConfig] = None,
+    ):
         self.index = index
-        self.metadata = metadata
+        self.chunks = chunks if chunks is not None else ChunkStore()
         self.embedder = embedder
+        self.index_config = index_config or IndexConfig()
+        # True, solange der Index nur eine memory-mapped Sicht auf einen Snapshot ist
+        self.mmapped = False
+        # schützt Index + Chunks + BM25: Suchen laufen parallel (read), Änderungen exklusiv (write)
+        self._rw = _ReadWriteLock()
+        # one IVF training / compaction thread / snapshot write at a time
+        self._train_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._filter_lock = threading.Lock()
+        # gelöscht, aber noch im FAISS-Index (bis zur nächsten Kompaktierung)
+        self._deleted: set[int] = set()
+        self._deleted_selector: Optional[faiss.IDSelector] = None
+        self._compaction_thread: Optional[threading.Thread] = None
+        # one compaction at a time; while it builds, inserted vectors are also recorded here
+        self._compaction_run_lock = threading.Lock()
+        self._compaction_adds: Optional[List[tuple[np.ndarray, np.ndarray]]] = None
+        # incremented on every change of the stored chunks; keys the cached filter id sets
+        self._version = 0
+        self._filter_ids: Dict[tuple[int, SearchFilter], np.ndarray] = {}
+        # document_id -> how it was ingested (e.g. {"process_images": True}), kept in the snapshot
+        self._document_meta: Dict[str, Dict[str, Any]] = {}
+        # BM25 über den Chunk-Inhalt, gleiche IDs wie der FAISS-Index
+        self.sparse = BM25Index()
+        if len(self.chunks):
+            rows = self.chunks.live_rows().tolist()
+            self.sparse.add((self.chunks.content(r) for r in rows), rows)
 
 
     @classmethod
@@ -40,6 +327,7 @@ class FaissVectorStore:
         cls,
         chunks: List[TextChunk],
         embedder: Optional[LMStudioEmbedder] = None,
+        index_config: Optional[IndexConfig] = None,
     ) -> FaissVectorStore:
         """
         Baut einen FAISS-Index aus einer Liste von TextChunk-Objekten.
@@ -61,45 +349,38 @@ class FaissVectorStore:
         embeddings = _l2_normalize(embeddings).astype("float32")
 
         n, dim = embeddings.shape
-        index = faiss.IndexFlatIP(dim)
-        index.add(embeddings)
-
-        metadata: List[Dict[str, Any]] = []
-        for c in chunks:
-            meta = {
-                "id": c.id,
-                "document_id": c.document_id,
-                "page_id": c.page_id,
-                "parent_block_id": c.parent_block_id,
-                "chunk_index": c.chunk_index,
-                "content": c.content,
-                "splited": c.splited,
-                "wordcount": c.wordcount
-            }
-            metadata.append(meta)
-
-        return cls(index=index, metadata=metadata, embedder=embedder)
+        index_config = index_config or IndexConfig()
+        store = cls(
+            index=create_index(dim, index_config),
+            chunks=None,
+            embedder=embedder,
+            index_config=index_config,
+        )
+        store._insert(chunks, embeddings)
+        return store
 
     def add_chunks(
         self,
         chunks: List[TextChunk],
         embedder: Optional[LMStudioEmbedder] = None,
-    ) -> None:
+    ) -> List[int]:
         """
         Fügt neue Chunks zum bestehenden Index hinzu.
         - Berechnet Embeddings für die neuen Chunks
         - Normalisiert die Embeddings
-        - Fügt die Embeddings zum FAISS-Index hinzu
-        - Aktualisiert die Metadaten-Liste entsprechend
+        - Fügt die Embeddings unter neuen stabilen IDs zum FAISS-Index hinzu
+        - Hängt die Chunks an den ChunkStore an und aktualisiert den BM25-Index
+        Returns the vector ids assigned to the chunks.
         """
         if embedder is None:
             embedder =  self.embedder
 
         if not chunks:
-            return
+            return []
 
         texts = [c.content for c in chunks]
-        embeddings = embedder.embed_texts(texts)  # shape (n, dim)
+        with METRICS.time("embed"):
+            embeddings = embedder.embed_texts(texts)  # shape (n, dim)
 
         if embeddings.ndim != 2:
             raise ValueError("Embeddings must be a 2D array")
@@ -112,63 +393,196 @@ class FaissVectorStore:
                 f"Embedding dim mismatch: index dim={self.index.d}, new dim={embeddings.shape[1]}"
             )
 
-        self.index.add(embeddings)
-
-        for c in chunks:
-            meta = {
-                "id": c.id,
-                "document_id": c.document_id,
-                "page_id": c.page_id,
-                "parent_block_id": c.parent_block_id,
-                "chunk_index": c.chunk_index,
-                "content": c.content,
-                "splited": c.splited,
-                "wordcount": c.wordcount
-            }
-            self.metadata.append(meta)
+        # embedding happens outside the lock; only the index update is serialized
+        with METRICS.time("index_add"):
+            return self._insert(chunks, embeddings)
+
+    def _insert(self, chunks: List[TextChunk], embeddings: np.ndarray) -> List[int]:
+        """
+        Appends the chunks as rows (row id = vector id) and adds vectors and BM25 postings.
+        """
+        with self._rw.write():
+            rows = np.arange(self.chunks.num_rows, self.chunks.num_rows + len(chunks), dtype="int64")
+            self._add_vectors(embeddings, rows)
+            ids = rows.tolist()
+            self.sparse.add((c.content for c in chunks), ids)
+            # rows become visible to searches last
+            self.chunks.add(chunks)
+            self._version += 1
+        if self._needs_training():
+            self._train_ivf()
+        return ids
+
+    def _add_vectors(self, embeddings: np.ndarray, ids: np.ndarray) -> None:
+        """
+        Adds normalized vectors to the index (under the write lock). IVF kinds collect vectors
+        in a flat staging index until `_train_ivf` replaces it by a trained index;
+        afterwards vectors are added incrementally to the trained index.
+        """
+        self._ensure_writable()
+        self.index.add_with_ids(embeddings, ids)
+        if self._compaction_adds is not None:
+            self._compaction_adds.append((embeddings, ids))
+
+    def _needs_training(self) -> bool:
+        config = self.index_config
+        return (
+            config.needs_training
+            and not isinstance(self.index, faiss.IndexIVF)
+            and self.index.ntotal >= config.min_train_vectors()
+        )
+
+    def _train_ivf(self) -> None:
+        """
+        Trains the IVF index from the staging vectors without holding the write lock
+        (searches and inserts continue on the staging index meanwhile); vectors added
+        or compacted away during training are reconciled before the swap.
+        """
+        if not self._train_lock.acquire(blocking=False):
+            return
+        try:
+            with self._rw.read():
+                if not self._needs_training():
+                    return
+                vectors, vids = _id_mapped_vectors(self.index)
+            trained = train_ivf_index(vectors, vids, self.index_config)
+
+            with self._rw.write():
+                staging = self.index
+                current = faiss.vector_to_array(staging.id_map).astype("int64")
+                added = np.flatnonzero(~np.isin(current, vids))
+                if len(added):
+                    trained.add_with_ids(_unwrap(staging).reconstruct_batch(added), current[added])
+                removed = vids[~np.isin(vids, current)]
+                if len(removed):
+                    remove_ids(trained, removed)
+                self.index = trained
+        finally:
+            self._train_lock.release()
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+        """
+        Tunes recall vs. latency at runtime (nprobe for IVF, efSearch for HNSW).
+        """
+        with self._rw.write():
+            if nprobe is not None:
+                self.index_config.nprobe = nprobe
+            if ef_search is not None:
+                self.index_config.ef_search = ef_search
+            apply_search_params(self.index, self.index_config)
 
     def search_by_embedding(
         self,
         query_embedding: np.ndarray,
         top_k: int = 5,
+        search_filter: Optional[SearchFilter] = None,
     ) -> List[Dict[str, Any]]:
         """
         Sucht im Index nach den top_k ähnlichsten Chunks basierend auf einem Query-Embedding.
         - Normalisiert das Query-Embedding
-        - Führt die Suche im FAISS-Index durch
-        - Gibt eine Liste von Ergebnissen zurück, die den Score und die zugehörigen Metadaten enthalten
+        - Führt die Suche im FAISS-Index durch (gelöschte IDs werden per IDSelector ausgeschlossen,
+          ein `search_filter` wird ebenfalls als IDSelector in die Suche gegeben)
+        - Gibt eine Liste von Ergebnissen zurück: Score und Vektor-ID ("vid") = Zeile im ChunkStore
         """
-        if self.index.ntotal == 0:
-            return []
-
-        q = _l2_normalize(query_embedding.astype("float32"))
-        if q.ndim == 1:
-            q = q[None, :]
+        return self.search_batch_by_embedding(query_embedding, top_k=top_k, search_filter=search_filter)[0]
 
-        D, I = self.index.search(q, top_k)  # D: scores, I: indices
-
-        results: List[Dict[str, Any]] = []
-        scores = D[0]
-        indices = I[0]
-
-        for score, idx in zip(scores, indices):
-            if idx == -1:
-                continue
-            meta = self.metadata[idx]
-            results.append(
-                {
-                    "score": float(score),
-                    "metadata": meta,
-                }
-            )
-
-        return results
+    def filter_ids(self, search_filter: SearchFilter) -> np.ndarray:
+        """
+        Sorted ids of the live chunks matching `search_filter` (evaluated on the chunk
+        columns, see `ChunkStore.filter_rows`); results are cached until the store changes.
+        """
+        with self._rw.read():
+            key = (self._version, search_filter)
+            with self._filter_lock:
+                ids = self._filter_ids.get(key)
+            if ids is not None:
+                return ids
+            ids = self.chunks.filter_rows(search_filter)
+            with self._filter_lock:
+                if len(self._filter_ids) >= 64 or any(v != self._version for v, _ in self._filter_ids):
+                    self._filter_ids.clear()
+                self._filter_ids[key] = ids
+            return ids
+
+    def _search_filtered(
+        self,
+        q: np.ndarray,
+        top_k: int,
+        ids: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Search restricted to `ids` (live ids only, so tombstones need no extra selector).
+        Small id sets are scored exactly against their reconstructed vectors (for IVF via its
+        direct map), so selective filters still return the full top_k and cost only len(ids)
+        dot products instead of scanning inverted lists.
+        """
+        inner = _unwrap(self.index)
+        if len(ids) <= FILTER_EXACT_MAX and _can_reconstruct(self.index):
+            vectors = self.index.reconstruct_batch(ids)
+            scores = q @ vectors.T
+            k = min(top_k, len(ids))
+            D = np.full((q.shape[0], top_k), -np.inf, dtype="float32")
+            I = np.full((q.shape[0], top_k), -1, dtype="int64")
+            if k > 0:
+                part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                part_scores = np.take_along_axis(scores, part, axis=1)
+                order = np.argsort(-part_scores, axis=1, kind="stable")
+                D[:, :k] = np.take_along_axis(part_scores, order, axis=1)
+                I[:, :k] = ids[np.take_along_axis(part, order, axis=1)]
+            return D, I
+
+        config = self.index_config
+        if isinstance(inner, faiss.IndexHNSW):
+            # the graph walk skips filtered nodes, a wider beam keeps top_k filled
+            fraction = len(ids) / max(1, self.index.ntotal)
+            config = replace(config, ef_search=min(4096, max(config.ef_search, int(top_k / fraction))))
+        params = make_search_params(self.index, config, faiss.IDSelectorBatch(ids))
+        return self.index.search(q, top_k, params=params)
+
+    def search_batch_by_embedding(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Like `search_by_embedding` for a (n, dim) matrix of queries, in a single FAISS search.
+        Returns one hit list per query row.
+        """
+        q = _l2_normalize(np.asarray(query_embeddings, dtype="float32"))
+        if self.index.ntotal == 0:
+            return [[] for _ in range(q.shape[0])]
+
+        with self._rw.read():
+            if search_filter is not None:
+                ids = self.filter_ids(search_filter)
+                if len(ids) == 0:
+                    return [[] for _ in range(q.shape[0])]
+                D, I = self._search_filtered(q, top_k, ids)
+            elif self._deleted_selector is not None:
+                params = make_search_params(self.index, self.index_config, self._deleted_selector)
+                D, I = self.index.search(q, top_k, params=params)
+            else:
+                D, I = self.index.search(q, top_k)  # D: scores, I: ids
+
+            alive = self.chunks.is_alive
+            batch: List[List[Dict[str, Any]]] = [
+                [
+                    {"score": score, "vid": vid}
+                    for score, vid in zip(scores.tolist(), indices.tolist())
+                    if vid != -1 and alive(vid)
+                ]
+                for scores, indices in zip(D, I)
+            ]
+
+        return batch
 
     def search_by_text(
         self,
         query_text: str,
         embedder: Optional[LMStudioEmbedder] = None,
         top_k: int = 5,
+        search_filter: Optional[SearchFilter] = None,
     ) -> List[Dict[str, Any]]:
         """
         Convenience: Text → Embedding → Suche.
@@ -177,14 +591,416 @@ class FaissVectorStore:
         - Gibt die Suchergebnisse zurück
         """
         if embedder is None:
-            embedder = LMStudioEmbedder()
+            embedder = self.embedder
 
         query_emb = embedder.embed_text(query_text)
-        return self.search_by_embedding(query_emb, top_k=top_k)
-    
+        return self.search_by_embedding(query_emb, top_k=top_k, search_filter=search_filter)
+
+    def search_hybrid(
+        self,
+        query_text: str,
+        embedder: Optional[LMStudioEmbedder] = None,
+        top_k: int = 5,
+        fusion: str = "rrf",
+        rrf_k: int = 60,
+        dense_weight: float = 0.5,
+        candidates: Optional[int] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Hybride Suche: Dense (FAISS) + Sparse (BM25), zusammengeführt per
+        - "rrf": Reciprocal Rank Fusion, score = sum(1 / (rrf_k + rank))
+        - "weighted": dense_weight * dense + (1 - dense_weight) * bm25, jeweils auf [0, 1] normiert
+        Each side contributes `candidates` hits (default 4 * top_k).
+        The result has the same shape as `search_by_embedding` plus dense_score / sparse_score.
+        `query_embedding` skips embedding the query if the caller already has it.
+        A `search_filter` restricts both sides.
+        """
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion: {fusion}")
+        if embedder is None:
+            embedder = self.embedder
+        n_candidates = candidates or top_k * 4
+
+        query_emb = embedder.embed_text(query_text) if query_embedding is None else query_embedding
+        dense = self.search_by_embedding(query_emb, top_k=n_candidates, search_filter=search_filter)
+        return self._fuse(
+            query_text, dense, top_k, n_candidates, fusion, rrf_k, dense_weight, search_filter=search_filter
+        )
+
+    def search_batch(
+        self,
+        query_texts: List[str],
+        embedder: Optional[LMStudioEmbedder] = None,
+        top_k: int = 5,
+        mode: str = "dense",
+        fusion: str = "rrf",
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieval for many queries at once: all queries are embedded in one batch
+        and searched with one matrix search. mode="hybrid" additionally fuses
+        each query's dense hits with its BM25 hits (see `search_hybrid`).
+        Returns one hit list per query, in input order.
+        """
+        if mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion: {fusion}")
+        if not query_texts:
+            return []
+        if embedder is None:
+            embedder = self.embedder
+
+        embeddings = embedder.embed_texts(query_texts)
+        if mode == "dense":
+            return self.search_batch_by_embedding(embeddings, top_k=top_k, search_filter=search_filter)
+
+        n_candidates = top_k * 4
+        dense_batch = self.search_batch_by_embedding(embeddings, top_k=n_candidates, search_filter=search_filter)
+        return [
+            self._fuse(text, dense, top_k, n_candidates, fusion, search_filter=search_filter)
+            for text, dense in zip(query_texts, dense_batch)
+        ]
+
+    def _fuse(
+        self,
+        query_text: str,
+        dense: List[Dict[str, Any]],
+        top_k: int,
+        n_candidates: int,
+        fusion: str,
+        rrf_k: int = 60,
+        dense_weight: float = 0.5,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Merges dense hits with the BM25 hits of `query_text`.
+        """
+        with self._rw.read():
+            allowed = self.filter_ids(search_filter) if search_filter is not None else None
+            sparse = self.sparse.search(query_text, top_k=n_candidates, allowed=allowed)
+
+        fused: Dict[int, float] = {}
+        dense_scores = {h["vid"]: h["score"] for h in dense}
+        sparse_scores = dict(sparse)
+
+        if fusion == "rrf":
+            for rank, h in enumerate(dense):
+                fused[h["vid"]] = fused.get(h["vid"], 0.0) + 1.0 / (rrf_k + rank + 1)
+            for rank, (vid, _) in enumerate(sparse):
+                fused[vid] = fused.get(vid, 0.0) + 1.0 / (rrf_k + rank + 1)
+        else:
+            max_dense = max(dense_scores.values(), default=0.0) or 1.0
+            max_sparse = max(sparse_scores.values(), default=0.0) or 1.0
+            for vid in dense_scores.keys() | sparse_scores.keys():
+                fused[vid] = (
+                    dense_weight * max(dense_scores.get(vid, 0.0), 0.0) / max_dense
+                    + (1.0 - dense_weight) * sparse_scores.get(vid, 0.0) / max_sparse
+                )
+
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        results: List[Dict[str, Any]] = []
+        for vid, score in best:
+            if not self.chunks.is_alive(vid):
+                continue
+            results.append(
+                {
+                    "score": float(score),
+                    "vid": vid,
+                    "dense_score": dense_scores.get(vid),
+                    "sparse_score": sparse_scores.get(vid),
+                }
+            )
+            if len(results) == top_k:
+                break
+        return results
+
+    def document_ids(self) -> List[str]:
+        """
+        All documents that currently have chunks in the store.
+        """
+        with self._rw.read():
+            return self.chunks.document_ids()
+
+    def document_meta(self, document_id: str) -> Dict[str, Any]:
+        """
+        Ingest metadata of a document (empty if none was set).
+        """
+        with self._rw.read():
+            return dict(self._document_meta.get(document_id, {}))
+
+    def set_document_meta(self, document_id: str, **values: Any) -> None:
+        """
+        Records how a document was ingested (JSON values); dropped with the document.
+        """
+        with self._rw.write():
+            self._document_meta.setdefault(document_id, {}).update(values)
+
+    def delete_document(self, document_id: str) -> int:
+        """
+        Removes all chunks of a document, in time proportional to its number of chunks:
+        chunk rows and BM25 entries are marked dead immediately, the vectors are excluded from
+        searches and physically removed by a background compaction.
+        Returns the number of removed chunks.
+        """
+        with self._rw.write():
+            self._document_meta.pop(document_id, None)
+            ids = self.chunks.remove_document(document_id).tolist()
+            if not ids:
+                return 0
+            self._version += 1
+            self.sparse.remove(ids)
+            self._deleted.update(ids)
+            self._deleted_selector = faiss.IDSelectorNot(
+                faiss.IDSelectorBatch(np.fromiter(self._deleted, dtype="int64", count=len(self._deleted)))
+            )
+        self.schedule_compaction()
+        return len(ids)
+
+    def schedule_compaction(self) -> None:
+        """
+        Runs `compact` in a background thread (at most one at a time).
+        """
+        with self._compaction_lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self.compact, name="faiss-compaction", daemon=True)
+            self._compaction_thread.start()
+
+    def compact(self) -> None:
+        """
+        Physically removes deleted vectors from the FAISS index and the BM25 postings
+        and frees the text of the deleted chunk rows.
+        Flat and IVF support remove_ids; HNSW graphs cannot delete nodes and are rebuilt.
+        Like `_train_ivf`, the compacted index and stores are built from a snapshot without
+        holding the write lock (searches and inserts continue); inserts made meanwhile are
+        added before the swap, deletions made meanwhile are left for the next round.
+        """
+        with self._compaction_run_lock:
+            while True:
+                with self._rw.read():
+                    if not self._deleted:
+                        return
+                    base = self.index
+                    deleted = np.fromiter(self._deleted, dtype="int64", count=len(self._deleted))
+                    hnsw = isinstance(_unwrap(base), faiss.IndexHNSW)
+                    # HNSW is rebuilt from its vectors, the other kinds are compacted on a copy
+                    # (a clone of a memory-mapped index would still point into the read-only file)
+                    if hnsw:
+                        snapshot = _id_mapped_vectors(base)
+                    elif self.mmapped:
+                        snapshot = faiss.deserialize_index(faiss.serialize_index(base))
+                    else:
+                        snapshot = faiss.clone_index(base)
+                    sparse = self.sparse.compacted()
+                    chunks = self.chunks.compacted()
+                    self._compaction_adds = []
+
+                try:
+                    sparse.build()
+                    chunks.build()
+                    if hnsw:
+                        vectors, ids = snapshot
+                        keep = ~np.isin(ids, deleted)
+                        compacted = create_index(base.d, self.index_config)
+                        if keep.any():
+                            compacted.add_with_ids(vectors[keep], ids[keep])
+                    else:
+                        compacted = snapshot
+                        remove_ids(compacted, deleted)
+                        apply_search_params(compacted, self.index_config)
+
+                    with self._rw.write():
+                        if self.index is not base:
+                            # trained, cleared or copied out of the mmap meanwhile -> start over
+                            continue
+                        for vectors, ids in self._compaction_adds:
+                            compacted.add_with_ids(vectors, ids)
+                        self.index = compacted
+                        self.mmapped = False
+                        self.sparse.apply_compaction(sparse)
+                        self.chunks.apply_compaction(chunks)
+                        self._deleted.difference_update(deleted.tolist())
+                        self._deleted_selector = (
+                            faiss.IDSelectorNot(
+                                faiss.IDSelectorBatch(
+                                    np.fromiter(self._deleted, dtype="int64", count=len(self._deleted))
+                                )
+                            )
+                            if self._deleted
+                            else None
+                        )
+                finally:
+                    self._compaction_adds = None
+
     def clear(self) -> None:
         """
-        Removes all vectors from the index and clears metadata.
+        Removes all vectors from the index and clears the chunks.
+        """
+        with self._rw.write():
+            self.index = create_index(self.index.d, self.index_config)  # FAISS: leerer Index (IVF wieder als Staging)
+            self.mmapped = False
+            self.chunks = ChunkStore()      # Chunks leeren
+            self._document_meta.clear()
+            self._version += 1
+            self._deleted.clear()
+            self._deleted_selector = None
+            self.sparse.clear()
+
+    def to_chunks(self, document_id: Optional[str] = None) -> List[TextChunk]:
+        """
+        Rebuilds TextChunk objects of all live chunks (or of one document).
+        """
+        chunks = self.chunks
+        rows = chunks.live_rows() if document_id is None else chunks.document_rows(document_id)
+        return [chunks.chunk(r) for r in rows.tolist()]
+
+    def _ensure_writable(self) -> None:
         """
-        self.index.reset()      # FAISS: Index leeren
-        self.metadata = []      # Metadaten-Liste leeren
+        A memory-mapped index is a read-only view on the snapshot file.
+        Before the first write it is copied into process memory.
+        """
+        if self.mmapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.mmapped = False
+
+    def save(self, directory: Path) -> None:
+        """
+        Writes a snapshot of the store to `directory`:
+        - index.faiss: FAISS-Serialisierung des Index
+        - metadata.npz: ChunkStore-Spalten (Zeile = Vektor-ID, Texte als UTF-8-Puffer + Offsets)
+        - sparse.npz: BM25-Index
+        - manifest.json: Version, Dimension, Index-Konfiguration, noch nicht kompaktierte IDs, Ingest-Metadaten pro Dokument
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # concurrent saves must not share the temporary files
+        with self._save_lock:
+            # consistent in-memory copy under the read lock (index and chunks must match, searches
+            # keep running, writers wait); the files are written without any lock.
+            # The BM25 export needs compacted postings, so they are compacted first (built under
+            # the read lock, swapped under the write lock; again if a deletion slipped in between).
+            while True:
+                if self.sparse.num_dead:
+                    with self._compaction_run_lock:
+                        with self._rw.read():
+                            postings = self.sparse.compacted()
+                        postings.build()
+                        with self._rw.write():
+                            self.sparse.apply_compaction(postings)
+                with self._rw.read():
+                    if self.sparse.num_dead:
+                        continue
+                    index = faiss.clone_index(self.index)
+                    columns = self.chunks.to_arrays()
+                    sparse = self.sparse.to_arrays()
+                    manifest = {
+                        "version": SNAPSHOT_VERSION,
+                        "ntotal": int(self.index.ntotal),
+                        "dim": int(self.index.d),
+                        "index_config": asdict(self.index_config),
+                        "deleted": sorted(self._deleted),
+                        "documents": {doc: dict(meta) for doc, meta in self._document_meta.items()},
+                    }
+                    break
+
+            def write_npz(arrays: Dict[str, np.ndarray]):
+                def write(path: Path) -> None:
+                    with path.open("wb") as f:
+                        np.savez(f, **arrays)
+                return write
+
+            atomic_write(directory / METADATA_FILENAME, write_npz(columns))
+            atomic_write(directory / SPARSE_FILENAME, write_npz(sparse))
+            atomic_write(directory / INDEX_FILENAME, lambda path: faiss.write_index(index, str(path)))
+            atomic_write(
+                directory / MANIFEST_FILENAME,
+                lambda path: path.write_text(json.dumps(manifest), encoding="utf-8"),
+            )
+
+    @staticmethod
+    def snapshot_exists(directory: Path) -> bool:
+        """
+        True if `directory` contains a complete snapshot written by `save`.
+        """
+        directory = Path(directory)
+        return all(
+            (directory / name).exists()
+            for name in (INDEX_FILENAME, METADATA_FILENAME, MANIFEST_FILENAME)
+        )
+
+    @classmethod
+    def load(
+        cls,
+        directory: Path,
+        embedder: Optional[LMStudioEmbedder] = None,
+        mmap: bool = True,
+        index_config: Optional[IndexConfig] = None,
+    ) -> FaissVectorStore:
+        """
+        Loads a snapshot written by `save`.
+
+        :param directory: Snapshot directory.
+        :param embedder: Embedder used for queries and new chunks.
+        :param mmap: Open the index memory-mapped (read-only view, shared via the page cache
+            between worker processes). It is copied into memory on the first write.
+        :param index_config: Deployment config; its search params override the stored ones.
+            The index kind itself is fixed by the snapshot.
+        """
+        directory = Path(directory)
+        if embedder is None:
+            embedder = LMStudioEmbedder()
+
+        manifest = json.loads((directory / MANIFEST_FILENAME).read_text(encoding="utf-8"))
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version: {manifest.get('version')} (expected {SNAPSHOT_VERSION}); "
+                "delete the snapshot directory and re-upload the documents"
+            )
+
+        flags = (faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY) if mmap else 0
+        index = faiss.read_index(str(directory / INDEX_FILENAME), flags)
+
+        with np.load(directory / METADATA_FILENAME) as data:
+            chunks = ChunkStore.from_arrays(dict(data))
+
+        deleted = manifest.get("deleted", [])
+        n = len(chunks)
+        if n + len(deleted) != index.ntotal or index.ntotal != manifest["ntotal"]:
+            raise ValueError(
+                f"Snapshot is inconsistent: index has {index.ntotal} vectors, "
+                f"chunk store has {n} live rows and {len(deleted)} deleted ids"
+            )
+
+        config = IndexConfig(**manifest.get("index_config", {}))
+        if index_config is not None:
+            if index_config.kind == config.kind:
+                config = index_config
+            else:
+                print(
+                    f"⚠️ Snapshot index kind '{config.kind}' differs from configured "
+                    f"'{index_config.kind}'; keeping '{config.kind}'. Re-ingest to switch."
+                )
+        apply_search_params(index, config)
+
+        # the sparse index is rebuilt from the chunks unless it was saved with the snapshot
+        sparse_path = directory / SPARSE_FILENAME
+        if sparse_path.exists():
+            store = cls(index=index, chunks=None, embedder=embedder, index_config=config)
+            store.chunks = chunks
+            with np.load(sparse_path) as data:
+                store.sparse = BM25Index.from_arrays(dict(data))
+        else:
+            store = cls(index=index, chunks=chunks, embedder=embedder, index_config=config)
+        if store.sparse.num_docs != len(chunks):
+            raise ValueError("Snapshot is inconsistent: sparse index does not match the chunk store")
+        store.mmapped = mmap
+        store._document_meta = {doc: dict(meta) for doc, meta in manifest.get("documents", {}).items()}
+        if deleted:
+            store._deleted = set(deleted)
+            store._deleted_selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.asarray(deleted, dtype="int64")))
+            store.schedule_compaction()
+        return store
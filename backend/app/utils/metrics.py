@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Histogram-Grenzen in Sekunden (1 ms bis 5 min: Suche bis LLM-Antwort / Bildbeschreibung)
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+QUANTILES: Tuple[float, ...] = (0.5, 0.95, 0.99)
+# quantiles are computed over the most recent observations per stage
+QUANTILE_WINDOW = 2048
+
+
+class _Series:
+    """
+    Observations of one stage: cumulative histogram, sum/count and a ring buffer of recent values.
+    """
+
+    __slots__ = ("counts", "total", "count", "window", "pos")
+
+    def __init__(self, num_buckets: int, window: int) -> None:
+        self.counts: List[int] = [0] * (num_buckets + 1)  # last one is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.window = np.zeros(window, dtype="float64")
+        self.pos = 0
+
+
+class StageMetrics:
+    """
+    In-process latency collector for pipeline stages (query: embed, search, rerank, expand,
+    prompt build, LLM; ingest: parse, clean, caption, chunk, embed, index).
+    Recording is a lock, a bisect and a few list writes; percentiles are only computed on export.
+    """
+
+    def __init__(
+        self,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        window: int = QUANTILE_WINDOW,
+    ) -> None:
+        self.buckets = buckets
+        self.window = window
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(stage)
+            if series is None:
+                series = self._series[stage] = _Series(len(self.buckets), self.window)
+            series.counts[bisect_left(self.buckets, seconds)] += 1
+            series.total += seconds
+            series.count += 1
+            series.window[series.pos % self.window] = seconds
+            series.pos += 1
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+        Times the enclosed block (also when it raises).
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def _snapshot(self) -> Dict[str, Tuple[List[int], float, int, np.ndarray]]:
+        with self._lock:
+            return {
+                stage: (list(s.counts), s.total, s.count, s.window[: min(s.pos, self.window)].copy())
+                for stage, s in self._series.items()
+            }
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        count, sum, mean and p50/p95/p99 (in seconds) per stage.
+        """
+        result: Dict[str, Dict[str, float]] = {}
+        for stage, (_, total, count, recent) in sorted(self._snapshot().items()):
+            entry = {"count": count, "sum": total, "mean": total / count if count else 0.0}
+            values = np.quantile(recent, QUANTILES) if len(recent) else [0.0] * len(QUANTILES)
+            for q, v in zip(QUANTILES, values):
+                entry[f"p{int(q * 100)}"] = float(v)
+            result[stage] = entry
+        return result
+
+    def render_prometheus(self, prefix: str = "rag") -> str:
+        """
+        Prometheus text exposition format: one histogram (all observations) and one
+        summary (quantiles over the recent window) per stage.
+        """
+        snapshot = sorted(self._snapshot().items())
+        hist = f"{prefix}_stage_duration_seconds"
+        summ = f"{prefix}_stage_latency_seconds"
+        lines = [
+            f"# HELP {hist} Duration of pipeline stages.",
+            f"# TYPE {hist} histogram",
+        ]
+        for stage, (counts, total, count, _) in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{hist}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{hist}_sum{{stage="{stage}"}} {total!r}')
+            lines.append(f'{hist}_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            f"# HELP {summ} Quantiles of pipeline stage durations over the last {self.window} observations.",
+            f"# TYPE {summ} summary",
+        ]
+        for stage, (_, total, count, recent) in snapshot:
+            if len(recent):
+                for q, v in zip(QUANTILES, np.quantile(recent, QUANTILES)):
+                    lines.append(f'{summ}{{stage="{stage}",quantile="{q}"}} {float(v)!r}')
+            lines.append(f'{summ}_sum{{stage="{stage}"}} {total!r}')
+            lines.append(f'{summ}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class StageTotals:
+    """
+    Sums stage durations over several blocks (e.g. the page batches of one streamed document)
+    and records them as one observation per stage on `flush`.
+    """
+
+    def __init__(self, metrics: StageMetrics) -> None:
+        self.metrics = metrics
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - started
+
+    def flush(self) -> None:
+        for stage, seconds in self.seconds.items():
+            self.metrics.observe(stage, seconds)
+        self.seconds.clear()
+
+
+# process-wide collector, exported at /rag/metrics
+METRICS = StageMetrics()
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import math
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Keeps terms like "il-6", "brca1", "x1.5" or "covid-19" as one token
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be but by for from has have in is it its of on or that the their there
+    these this to was were which with what when where who how does do did can not no
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits text into terms for BM25. Hyphenated / dotted identifiers
+    (gene symbols, drug names, model numbers) stay intact; stopwords are dropped.
+    """
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+@dataclass
+class PostingsCompaction:
+    """
+    A compaction of a BM25Index (see `BM25Index.compacted`): postings lists per term id
+    (filtered by `build`), their captured lengths, the alive mask and the deletions it drops.
+    """
+    ids: List[array]
+    tfs: List[array]
+    lengths: List[int]
+    alive: np.ndarray
+    num_dead: int
+
+    def build(self) -> None:
+        """
+        Replaces every captured list that contains deleted documents by a filtered copy of
+        its captured part. Lists may be appended to meanwhile: slicing copies under the GIL
+        and never exports their buffers (which would block the append).
+        """
+        alive = self.alive
+        for term_id, length in enumerate(self.lengths):
+            ids = np.frombuffer(self.ids[term_id][:length], dtype=np.int32)
+            keep = alive[ids]
+            if keep.all():
+                continue  # unchanged, stays the live list
+            tfs = np.frombuffer(self.tfs[term_id][:length], dtype=np.int32)
+            self.ids[term_id] = array("i", ids[keep].tobytes())
+            self.tfs[term_id] = array("i", tfs[keep].tobytes())
+
+
+class BM25Index:
+    """
+    Incremental inverted index with BM25 scoring.
+    - Dokument-IDs sind die stabilen Vektor-IDs des Vektorspeichers (gleich wie die FAISS-IDs)
+    - Postings pro Term als kompakte typed arrays (doc ids int32, term frequencies int32),
+      die beim Scoring ohne Kopie als NumPy-Views gelesen werden
+    - Löschen markiert Dokumente nur als tot; `compact` entfernt sie aus den Postings
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self._postings_ids: List[array] = []
+        self._postings_tf: List[array] = []
+        # indexed by doc id; ids without a document have length 0 and are not alive
+        self._doc_len = array("i")
+        self._alive = array("b")
+        self._num_live = 0
+        self._num_dead = 0  # removed but still in the postings
+        self._total_len = 0
+
+    @property
+    def num_docs(self) -> int:
+        """
+        Number of live documents.
+        """
+        return self._num_live
+
+    def add(self, texts: Iterable[str], doc_ids: Iterable[int]) -> None:
+        """
+        Adds documents under the given ids (ids must be new and increasing).
+        """
+        for text, doc_id in zip(texts, doc_ids):
+            if doc_id < len(self._doc_len):
+                raise ValueError(f"Document id {doc_id} is not new")
+            missing = doc_id - len(self._doc_len)
+            if missing:
+                self._doc_len.extend(array("i", bytes(4 * missing)))
+                self._alive.extend(array("b", bytes(missing)))
+            tf: Dict[str, int] = {}
+            terms = tokenize(text)
+            for t in terms:
+                tf[t] = tf.get(t, 0) + 1
+            for t, count in tf.items():
+                term_id = self.vocab.get(t)
+                if term_id is None:
+                    term_id = len(self._postings_ids)
+                    self.vocab[t] = term_id
+                    self._postings_ids.append(array("i"))
+                    self._postings_tf.append(array("i"))
+                self._postings_ids[term_id].append(doc_id)
+                self._postings_tf[term_id].append(count)
+            self._doc_len.append(len(terms))
+            self._alive.append(1)
+            self._num_live += 1
+            self._total_len += len(terms)
+
+    def remove(self, doc_ids: Iterable[int]) -> None:
+        """
+        Marks documents as deleted, O(len(doc_ids)). They are skipped by `search`
+        and dropped from the postings by `compact`.
+        """
+        for doc_id in doc_ids:
+            if 0 <= doc_id < len(self._alive) and self._alive[doc_id]:
+                self._alive[doc_id] = 0
+                self._total_len -= self._doc_len[doc_id]
+                self._num_live -= 1
+                self._num_dead += 1
+
+    @property
+    def num_dead(self) -> int:
+        """
+        Removed documents still in the postings (until `compact`).
+        """
+        return self._num_dead
+
+    def compact(self) -> None:
+        """
+        Removes deleted documents from all postings lists.
+        """
+        if self._num_dead == 0:
+            return
+        compaction = self.compacted()
+        compaction.build()
+        self.apply_compaction(compaction)
+
+    def compacted(self) -> PostingsCompaction:
+        """
+        Captures what a compaction needs (cheap: list references and lengths); the caller holds
+        a read lock. `PostingsCompaction.build` then filters without any lock, while `add` and
+        `remove` may run again, and `apply_compaction` swaps the result in.
+        """
+        return PostingsCompaction(
+            ids=list(self._postings_ids),
+            tfs=list(self._postings_tf),
+            lengths=[len(p) for p in self._postings_ids],
+            alive=np.frombuffer(self._alive, dtype=np.int8).astype(bool),
+            num_dead=self._num_dead,
+        )
+
+    def apply_compaction(self, compaction: PostingsCompaction) -> None:
+        """
+        Swaps in the built `compaction`, plus the postings added since (O(added)).
+        Documents deleted since stay in the postings until the next compaction.
+        """
+        for term_id, length in enumerate(compaction.lengths):
+            ids, tfs = compaction.ids[term_id], compaction.tfs[term_id]
+            current = self._postings_ids[term_id]
+            if ids is current:
+                continue  # unchanged list, appends went straight into it
+            if len(current) > length:
+                ids.extend(current[length:])
+                tfs.extend(self._postings_tf[term_id][length:])
+            self._postings_ids[term_id] = ids
+            self._postings_tf[term_id] = tfs
+        self._num_dead -= compaction.num_dead
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        allowed: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Returns up to top_k (doc_id, bm25_score) pairs, best first.
+        `allowed` (doc ids) restricts the result, e.g. to a metadata filter.
+        """
+        n = self._num_live
+        if n == 0 or top_k <= 0:
+            return []
+
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids:
+            return []
+
+        doc_len = np.frombuffer(self._doc_len, dtype=np.int32)
+        avgdl = max(self._total_len / n, 1e-9)
+        scores = np.zeros(len(doc_len), dtype=np.float32)
+
+        for term_id in term_ids:
+            ids = np.frombuffer(self._postings_ids[term_id], dtype=np.int32)
+            if len(ids) == 0:
+                continue
+            tf = np.frombuffer(self._postings_tf[term_id], dtype=np.int32).astype(np.float32)
+            df = len(ids)
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[ids] / avgdl)
+            # every doc appears at most once per postings list -> plain fancy-index add is safe
+            scores[ids] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        if self._num_dead:
+            scores *= np.frombuffer(self._alive, dtype=np.int8)
+        if allowed is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[allowed[allowed < len(scores)]] = True
+            scores[~mask] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[part]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def clear(self) -> None:
+        self.vocab = {}
+        self._postings_ids = []
+        self._postings_tf = []
+        self._doc_len = array("i")
+        self._alive = array("b")
+        self._num_live = 0
+        self._num_dead = 0
+        self._total_len = 0
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Flattens the index into a few arrays (for the store snapshot):
+        terms as one UTF-8 buffer + offsets, postings concatenated in term-id order + offsets.
+        """
+        self.compact()
+        terms = sorted(self.vocab, key=self.vocab.get)
+        encoded = [t.encode("utf-8") for t in terms]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(e) for e in encoded], out=term_offsets[1:])
+        postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        if terms:
+            np.cumsum([len(p) for p in self._postings_ids], out=postings_offsets[1:])
+
+        def concat(parts: List[array]) -> np.ndarray:
+            if not parts:
+                return np.zeros(0, dtype=np.int32)
+            return np.concatenate([np.frombuffer(p, dtype=np.int32) for p in parts])
+
+        return {
+            "terms_buffer": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "terms_offsets": term_offsets,
+            "postings_ids": concat(self._postings_ids),
+            "postings_tf": concat(self._postings_tf),
+            "postings_offsets": postings_offsets,
+            "doc_len": np.frombuffer(self._doc_len, dtype=np.int32).copy(),
+            "alive": np.frombuffer(self._alive, dtype=np.int8).copy(),
+            "params": np.array([self.k1, self.b], dtype=np.float64),
+        }
+
+    @classmethod
+    def from_arrays(cls, data: Dict[str, np.ndarray]) -> BM25Index:
+        """
+        Inverse of `to_arrays`.
+        """
+        k1, b = data["params"].tolist()
+        index = cls(k1=k1, b=b)
+        raw = data["terms_buffer"].tobytes()
+        t_off = data["terms_offsets"].tolist()
+        p_off = data["postings_offsets"].tolist()
+        ids = data["postings_ids"].astype(np.int32, copy=False)
+        tfs = data["postings_tf"].astype(np.int32, copy=False)
+        for term_id in range(len(t_off) - 1):
+            index.vocab[raw[t_off[term_id]:t_off[term_id + 1]].decode("utf-8")] = term_id
+            index._postings_ids.append(array("i", ids[p_off[term_id]:p_off[term_id + 1]].tobytes()))
+            index._postings_tf.append(array("i", tfs[p_off[term_id]:p_off[term_id + 1]].tobytes()))
+        doc_len = data["doc_len"].astype(np.int32, copy=False)
+        alive = data["alive"].astype(np.int8, copy=False)
+        index._doc_len = array("i", doc_len.tobytes())
+        index._alive = array("b", alive.tobytes())
+        index._num_live = int(alive.sum())
+        index._total_len = int(doc_len[alive.astype(bool)].sum())
+        return index
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import queue
+import threading
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Lists of up to `size` consecutive items (the last one may be shorter).
+    """
+    it = iter(items)
+    while True:
+        batch = list(islice(it, max(1, size)))
+        if not batch:
+            return
+        yield batch
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def prefetch(items: Iterable[T], maxsize: int, name: str = "prefetch") -> Iterator[T]:
+    """
+    Runs the iterable in a background thread, at most `maxsize` items ahead of the consumer
+    (the producer blocks when the queue is full -> backpressure, bounded memory).
+    Exceptions of the producer are re-raised in the consumer; if the consumer stops early,
+    the producer is stopped at its next item.
+    """
+    q: "queue.Queue[object]" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        it = iter(items)
+        try:
+            for item in it:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:  # noqa: BLE001 - handed to the consumer
+            put(_Failure(e))
+        finally:
+            # a generator gets to run its cleanup (e.g. cancel pending parse shards) in this thread
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item  # type: ignore[misc]
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,335 @@
+"""
+Offline benchmark of the RAG pipeline against the fake LM Studio server (scripts/fake_lmstudio.py).
+No LM Studio needed: embeddings are hash-based, answers canned with configurable latency,
+and the corpus is generated deterministically (seeded synthetic PDFs).
+
+Per corpus size it measures
+- ingest throughput (pages/s, chunks/s) through RAGPipeline.upload_pdfs
+- query latency percentiles and throughput at several concurrency levels,
+  for retrieval only ("retrieve") and full answers via the async path ("answer")
+- process memory (RSS) after ingest and after the queries; every corpus size runs in its own
+  process, so the numbers (including the peak) belong to that size alone
+- the per-stage latencies collected in app.utils.metrics
+and writes everything as JSON (default: data/benchmarks/<timestamp>.json).
+
+    cd backend
+    python -m scripts.benchmark --sizes 50,200,800 --concurrency 1,4,16 --queries 64
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from scripts.fake_lmstudio import FakeLMStudioConfig, serve_in_background
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_OUT_DIR = PROJECT_ROOT / "data" / "benchmarks"
+
+# Vokabular der synthetischen Dokumente (medizintechnischer Fachtext)
+_VOCAB = """
+patient sensor signal catheter implant electrode stimulation imaging ultrasound mri ct dose
+calibration accuracy sensitivity specificity trial cohort device sterilization biocompatibility
+titanium polymer coating impedance frequency amplitude noise filter algorithm classification
+regulatory approval risk hazard failure fatigue wear corrosion tissue bone cardiac neural
+pressure flow temperature monitoring wireless battery firmware validation verification
+measurement uncertainty standard protocol clinical outcome adverse event infection surgery
+""".split()
+
+
+def _rss_mb() -> float:
+    """
+    Current resident set size in MB (Linux /proc; elsewhere the peak RSS).
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _paragraph(rng: np.random.Generator, n_words: int) -> str:
+    words = rng.choice(_VOCAB, size=n_words)
+    return " ".join(words).capitalize() + "."
+
+
+def generate_pdf(path: Path, n_pages: int, seed: int, images: bool) -> None:
+    """
+    Writes a synthetic PDF: every page holds 3-5 paragraphs (30-180 words),
+    every other page a noise image (passes the image filters, so it gets captioned).
+    """
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for page_index in range(n_pages):
+        page = doc.new_page()
+        y = 50.0
+        for _ in range(int(rng.integers(3, 6))):
+            text = _paragraph(rng, int(rng.integers(30, 180)))
+            height = 14.0 * (len(text) // 85 + 2)
+            page.insert_textbox(fitz.Rect(50, y, 545, y + height), text, fontsize=10)
+            y += height + 10
+            if y > 650:
+                break
+        if images and page_index % 2 == 0:
+            pixels = rng.integers(0, 256, size=(160, 240, 3), dtype=np.uint8)
+            pix = fitz.Pixmap(fitz.csRGB, 240, 160, pixels.tobytes(), False)
+            page.insert_image(fitz.Rect(50, 660, 290, 800), pixmap=pix)
+    doc.save(path)
+    doc.close()
+
+
+def generate_corpus(directory: Path, n_pages: int, pages_per_doc: int, images: bool) -> List[str]:
+    names: List[str] = []
+    for i, start in enumerate(range(0, n_pages, pages_per_doc)):
+        name = f"bench_{i:04d}.pdf"
+        generate_pdf(directory / name, min(pages_per_doc, n_pages - start), seed=1000 + i, images=images)
+        names.append(name)
+    return names
+
+
+def make_questions(n: int, seed: int = 7) -> List[str]:
+    rng = np.random.default_rng(seed)
+    return [f"What is known about {' '.join(rng.choice(_VOCAB, size=4))}?" for _ in range(n)]
+
+
+def _latency_stats(latencies: List[float], wall: float) -> Dict[str, float]:
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]).tolist()
+    return {
+        "n": len(latencies),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": float(ms.max()),
+        "qps": len(latencies) / wall if wall > 0 else 0.0,
+    }
+
+
+def run_threaded(fn: Callable[[str], Any], questions: List[str], concurrency: int) -> Dict[str, float]:
+    def timed(q: str) -> float:
+        started = time.perf_counter()
+        fn(q)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, questions))
+    return _latency_stats(latencies, time.perf_counter() - started)
+
+
+def run_async(fn: Callable[[str], Any], questions: List[str], concurrency: int) -> Dict[str, float]:
+    async def main() -> Dict[str, float]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(q: str) -> float:
+            async with semaphore:
+                started = time.perf_counter()
+                await fn(q)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(q) for q in questions))
+        return _latency_stats(list(latencies), time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def bench_corpus(args: argparse.Namespace, n_pages: int, workdir: Path) -> Dict[str, Any]:
+    # imported here: the clients read RAG_LMSTUDIO_URL at import time
+    from app.core.rag_pipeline import RAGPipeline
+    from app.models.embedder_loader import LMStudioEmbedder
+    from app.utils.indexing import FaissVectorStore, IndexConfig, create_index
+    from app.utils.metrics import METRICS
+
+    corpus_dir = workdir / f"corpus_{n_pages}"
+    corpus_dir.mkdir()
+    names = generate_corpus(corpus_dir, n_pages, args.pages_per_doc, args.images)
+
+    METRICS.reset()
+    rss_before = _rss_mb()
+    embedder = LMStudioEmbedder()
+    store = FaissVectorStore(
+        index=create_index(args.dim, IndexConfig(kind=args.index_kind)),
+        chunks=None,
+        embedder=embedder,
+        index_config=IndexConfig(kind=args.index_kind),
+    )
+    rag = RAGPipeline(store=store, top_k=args.top_k)
+
+    # the pipeline's own per-request prints are dropped, the numbers are in the report
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = rag.upload_pdfs(names, corpus_dir, process_images=args.images)
+    ingest_s = time.perf_counter() - started
+    pages = sum(r.num_pages for r in results)
+    chunks = sum(r.num_chunks for r in results)
+    rss_ingest = _rss_mb()
+    print(f"  ingest: {pages} pages, {chunks} chunks in {ingest_s:.2f}s")
+
+    questions = make_questions(args.queries)
+    queries: List[Dict[str, Any]] = []
+    for concurrency in args.concurrency:
+        for mode in ("retrieve", "answer"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                if mode == "retrieve":
+                    stats = run_threaded(lambda q: rag.retrieve(q), questions, concurrency)
+                else:
+                    stats = run_async(rag.aanswer, questions, concurrency)
+            queries.append({"mode": mode, "concurrency": concurrency, **stats})
+            print(
+                f"  {mode:8s} c={concurrency:<3d} p50={stats['p50_ms']:.1f}ms "
+                f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms qps={stats['qps']:.1f}"
+            )
+
+    return {
+        "corpus_pages": n_pages,
+        "documents": len(names),
+        "ingest": {
+            "seconds": ingest_s,
+            "pages": pages,
+            "chunks": chunks,
+            "pages_per_s": pages / ingest_s if ingest_s > 0 else 0.0,
+            "chunks_per_s": chunks / ingest_s if ingest_s > 0 else 0.0,
+        },
+        "memory": {
+            "rss_before_mb": rss_before,
+            "rss_after_ingest_mb": rss_ingest,
+            "rss_after_queries_mb": _rss_mb(),
+            "peak_rss_mb": _peak_rss_mb(),
+        },
+        "queries": queries,
+        "stages": METRICS.summary(),
+    }
+
+
+def bench_in_subprocess(argv: List[str], n_pages: int, workdir: Path) -> Dict[str, Any]:
+    """
+    Runs `bench_corpus` for one size in a fresh interpreter (same arguments), so RSS and
+    peak RSS are not inherited from the previous sizes.
+    """
+    result_file = workdir / f"run_{n_pages}.json"
+    subprocess.run(
+        [
+            sys.executable, "-m", "scripts.benchmark", *argv,
+            "--single-size", str(n_pages),
+            "--workdir", str(workdir),
+            "--result-file", str(result_file),
+        ],
+        cwd=Path(__file__).resolve().parents[1],
+        check=True,
+    )
+    return json.loads(result_file.read_text(encoding="utf-8"))
+
+
+def run_single_size(args: argparse.Namespace) -> None:
+    """
+    Child process of `bench_in_subprocess`: fake server + one corpus size, result as JSON file.
+    """
+    server_config = FakeLMStudioConfig(
+        dim=args.dim,
+        embed_latency_ms=args.embed_latency_ms,
+        ttft_ms=args.ttft_ms,
+        token_ms=args.token_ms,
+        answer_tokens=args.answer_tokens,
+    )
+    base_url, server = serve_in_background(server_config)
+    os.environ["RAG_LMSTUDIO_URL"] = base_url
+    print(f"✅ fake LM Studio at {base_url}")
+
+    from app.preprocessing.pdf_preprocessor import shutdown_parse_pool
+
+    try:
+        run = bench_corpus(args, args.single_size, args.workdir)
+    finally:
+        shutdown_parse_pool()
+        server.should_exit = True
+    args.result_file.write_text(json.dumps(run), encoding="utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,200", help="corpus sizes in pages, comma separated")
+    parser.add_argument("--pages-per-doc", type=int, default=25)
+    parser.add_argument("--concurrency", default="1,4,16", help="query concurrency levels, comma separated")
+    parser.add_argument("--queries", type=int, default=64, help="queries per concurrency level and mode")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--index-kind", default="flat")
+    parser.add_argument("--images", action="store_true", help="add images to the corpus and caption them")
+    parser.add_argument("--dim", type=int, default=FakeLMStudioConfig.dim)
+    parser.add_argument("--embed-latency-ms", type=float, default=2.0)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=2.0)
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument("--out", type=Path, default=None, help="result JSON (default: data/benchmarks/<timestamp>.json)")
+    # internal: one corpus size in a child process (see bench_in_subprocess)
+    parser.add_argument("--single-size", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", type=Path, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=Path, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    if args.single_size is not None:
+        run_single_size(args)
+        return
+    started_at = datetime.now(timezone.utc)
+
+    runs: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        for n_pages in args.sizes:
+            print(f"corpus: {n_pages} pages")
+            runs.append(bench_in_subprocess(sys.argv[1:], n_pages, Path(tmp)))
+
+    report = {
+        "meta": {
+            "timestamp": started_at.isoformat(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        },
+        "runs": runs,
+    }
+    out = args.out or DEFAULT_OUT_DIR / f"bench-{started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"✅ results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
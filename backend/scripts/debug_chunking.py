@@ -1,6 +1,7 @@
 from pathlib import Path
 from app.preprocessing.pdf_preprocessor import preprocess_pdf
-from app.utils.chunker import chunk_layout_small2big_mod, expand_chunk_small2big_mod
+from app.utils.chunk_store import ChunkStore
+from app.utils.chunker import chunk_layout_small2big_mod
 
 def main():
     project_root = Path(__file__).resolve().parents[2]
@@ -11,8 +12,12 @@ def main():
         document_id="foo.pdf",
         layout_pages=preprocessed_layout_pages,
     )
-    hit = chunks[5]
-    expanded_chunks = expand_chunk_small2big_mod(hit, chunks)
+    # expand like the retrieval does: a split chunk -> its full parent block, a small block stays as it is
+    store = ChunkStore()
+    rows = store.add(chunks)
+    hit = int(rows[5])
+    expanded_rows = store.block_rows(hit) if store.splited(hit) else [hit]
+    expanded_chunks = [store.chunk(int(r)) for r in expanded_rows]
     
     print(f"Total chunks: {len(chunks)}")
 
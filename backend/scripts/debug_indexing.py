@@ -1,50 +1,36 @@
 from pathlib import Path
 
-from backend.app.models.embedder_loader import LMStudioEmbedder
-from backend.app.utils.indexing import FaissVectorStore
-from backend.app.preprocessing.pdf_preprocessor import preprocess_pdf
-from backend.app.utils.chunker import chunk_text  # oder deine Wrapper-Funktion
+from app.models.embedder_loader import LMStudioEmbedder
+from app.utils.indexing import FaissVectorStore
+from app.preprocessing.pdf_preprocessor import preprocess_pdf
+from app.utils.chunker import TextChunk, chunk_layout_small2big_mod
 
 
-def build_chunks_for_food_allergy_docs() -> list[dict]:
+def build_chunks_for_food_allergy_docs() -> list[TextChunk]:
     """
-    Beispiel: nimmt alle PDFs im Ordner data/raw/food_allergy_pdfs,
-    preprocess't sie und chunkt sie.
+    Beispiel: nimmt alle PDFs im Ordner data/,
+    preprocess't sie und chunkt sie (small2big, wie die Pipeline).
     """
-    project_root = Path(__file__).resolve().parents[1]
+    project_root = Path(__file__).resolve().parents[2]
     print(f" Project root: {project_root}")
     pdf_folder = project_root / "data"
 
-    chunks: list[dict] = []
-    doc_counter = 0
+    chunks: list[TextChunk] = []
 
     for pdf_path in pdf_folder.glob("*.pdf"):
-        doc_counter += 1
-        document_id = pdf_path.stem
+        document_id = pdf_path.name
         print(f"Processing {document_id}...")
 
-        preprocessed_text = preprocess_pdf(pdf_path, language="en")
+        page_layouts = preprocess_pdf(pdf_path, language="en")
 
-        doc_chunks = chunk_text(
-            document_id=document_id,
-            text=preprocessed_text,
-            chunk_size_words=220,
-            chunk_overlap_words=40,
-        )
-
-        for i, ch in enumerate(doc_chunks):
-            chunks.append(
-                {
-                    "id": ch.id,
-                    "document_id": ch.document_id,
-                    "page": None,  # optional
-                    "chunk_index": ch.chunk_index,
-                    "global_chunk_id": len(chunks),
-                    "content": ch.content,
-                    "start_char": ch.start_char,
-                    "end_char": ch.end_char,
-                }
+        chunks.extend(
+            chunk_layout_small2big_mod(
+                document_id=document_id,
+                layout_pages=page_layouts,
+                chunk_size=100,
+                overlap=20,
             )
+        )
 
     print(f"Total chunks across all PDFs: {len(chunks)}")
     return chunks
@@ -64,11 +50,13 @@ def main() -> None:
     
     results = vector_store.search_by_embedding(query_embedding, top_k=5)
 
+    # hits only carry the vector id; the chunk fields live in the store's ChunkStore
+    store_chunks = vector_store.chunks
     for i, res in enumerate(results, start=1):
-        meta = res["metadata"]
+        vid = res["vid"]
         print(f"#{i}  score={res['score']:.4f}")
-        print(f"   doc_id: {meta.get('document_id')}, chunk_index: {meta.get('chunk_index')}")
-        print(f"   content snippet: {meta.get('content')[:200]}...")
+        print(f"   doc_id: {store_chunks.document_id(vid)}, chunk_index: {store_chunks.chunk_index(vid)}")
+        print(f"   content snippet: {store_chunks.content(vid)[:200]}...")
         print("-" * 80)
 
 
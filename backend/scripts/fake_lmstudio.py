@@ -0,0 +1,199 @@
+"""
+Deterministic stand-in for the LM Studio OpenAI-compatible API, for benchmarks and offline runs.
+- /v1/embeddings: hash-based bag-of-words vectors (same text -> same vector, shared words -> similar vectors)
+- /v1/chat/completions: canned answers / image captions, optionally streamed, with configurable latency
+
+Run standalone:
+    python -m scripts.fake_lmstudio --port 1234 --ttft-ms 50 --token-ms 5
+and point the backend at it with RAG_LMSTUDIO_URL=http://127.0.0.1:1234/v1.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class FakeLMStudioConfig:
+    dim: int = 768
+    embed_latency_ms: float = 0.0   # per embeddings request
+    ttft_ms: float = 50.0           # chat: time to first token
+    token_ms: float = 5.0           # chat: time between tokens
+    answer_tokens: int = 64         # chat: tokens per answer / caption
+
+
+@lru_cache(maxsize=200_000)
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype("float32")
+
+
+def hash_embedding(text: str, dim: int) -> np.ndarray:
+    """
+    Normalized sum of per-word random vectors (seeded by the word's hash).
+    """
+    words = _WORD_RE.findall(text.lower()) or [text]
+    v = np.sum([_word_vector(w, dim) for w in words], axis=0)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
+
+
+def _canned_tokens(messages: List[Dict[str, Any]], n_tokens: int) -> List[str]:
+    """
+    Deterministic answer for a conversation: a caption for image requests, otherwise
+    an answer that repeats words of the question.
+    """
+    last = messages[-1]["content"] if messages else ""
+    if isinstance(last, list):
+        words = ["The", "figure", "shows", "a", "labelled", "diagram", "with", "axes", "and", "annotations."]
+    else:
+        words = ["According", "to", "the", "context,"] + _WORD_RE.findall(str(last))[:16]
+    return [f"{words[i % len(words)]} " for i in range(n_tokens)]
+
+
+def create_app(config: FakeLMStudioConfig) -> FastAPI:
+    app = FastAPI(title="fake-lmstudio")
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "bench"}]}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        if config.embed_latency_ms:
+            await asyncio.sleep(config.embed_latency_ms / 1000)
+        data = []
+        for i, text in enumerate(inputs):
+            v = hash_embedding(text, config.dim)
+            # the openai client asks for base64 (little-endian float32) by default
+            if body.get("encoding_format") == "base64":
+                embedding: Any = base64.b64encode(v.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = v.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        n_tokens = sum(len(t.split()) for t in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        n_tokens = min(config.answer_tokens, int(body.get("max_tokens") or config.answer_tokens))
+        tokens = _canned_tokens(body.get("messages", []), n_tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep((config.ttft_ms + config.token_ms * (len(tokens) - 1)) / 1000)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }
+
+        async def events():
+            await asyncio.sleep(config.ttft_ms / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(config.token_ms / 1000)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_background(config: FakeLMStudioConfig, port: int = 0) -> Tuple[str, uvicorn.Server]:
+    """
+    Starts the fake server in a daemon thread and returns (base_url, server);
+    set `server.should_exit = True` to stop it.
+    """
+    port = port or _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    )
+    threading.Thread(target=server.run, name="fake-lmstudio", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1", server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--dim", type=int, default=FakeLMStudioConfig.dim)
+    parser.add_argument("--embed-latency-ms", type=float, default=FakeLMStudioConfig.embed_latency_ms)
+    parser.add_argument("--ttft-ms", type=float, default=FakeLMStudioConfig.ttft_ms)
+    parser.add_argument("--token-ms", type=float, default=FakeLMStudioConfig.token_ms)
+    parser.add_argument("--answer-tokens", type=int, default=FakeLMStudioConfig.answer_tokens)
+    args = parser.parse_args()
+    config = FakeLMStudioConfig(
+        dim=args.dim,
+        embed_latency_ms=args.embed_latency_ms,
+        ttft_ms=args.ttft_ms,
+        token_ms=args.token_ms,
+        answer_tokens=args.answer_tokens,
+    )
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import hashlib
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.utils.chunker import TextChunk
+from app.utils.indexing import FaissVectorStore, IndexConfig, create_index
+
+DIM = 32
+
+
+class HashEmbedder:
+    """
+    Deterministic embedder for tests: one pseudo-random vector per text (no LM Studio needed).
+    """
+
+    def __init__(self, dim: int = DIM) -> None:
+        self.dim = dim
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            out[i] = np.random.default_rng(seed).standard_normal(self.dim)
+        return out
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self.embed_texts([text])[0]
+
+
+def make_chunks(document_id: str, n: int, page_size: int = 10) -> List[TextChunk]:
+    """
+    `n` unsplit chunks of a document, `page_size` per page, each with a unique word.
+    """
+    return [
+        TextChunk(
+            id=f"{document_id}-{i}",
+            document_id=document_id,
+            page_id=i // page_size,
+            parent_block_id=i,
+            chunk_index=i,
+            content=f"w{document_id}x{i} shared text",
+            splited=False,
+            wordcount=3,
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def embedder() -> HashEmbedder:
+    return HashEmbedder()
+
+
+@pytest.fixture
+def make_store(embedder):
+    """
+    Factory for an empty FaissVectorStore of the given kind (background compaction disabled,
+    tests call `compact` themselves).
+    """
+
+    def make(kind: str = "flat", **config) -> FaissVectorStore:
+        index_config = IndexConfig(kind=kind, **config)
+        store = FaissVectorStore(
+            index=create_index(DIM, index_config),
+            chunks=None,
+            embedder=embedder,
+            index_config=index_config,
+        )
+        store.schedule_compaction = lambda: None
+        return store
+
+    return make
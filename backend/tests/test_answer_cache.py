@@ -0,0 +1,43 @@
+import numpy as np
+
+import app.utils.answer_cache as answer_cache
+from app.utils.answer_cache import AnswerCache
+
+
+def _vec(*values):
+    return np.array(values, dtype="float32")
+
+
+def test_hit_above_threshold_in_same_scope_only():
+    cache = AnswerCache(threshold=0.95)
+    cache.put("v1", _vec(1, 0, 0), {"answer": "a"})
+    cache.put("v1", _vec(0, 1, 0), {"answer": "b"})
+
+    # not normalized, slightly rotated: still the same question
+    assert cache.get("v1", _vec(3, 0.3, 0)) == {"answer": "a"}
+    assert cache.get("v1", _vec(1, 1, 0)) is None  # cos = 0.71
+    assert cache.get("v2", _vec(1, 0, 0)) is None
+    assert cache.get("v1", _vec(1, 0)) is None  # other embedding dim
+    assert cache.stats() == {"hits": 1, "misses": 3, "entries": 2}
+
+    cache.clear()
+    assert cache.get("v1", _vec(1, 0, 0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(max_entries=2, ttl_seconds=60.0)
+    cache.put("s", _vec(1, 0, 0), {"answer": "x"})
+    cache.put("s", _vec(0, 1, 0), {"answer": "y"})
+    assert cache.get("s", _vec(1, 0, 0)) == {"answer": "x"}  # x is now the most recent
+
+    cache.put("s", _vec(0, 0, 1), {"answer": "z"})
+    assert cache.get("s", _vec(0, 1, 0)) is None  # y was evicted
+    assert cache.get("s", _vec(1, 0, 0)) == {"answer": "x"}
+
+    now[0] += 61.0
+    assert cache.get("s", _vec(0, 0, 1)) is None
+    cache.put("s", _vec(0, 1, 0), {"answer": "y2"})
+    assert cache.stats()["entries"] == 1  # expired entries are dropped on put
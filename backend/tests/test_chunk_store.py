@@ -0,0 +1,141 @@
+from app.utils.chunk_store import ChunkStore, SearchFilter
+from app.utils.chunker import TextChunk
+
+
+def _chunks(document_id, parent_block_id, n, start_index=0):
+    return [
+        TextChunk(
+            id=f"{document_id}-{parent_block_id}-s{i}",
+            document_id=document_id,
+            page_id=parent_block_id // 1000,
+            parent_block_id=parent_block_id,
+            chunk_index=start_index + i,
+            content=f"{document_id} block {parent_block_id} part {i}",
+            splited=True,
+            wordcount=4,
+        )
+        for i in range(n)
+    ]
+
+
+def test_block_split_over_two_adds_is_one_block():
+    store = ChunkStore()
+    block = _chunks("a.pdf", 13001, 4)
+    other = _chunks("a.pdf", 13002, 2, start_index=4)
+
+    first = store.add(_chunks("a.pdf", 12000, 1) + block[:1])
+    second = store.add(block[1:] + other)
+
+    block_rows = [int(first[-1])] + second[:3].tolist()
+    for row in block_rows:
+        assert store.block_rows(row).tolist() == block_rows
+    assert [store.content(r) for r in store.block_rows(block_rows[0])] == [c.content for c in block]
+    assert store.block_rows(int(second[-1])).tolist() == second[3:].tolist()
+    assert store.block_rows(int(first[0])).tolist() == [int(first[0])]
+    assert store.document_rows("a.pdf").tolist() == list(range(7))
+
+
+def test_block_does_not_continue_into_other_document_or_deleted_rows():
+    store = ChunkStore()
+    store.add(_chunks("a.pdf", 1000, 2))
+    rows_b = store.add(_chunks("b.pdf", 1000, 2))
+    assert store.block_rows(int(rows_b[0])).tolist() == rows_b.tolist()
+
+    store.remove_document("b.pdf")
+    rows_b2 = store.add(_chunks("b.pdf", 1000, 1))
+    assert store.block_rows(int(rows_b2[0])).tolist() == rows_b2.tolist()
+
+
+def test_block_continues_when_documents_interleave():
+    store = ChunkStore()
+    block_a = _chunks("a.pdf", 5001, 4)
+    block_b = _chunks("b.pdf", 5001, 3)
+
+    # two documents streamed in parallel: their batches alternate, the blocks are cut in between
+    rows_a1 = store.add(block_a[:2])
+    rows_b1 = store.add(block_b[:1])
+    rows_a2 = store.add(block_a[2:])
+    rows_b2 = store.add(block_b[1:])
+    # one batch mixing both documents (e.g. a re-insert) keeps the blocks apart as well
+    mixed = _chunks("c.pdf", 7, 2) + _chunks("d.pdf", 7, 1) + _chunks("c.pdf", 7, 1, start_index=2)
+    rows_mixed = store.add(mixed)
+
+    expected_a = rows_a1.tolist() + rows_a2.tolist()
+    expected_b = rows_b1.tolist() + rows_b2.tolist()
+    for row in expected_a:
+        assert store.block_rows(row).tolist() == expected_a
+    for row in expected_b:
+        assert store.block_rows(row).tolist() == expected_b
+    assert [store.content(r) for r in store.block_rows(expected_a[-1])] == [c.content for c in block_a]
+    assert store.block_rows(int(rows_mixed[0])).tolist() == [int(rows_mixed[i]) for i in (0, 1, 3)]
+    assert store.block_rows(int(rows_mixed[2])).tolist() == [int(rows_mixed[2])]
+
+    # a restored store keeps the blocks and continues them
+    restored = ChunkStore.from_arrays(store.to_arrays())
+    assert restored.block_rows(expected_a[0]).tolist() == expected_a
+    more_b = restored.add(_chunks("b.pdf", 5001, 1, start_index=3))
+    assert restored.block_rows(expected_b[0]).tolist() == expected_b + more_b.tolist()
+
+
+def test_remove_and_compact_keep_row_ids_and_text():
+    store = ChunkStore()
+    rows_a = store.add(_chunks("a.pdf", 1, 3))
+    rows_b = store.add(_chunks("b.pdf", 1, 2))
+
+    removed = store.remove_document("a.pdf")
+    assert removed.tolist() == rows_a.tolist()
+    assert store.remove_document("a.pdf").tolist() == []
+    assert len(store) == 2 and store.document_ids() == ["b.pdf"]
+    assert not any(store.is_alive(int(r)) for r in rows_a)
+
+    store.compact()
+    # row ids stay reserved, the live rows keep their text and ids
+    assert store.num_rows == 5
+    assert [store.content(int(r)) for r in rows_b] == ["b.pdf block 1 part 0", "b.pdf block 1 part 1"]
+    assert [store.chunk_id(int(r)) for r in rows_b] == ["b.pdf-1-s0", "b.pdf-1-s1"]
+    rows_c = store.add(_chunks("c.pdf", 1, 1))
+    assert rows_c.tolist() == [5] and store.content(5) == "c.pdf block 1 part 0"
+
+
+def test_compaction_keeps_rows_added_and_deleted_while_it_builds():
+    store = ChunkStore()
+    store.add(_chunks("a.pdf", 1, 2))
+    rows_b = store.add(_chunks("b.pdf", 1, 2))
+    store.remove_document("a.pdf")
+
+    compaction = store.compacted()
+    rows_c = store.add(_chunks("c.pdf", 1, 2))
+    store.remove_document("b.pdf")
+    compaction.build()
+    store.apply_compaction(compaction)
+
+    assert [store.content(int(r)) for r in rows_c] == ["c.pdf block 1 part 0", "c.pdf block 1 part 1"]
+    assert store.document_ids() == ["c.pdf"]
+    # b.pdf was deleted after the capture: dropped by the next compaction
+    assert store.content(int(rows_b[0])) == "b.pdf block 1 part 0"
+    store.compact()
+    assert [store.chunk_id(int(r)) for r in rows_c] == ["c.pdf-1-s0", "c.pdf-1-s1"]
+
+    restored = ChunkStore.from_arrays(store.to_arrays())
+    assert restored.document_ids() == ["c.pdf"]
+    assert [restored.content(int(r)) for r in rows_c] == [store.content(int(r)) for r in rows_c]
+
+
+def test_filter_rows_by_document_page_and_block_type():
+    store = ChunkStore()
+    store.add(_chunks("a.pdf", 1001, 2) + _chunks("a.pdf", 2001, 2, start_index=2))
+    caption = _chunks("a.pdf", 2002, 1, start_index=4)[0]
+    caption.block_type = "figure_description"
+    store.add([caption] + _chunks("b.pdf", 1001, 2))
+
+    assert store.filter_rows(SearchFilter(document_ids=frozenset({"b.pdf"}))).tolist() == [5, 6]
+    assert store.filter_rows(SearchFilter.create(page_from=2, page_to=2)).tolist() == [2, 3, 4]
+    assert store.filter_rows(SearchFilter.create(block_types=["figure_description"])).tolist() == [4]
+    assert store.filter_rows(
+        SearchFilter.create(document_ids=["a.pdf"], page_to=1, block_types=["text"])
+    ).tolist() == [0, 1]
+    assert store.filter_rows(SearchFilter.create(block_types=["table"])).tolist() == []
+    assert SearchFilter.create() is None
+
+    store.remove_document("a.pdf")
+    assert store.filter_rows(SearchFilter.create(page_from=0)).tolist() == [5, 6]
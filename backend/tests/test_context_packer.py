@@ -0,0 +1,63 @@
+from app.utils.chunk_store import ChunkStore
+from app.utils.chunker import TextChunk
+from app.utils.context_packer import TokenCounter, pack_context
+
+
+def _store() -> ChunkStore:
+    # parent block 1: three sliding windows sharing two words; block 2: one long chunk; block 3: short
+    texts = [(1, 0, "alpha beta gamma delta"), (1, 1, "gamma delta epsilon zeta"), (1, 2, "epsilon zeta eta theta")]
+    texts += [(2, 3, " ".join(f"word{i}" for i in range(200))), (3, 4, "short closing chunk")]
+    store = ChunkStore()
+    store.add(
+        [
+            TextChunk(
+                id=f"c{index}",
+                document_id="a.pdf",
+                page_id=0,
+                parent_block_id=block,
+                chunk_index=index,
+                content=content,
+                splited=True,
+                wordcount=len(content.split()),
+            )
+            for block, index, content in texts
+        ]
+    )
+    return store
+
+
+def test_token_counter_estimates_without_tokenizer():
+    counter = TokenCounter(None)
+    assert not counter.exact
+    assert counter.count("ten words, roughly") == 5  # ceil(3 * 1.3) + 1 punctuation
+    assert counter.count_many(["a b", ""]) == [3, 0]
+
+
+def test_hits_of_one_block_are_merged_without_overlap():
+    store = _store()
+    counter = TokenCounter(None)
+    packed = pack_context([(0.9, [2, 1]), (0.5, [0, 1])], store, counter, max_tokens=1000, max_overlap=2)
+
+    assert packed.dropped == 0 and len(packed.spans) == 1
+    span = packed.spans[0]
+    assert span.chunk_indices == [0, 1, 2] and span.score == 0.9
+    assert span.text == "alpha beta gamma delta epsilon zeta eta theta"
+    assert packed.tokens == span.tokens == counter.count(f"{span.header()}\n{span.text}")
+    assert packed.text() == f"{span.header()}\n{span.text}"
+
+
+def test_budget_truncates_or_drops_spans():
+    store = _store()
+    counter = TokenCounter(None)
+    hits = [(0.9, [0]), (0.8, [3]), (0.7, [4])]
+
+    packed = pack_context(hits, store, counter, max_tokens=120, min_truncated_tokens=16)
+    assert [s.chunk_indices for s in packed.spans] == [[0], [3]]
+    long_span = packed.spans[1]
+    assert long_span.truncated and long_span.text.startswith("word0 word1")
+    assert packed.dropped == 1 and packed.tokens <= 120
+
+    # too little room left for a useful truncation: the long span is dropped, the short one still fits
+    packed = pack_context(hits, store, counter, max_tokens=50, min_truncated_tokens=64)
+    assert [s.chunk_indices for s in packed.spans] == [[0], [4]]
+    assert packed.dropped == 1 and packed.tokens <= 50
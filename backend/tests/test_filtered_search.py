@@ -0,0 +1,74 @@
+import faiss
+import numpy as np
+
+import app.utils.indexing as indexing
+from app.utils.chunk_store import SearchFilter
+
+from conftest import make_chunks
+
+
+def _ivf_store(make_store):
+    store = make_store("ivf_flat", nlist=16, nprobe=2)
+    for d in range(20):
+        store.add_chunks(make_chunks(f"d{d}", 100))
+    assert isinstance(store.index, faiss.IndexIVFFlat)
+    return store
+
+
+def _exact_top_k(store, embedder, query: str, rows: np.ndarray, k: int):
+    q = embedder.embed_text(query)
+    q = q / np.linalg.norm(q)
+    vectors = embedder.embed_texts([store.chunks.content(int(r)) for r in rows])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = vectors @ q
+    order = np.argsort(-scores, kind="stable")[:k]
+    return rows[order].tolist(), scores[order]
+
+
+def test_ivf_small_filter_is_exact_and_scans_no_lists(make_store, embedder):
+    store = _ivf_store(make_store)
+    query = "wd3x5 shared text"
+    search_filter = SearchFilter.create(document_ids=["d3"])
+    rows = store.chunks.document_rows("d3")
+
+    faiss.cvar.indexIVF_stats.reset()
+    hits = store.search_by_text(query, top_k=10, search_filter=search_filter)
+    # scored against the filtered vectors only: no inverted list is scanned
+    assert faiss.cvar.indexIVF_stats.ndis == 0
+
+    expected, scores = _exact_top_k(store, embedder, query, rows, 10)
+    assert [h["vid"] for h in hits] == expected
+    assert np.allclose([h["score"] for h in hits], scores, atol=1e-5)
+
+    # an unfiltered query probes nprobe lists, far fewer than all vectors
+    faiss.cvar.indexIVF_stats.reset()
+    store.search_by_text(query, top_k=10)
+    assert 0 < faiss.cvar.indexIVF_stats.ndis < store.index.ntotal
+
+
+def test_ivf_filter_after_delete_and_compact(make_store, embedder):
+    store = _ivf_store(make_store)
+    store.delete_document("d4")
+    store.compact()
+    assert store.index.ntotal == 1900
+
+    query = "wd5x7 shared text"
+    hits = store.search_by_text(query, top_k=5, search_filter=SearchFilter.create(document_ids=["d4", "d5"]))
+    expected, _ = _exact_top_k(store, embedder, query, store.chunks.document_rows("d5"), 5)
+    assert [h["vid"] for h in hits] == expected
+
+
+def test_ivf_large_filter_keeps_nprobe(make_store, monkeypatch):
+    store = _ivf_store(make_store)
+    monkeypatch.setattr(indexing, "FILTER_EXACT_MAX", 10)
+    allowed = set(store.chunks.document_rows("d1").tolist()) | set(store.chunks.document_rows("d2").tolist())
+
+    faiss.cvar.indexIVF_stats.reset()
+    store.search_by_text("wd1x3 shared text", top_k=5)
+    unfiltered = faiss.cvar.indexIVF_stats.nlist
+
+    faiss.cvar.indexIVF_stats.reset()
+    hits = store.search_by_text("wd1x3 shared text", top_k=5, search_filter=SearchFilter.create(document_ids=["d1", "d2"]))
+    # the selector search probes as many lists as an unfiltered one, not all of them
+    assert faiss.cvar.indexIVF_stats.nlist == unfiltered
+    assert hits and all(h["vid"] in allowed for h in hits)
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.ingest_jobs import IngestJobQueue
+
+from conftest import make_chunks
+
+
+def test_submit_after_shutdown(make_store, tmp_path):
+    store = make_store()
+    store.add_chunks(make_chunks("a.pdf", 3))
+    jobs = IngestJobQueue(SimpleNamespace(store=store), max_workers=1)
+    jobs.shutdown()
+
+    # an upload is not queued at all (the caller releases its claims)
+    with pytest.raises(RuntimeError):
+        jobs.submit(["b.pdf"], tmp_path)
+
+    # a re-index is reported as a failed job
+    job = jobs.submit_reindex()
+    assert job.status == "failed" and job.finished_at is not None
+    assert "could not be queued" in job.error
+    assert jobs.get(job.id) is job
+    assert job.to_dict()["documents_total"] == 1
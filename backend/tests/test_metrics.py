@@ -0,0 +1,52 @@
+import pytest
+
+from app.utils.metrics import StageMetrics, StageTotals
+
+
+def test_summary_counts_sums_and_quantiles():
+    metrics = StageMetrics(window=4)
+    for seconds in (0.5, 0.1, 0.2, 0.3, 0.4):
+        metrics.observe("search", seconds)
+    with pytest.raises(RuntimeError):
+        with metrics.time("llm"):
+            raise RuntimeError("timed even when it raises")
+
+    summary = metrics.summary()
+    assert list(summary) == ["llm", "search"]
+    search = summary["search"]
+    assert search["count"] == 5 and search["sum"] == pytest.approx(1.5) and search["mean"] == pytest.approx(0.3)
+    # quantiles over the last `window` observations only (0.5 dropped out)
+    assert search["p50"] == pytest.approx(0.25) and search["p99"] < 0.4 + 1e-9
+    assert summary["llm"]["count"] == 1
+
+    metrics.reset()
+    assert metrics.summary() == {}
+
+
+def test_prometheus_histogram_is_cumulative():
+    metrics = StageMetrics(buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.05, 5.0):
+        metrics.observe("embed", seconds)
+    text = metrics.render_prometheus(prefix="t")
+
+    assert "# TYPE t_stage_duration_seconds histogram" in text
+    assert 't_stage_duration_seconds_bucket{stage="embed",le="0.01"} 1' in text
+    assert 't_stage_duration_seconds_bucket{stage="embed",le="0.1"} 3' in text
+    assert 't_stage_duration_seconds_bucket{stage="embed",le="1.0"} 3' in text
+    assert 't_stage_duration_seconds_bucket{stage="embed",le="+Inf"} 4' in text
+    assert 't_stage_duration_seconds_count{stage="embed"} 4' in text
+    assert 't_stage_latency_seconds{stage="embed",quantile="0.5"} 0.05' in text
+    assert text.endswith("\n")
+
+
+def test_stage_totals_record_one_observation_per_stage():
+    metrics = StageMetrics()
+    totals = StageTotals(metrics)
+    for _ in range(3):
+        with totals.time("caption"):
+            pass
+    assert metrics.summary() == {}
+    totals.flush()
+    assert metrics.summary()["caption"]["count"] == 1
+    totals.flush()
+    assert metrics.summary()["caption"]["count"] == 1
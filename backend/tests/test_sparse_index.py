@@ -0,0 +1,76 @@
+import numpy as np
+
+from app.utils.sparse_index import BM25Index, tokenize
+
+TEXTS = [
+    "BRCA1 mutations and breast cancer risk",
+    "IL-6 signalling in covid-19 patients",
+    "breast cancer screening with mammography",
+    "the il-6 receptor antagonist tocilizumab",
+]
+
+
+def _index() -> BM25Index:
+    index = BM25Index()
+    index.add(TEXTS, range(len(TEXTS)))
+    return index
+
+
+def test_tokenize_keeps_identifiers_and_drops_stopwords():
+    assert tokenize("The IL-6 level of x1.5 in COVID-19 is high") == ["il-6", "level", "x1.5", "covid-19", "high"]
+
+
+def test_search_ranks_by_bm25_and_respects_allowed():
+    index = _index()
+    hits = index.search("il-6 tocilizumab", top_k=5)
+    assert [doc for doc, _ in hits] == [3, 1]
+    assert hits[0][1] > hits[1][1] > 0
+
+    assert [doc for doc, _ in index.search("brca1 breast cancer", top_k=1)] == [0]
+    assert [doc for doc, _ in index.search("breast cancer", allowed=np.array([2, 3]))] == [2]
+    assert index.search("unknown words") == []
+
+
+def test_remove_compact_and_add_after():
+    index = _index()
+    before = dict(index.search("breast cancer"))
+    index.remove([0])
+    assert index.num_docs == 3 and index.num_dead == 1
+    assert [doc for doc, _ in index.search("breast cancer")] == [2]
+
+    index.compact()
+    assert index.num_dead == 0
+    assert [doc for doc, _ in index.search("breast cancer")] == [2]
+    # fewer documents contain the terms now: higher idf
+    assert index.search("breast cancer")[0][1] > before[2]
+
+    index.add(["breast cancer genetics"], [7])
+    assert {doc for doc, _ in index.search("breast cancer")} == {2, 7}
+
+
+def test_compaction_keeps_postings_added_while_it_builds():
+    index = _index()
+    index.remove([1])
+    compaction = index.compacted()
+    index.add(["il-6 inhibitors", "new term only here"], [4, 5])
+    index.remove([3])
+    compaction.build()
+    index.apply_compaction(compaction)
+
+    assert index.num_dead == 1  # doc 3, deleted after the capture
+    assert [doc for doc, _ in index.search("il-6")] == [4]
+    assert [doc for doc, _ in index.search("only")] == [5]
+    index.compact()
+    assert index.num_dead == 0
+    assert [doc for doc, _ in index.search("il-6")] == [4]
+
+
+def test_arrays_round_trip():
+    index = _index()
+    index.remove([2])
+    restored = BM25Index.from_arrays(index.to_arrays())
+    assert restored.num_docs == 3
+    for query in ("breast cancer", "il-6", "tocilizumab receptor"):
+        assert restored.search(query) == index.search(query)
+    restored.add(["mammography trial"], [9])
+    assert [doc for doc, _ in restored.search("mammography")] == [9]
@@ -0,0 +1,144 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.utils.chunk_store import SearchFilter
+from app.utils.indexing import FaissVectorStore
+
+from conftest import make_chunks
+
+# small enough to train in a test: 8 documents x 100 chunks = 800 vectors
+KIND_CONFIGS = {
+    "flat": {},
+    "hnsw": {"hnsw_m": 16},
+    "ivf_flat": {"nlist": 16, "nprobe": 16},
+    "ivf_pq": {"nlist": 16, "nprobe": 16, "pq_m": 8, "pq_nbits": 4},
+}
+QUERIES = ["wd1x5 shared text", "wd3x42 shared text", "wd6x99 shared text"]
+
+
+def _filled_store(make_store, kind: str) -> FaissVectorStore:
+    store = make_store(kind, **KIND_CONFIGS[kind])
+    for d in range(8):
+        store.add_chunks(make_chunks(f"d{d}", 100))
+    if kind.startswith("ivf"):
+        assert isinstance(store.index, faiss.IndexIVF)
+    return store
+
+
+def _vids(store: FaissVectorStore, query: str, **kwargs):
+    return [h["vid"] for h in store.search_by_text(query, top_k=5, **kwargs)]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("kind", list(KIND_CONFIGS))
+def test_snapshot_round_trip(make_store, embedder, tmp_path, kind, mmap):
+    store = _filled_store(make_store, kind)
+    store.delete_document("d2")  # saved as not yet compacted ids
+    store.set_document_meta("d1", process_images=False)
+    expected = [store.search_by_text(q, top_k=5) for q in QUERIES]
+    store.save(tmp_path)
+    assert FaissVectorStore.snapshot_exists(tmp_path)
+
+    loaded = FaissVectorStore.load(tmp_path, embedder=embedder, mmap=mmap)
+    loaded.schedule_compaction = lambda: None
+    assert loaded.mmapped == mmap
+    assert type(loaded.index) is type(store.index)
+    assert loaded.index_config == store.index_config
+    assert sorted(loaded.document_ids()) == sorted(store.document_ids())
+    assert loaded.document_meta("d1") == {"process_images": False}
+    for query, hits in zip(QUERIES, expected):
+        got = loaded.search_by_text(query, top_k=5)
+        assert [h["vid"] for h in got] == [h["vid"] for h in hits]
+        assert np.allclose([h["score"] for h in got], [h["score"] for h in hits], atol=1e-5)
+    assert loaded.search_hybrid("wd3x42", top_k=3) == store.search_hybrid("wd3x42", top_k=3)
+    assert _vids(loaded, "wd2x5 shared text", search_filter=SearchFilter.create(document_ids=["d2"])) == []
+
+    # the first write copies a memory-mapped index into memory
+    ids = loaded.add_chunks(make_chunks("new", 3))
+    assert not loaded.mmapped
+    assert loaded.chunks.content(ids[0]) == "wnewx0 shared text"
+    assert ids[0] in _vids(loaded, "wnewx0 shared text", search_filter=SearchFilter.create(document_ids=["new"]))
+
+
+@pytest.mark.parametrize("kind", list(KIND_CONFIGS))
+def test_delete_compact_search(make_store, embedder, tmp_path, kind):
+    store = _filled_store(make_store, kind)
+    d3_rows = set(store.chunks.document_rows("d3").tolist())
+    assert store.delete_document("d3") == 100
+    assert store.delete_document("d3") == 0
+    # deleted before compaction: filtered out of every search
+    assert not d3_rows & set(_vids(store, "wd3x5 shared text"))
+
+    store.compact()
+    assert store.index.ntotal == 700
+    assert "d3" not in store.document_ids()
+    assert not d3_rows & set(_vids(store, "wd3x5 shared text"))
+    assert store.search_hybrid("wd3x5", top_k=5, fusion="rrf")
+    assert not d3_rows & {h["vid"] for h in store.search_hybrid("wd3x5", top_k=5)}
+
+    # the remaining chunks keep their ids and texts
+    row = int(store.chunks.document_rows("d4")[7])
+    assert store.chunks.content(row) == "wd4x7 shared text"
+    if kind in ("flat", "hnsw", "ivf_flat"):
+        assert _vids(store, "wd4x7 shared text")[0] == row
+
+    # new chunks after the compaction get new ids and are found
+    ids = store.add_chunks(make_chunks("d3", 10))
+    assert min(ids) >= 800
+    assert _vids(store, "wd3x5 shared text", search_filter=SearchFilter.create(document_ids=["d3"]))[0] == ids[5]
+
+    store.save(tmp_path)
+    loaded = FaissVectorStore.load(tmp_path, embedder=embedder, mmap=False)
+    assert loaded.index.ntotal == 710
+    assert _vids(loaded, "wd3x5 shared text", search_filter=SearchFilter.create(document_ids=["d3"]))[0] == ids[5]
+
+
+def test_hybrid_fusion(make_store):
+    store = _filled_store(make_store, "flat")
+    target = int(store.chunks.document_rows("d5")[17])
+
+    # same text as the chunk: first on both sides
+    for fusion in ("rrf", "weighted"):
+        hits = store.search_hybrid("wd5x17 shared text", top_k=5, fusion=fusion)
+        assert hits[0]["vid"] == target
+        assert hits[0]["dense_score"] == pytest.approx(1.0, abs=1e-5) and hits[0]["sparse_score"] > 0
+        assert [h["score"] for h in hits] == sorted((h["score"] for h in hits), reverse=True)
+    assert store.search_hybrid("wd5x17 shared text", top_k=1)[0]["score"] == pytest.approx(2 / 61)
+
+    # the unique term only matches one chunk in BM25; its dense neighbours are unrelated
+    hits = store.search_hybrid("wd5x17", top_k=10, fusion="rrf")
+    assert target in [h["vid"] for h in hits]
+    assert [h["vid"] for h in hits if h["sparse_score"] is not None] == [target]
+    hits = store.search_hybrid("wd5x17", top_k=3, fusion="weighted", dense_weight=0.0)
+    assert hits[0]["vid"] == target and hits[0]["score"] == pytest.approx(1.0)
+
+    assert store.search_batch(["wd5x17", "wd1x1"], top_k=5, mode="hybrid")[0] == store.search_hybrid("wd5x17", top_k=5)
+    with pytest.raises(ValueError):
+        store.search_hybrid("wd5x17", fusion="max")
+
+
+def test_filters_restrict_dense_and_sparse_search(make_store):
+    store = make_store("flat")
+    store.add_chunks(make_chunks("a", 30))
+    captions = make_chunks("b", 30)
+    for chunk in captions[10:20]:
+        chunk.block_type = "figure_description"
+    store.add_chunks(captions)
+
+    pages = SearchFilter.create(document_ids=["b"], page_from=1, page_to=1)
+    figures = SearchFilter.create(block_types=["figure_description"])
+    allowed_pages = set(store.filter_ids(pages).tolist())
+    assert allowed_pages == set(range(40, 50)) == set(store.filter_ids(figures).tolist())
+
+    for search_filter in (pages, figures):
+        dense = store.search_by_text("wax3 shared text", top_k=20, search_filter=search_filter)
+        assert len(dense) == 10 and {h["vid"] for h in dense} == allowed_pages
+        hybrid = store.search_hybrid("wax3 shared text", top_k=20, search_filter=search_filter)
+        assert {h["vid"] for h in hybrid} <= allowed_pages
+
+    # no match: nothing, not an unfiltered search
+    assert store.search_by_text("wax3", search_filter=SearchFilter.create(document_ids=["c"])) == []
+    # cached filter ids follow deletions
+    store.delete_document("b")
+    assert len(store.filter_ids(pages)) == 0
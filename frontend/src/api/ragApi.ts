@@ -18,12 +18,34 @@ export type QueryResponse = {
 };
 
 export type UploadResponse = {
+  // background ingest job, poll with fetchJob / waitForJob
+  job_id: string;
+  status: IngestJobStatus;
   uploaded_files: number;
   saved_to: string;
   documents: any[]; // backend dicts (we map)
+  // files whose content was already uploaded (not queued again)
+  skipped_duplicates?: Array<{ filename: string; duplicate_of: string }>;
   total_chunks_in_store: number;
 };
 
+export type IngestJobStatus = "queued" | "running" | "finished" | "failed";
+
+export type IngestJob = {
+  job_id: string;
+  status: IngestJobStatus;
+  error: string | null;
+  documents_total: number;
+  documents_done: number;
+  documents_failed: number;
+  progress: Record<string, { done: number; total: number }>;
+  // finished documents: { document_id, filename, num_pages, num_chunks }
+  documents: any[];
+  errors: Array<{ document_id: string; error: string }>;
+};
+
+const JOB_POLL_INTERVAL_MS = 1000;
+
 /**
  * Uploads one or more PDF files to the backend and returns upload metadata.
  */
@@ -42,6 +64,30 @@ export async function uploadPdfs(files: File[], processImages: boolean): Promise
   return res.data as UploadResponse;
 }
 
+/**
+ * Fetches the current state of a background ingest job.
+ */
+export async function fetchJob(jobId: string): Promise<IngestJob> {
+  const res = await apiClient.get(`/rag/jobs/${jobId}`);
+  return res.data as IngestJob;
+}
+
+/**
+ * Polls an ingest job until it is finished or failed and returns its final state.
+ * `onProgress` receives every intermediate state.
+ */
+export async function waitForJob(
+  jobId: string,
+  onProgress?: (job: IngestJob) => void,
+): Promise<IngestJob> {
+  for (;;) {
+    const job = await fetchJob(jobId);
+    if (job.status === "finished" || job.status === "failed") return job;
+    onProgress?.(job);
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+}
+
 /**
  * Normalizes raw backend document objects into the frontend UploadedDocument shape.
  */
@@ -60,8 +106,9 @@ export function mapUploadDocuments(rawDocs: any[]): UploadedDocument[] {
       documentId: String(documentId),
       filename: String(filename),
       uploadedAt: now,
-      pages: typeof d.pages === "number" ? d.pages : undefined,
-      chunkCount: typeof d.chunk_count === "number" ? d.chunk_count : undefined,
+      pages: typeof d.pages === "number" ? d.pages : typeof d.num_pages === "number" ? d.num_pages : undefined,
+      chunkCount:
+        typeof d.chunk_count === "number" ? d.chunk_count : typeof d.num_chunks === "number" ? d.num_chunks : undefined,
     };
   });
 }
@@ -1,6 +1,6 @@
 import { useEffect, useMemo, useState } from "react";
 import type { RagStats, UploadedDocument } from "../../types/rag";
-import { mapUploadDocuments, uploadPdfs } from "../../api/ragApi";
+import { fetchStats, mapUploadDocuments, uploadPdfs, waitForJob } from "../../api/ragApi";
 import { saveJson } from "../../utils/storage";
 
 const UPLOADS_KEY = "rag_uploads_v1";
@@ -19,6 +19,8 @@ export default function UploadCard({ uploads, setUploads, stats, setStats }: Pro
   const [processImages, setProcessImages] = useState(false);
   const [selected, setSelected] = useState<File[]>([]);
   const [isUploading, setIsUploading] = useState(false);
+  // "done/total" documents of the running ingest job, null while not indexing
+  const [indexing, setIndexing] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
 
   // User-friendly label for the current file selection state.
@@ -30,7 +32,7 @@ export default function UploadCard({ uploads, setUploads, stats, setStats }: Pro
 
   /**
    * Uploads selected PDFs to the backend, appends returned documents,
-   * and refreshes aggregate stats shown in the dashboard.
+   * waits for the background ingest job and then refreshes the stats shown in the dashboard.
    */
   async function handleUpload() {
     if (selected.length === 0) return;
@@ -46,19 +48,42 @@ export default function UploadCard({ uploads, setUploads, stats, setStats }: Pro
       const nextUploads = [...uploads, ...newDocs];
       setUploads(nextUploads);
 
-      // Sync global stats after successful upload.
+      // Clear file input state after the files are saved on the backend.
+      setSelected([]);
+
+      // Documents are indexed in the background: poll the job until it is done.
+      setIndexing(`0/${newDocs.length}`);
+      const job = await waitForJob(res.job_id, (j) => setIndexing(`${j.documents_done}/${j.documents_total}`));
+
+      // Fill in pages/chunks of indexed documents and drop the ones that failed.
+      const indexed = new Map(mapUploadDocuments(job.documents).map((d) => [d.documentId, d] as const));
+      const failed = new Set(job.errors.map((e) => e.document_id));
+      setUploads(
+        nextUploads
+          .filter((d) => !failed.has(d.documentId))
+          .map((d) => {
+            const done = indexed.get(d.documentId);
+            return done ? { ...d, pages: done.pages, chunkCount: done.chunkCount } : d;
+          }),
+      );
+      if (job.errors.length > 0) {
+        setError(job.errors.map((e) => `${e.document_id}: ${e.error}`).join("; "));
+      } else if (job.status === "failed") {
+        setError(job.error ?? "Indexing failed");
+      }
+
+      // Sync global stats once the job is done (counts before that are stale).
+      const fresh = await fetchStats();
       setStats({
         ...stats,
-        documentCount: nextUploads.length,
-        chunkCount: res.total_chunks_in_store,
+        documentCount: fresh.documentCount,
+        chunkCount: fresh.chunkCount,
         lastIndexedAt: new Date().toISOString(),
       });
-
-      // Clear file input state after success.
-      setSelected([]);
     } catch (e: any) {
       setError(e?.message ?? "Upload failed");
     } finally {
+      setIndexing(null);
       setIsUploading(false);
     }
   }
@@ -115,7 +140,7 @@ export default function UploadCard({ uploads, setUploads, stats, setStats }: Pro
         disabled={selected.length === 0 || isUploading}
         onClick={handleUpload}
       >
-        {isUploading ? "Uploading..." : "Upload"}
+        {indexing !== null ? `Indexing... (${indexing})` : isUploading ? "Uploading..." : "Upload"}
       </button>
 
       {error && (